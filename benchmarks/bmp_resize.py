@@ -0,0 +1,109 @@
+"""Throughput and quality of the bmp convert resize with and without reduce-on-decode
+
+Run with `python benchmarks/bmp_resize.py`, a synthetic jpeg corpus is generated
+in a temporary directory. PSNR is measured against full decoding with LANCZOS.
+"""
+import argparse
+from pathlib import Path
+import tempfile
+import time
+from typing import *
+
+import numpy as np
+from PIL import Image
+
+from mlstarterpack.vision.images import resize_smaller_side
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--images', type=int, required=False, default=20,
+        help='Number of images in the synthetic corpus',
+    )
+    parser.add_argument(
+        '--source-size', type=int, nargs=2, required=False, default=[4000, 3000],
+        help='Width and height of the source images, 12MP by default',
+    )
+    parser.add_argument(
+        '--target-smaller-size', type=int, required=False, default=224,
+    )
+    parser.add_argument(
+        '--draft-oversampling', type=float, nargs='*', required=False, default=[1.0, 2.0, 4.0],
+        help='Draft oversampling factors to compare',
+    )
+    parser.add_argument(
+        '--reducing-gap', type=float, required=False, default=3.0,
+    )
+    return parser.parse_args()
+
+
+def make_corpus(directory: Path, count: int, size: Tuple[int, int]) -> List[Path]:
+    """Smooth gradients with detail and noise on top, saved as camera-like jpegs"""
+    width, height = size
+    rng = np.random.RandomState(0)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+
+    paths = []
+    for i in range(count):
+        frequencies = rng.uniform(0.002, 0.05, size=3)
+        channels = [
+            127 + 100 * np.sin(x * frequency + i) * np.cos(y * frequency * 0.7)
+            for frequency in frequencies
+        ]
+        pixels = np.stack(channels, axis=-1) + rng.normal(0, 8, size=(height, width, 3))
+        path = directory / f'{i:04d}.jpg'
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def resize_all(
+    paths: List[Path],
+    target_smaller_size: int,
+    **kwargs,
+) -> Tuple[float, List[np.ndarray]]:
+    start_time = time.perf_counter()
+    results = []
+    for path in paths:
+        image = resize_smaller_side(Image.open(path), target_smaller_size, **kwargs)
+        results.append(np.asarray(image.convert('RGB')))
+    return time.perf_counter() - start_time, results
+
+
+def psnr(reference: np.ndarray, image: np.ndarray) -> float:
+    mse = np.mean((reference.astype(np.float64) - image.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255 ** 2 / mse)
+
+
+def main():
+    args = parse_arguments()
+
+    with tempfile.TemporaryDirectory() as directory:
+        print(f'Generating {args.images} images of {args.source_size[0]}x{args.source_size[1]}...')
+        paths = make_corpus(Path(directory), args.images, tuple(args.source_size))
+
+        elapsed, references = resize_all(
+            paths, args.target_smaller_size, draft_oversampling=None, reducing_gap=None,
+        )
+        print(f'full decode + LANCZOS: {len(paths) / elapsed:.1f} images/s')
+
+        variants = [(None, args.reducing_gap)] + [
+            (oversampling, args.reducing_gap) for oversampling in args.draft_oversampling
+        ]
+        for oversampling, reducing_gap in variants:
+            elapsed, results = resize_all(
+                paths, args.target_smaller_size,
+                draft_oversampling=oversampling, reducing_gap=reducing_gap,
+            )
+            mean_psnr = np.mean([
+                psnr(reference, result) for reference, result in zip(references, results)
+            ])
+            print(
+                f'draft oversampling {oversampling}, reducing gap {reducing_gap}: '
+                f'{len(paths) / elapsed:.1f} images/s, PSNR {mean_psnr:.2f} dB'
+            )
+
+
+if __name__ == '__main__':
+    main()
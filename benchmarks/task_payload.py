@@ -0,0 +1,93 @@
+"""Per-item task payload of preloading with a pickled dataset vs a worker-registered one
+
+Run with `python benchmarks/task_payload.py`, tensorflow is not required.
+"""
+import argparse
+from concurrent import futures
+import multiprocessing as mp
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from mlstarterpack.data import IterableDataset, PreloadingIterator
+from mlstarterpack.data._workers import (
+    new_dataset_token, register_pickled_dataset, registered_resolve_func,
+)
+from mlstarterpack.data.preloading import resolve_chunk
+
+
+class LabeledDataset(IterableDataset):
+    """A dataset carrying a label table, like the ones built from ecdata metadata"""
+
+    def __init__(self, rows: int):
+        self.labels = pd.DataFrame({
+            'key': [f'source/objects/{i:08d}.jpg' for i in range(rows)],
+            'label': np.random.randint(0, 1000, size=rows),
+        })
+        self.label_by_index = self.labels['label'].to_numpy()
+
+    def source_iterable(self):
+        return range(len(self.labels))
+
+    def process_source_item(self, item):
+        return item, self.label_by_index[item]
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--rows', type=int, required=False, default=200_000,
+        help='Number of rows in the label table of the dataset',
+    )
+    parser.add_argument(
+        '--items', type=int, required=False, default=2_000,
+        help='Number of items to preload',
+    )
+    parser.add_argument(
+        '--buf-size', type=int, required=False, default=64,
+        help='Preload buffer size',
+    )
+    return parser.parse_args()
+
+
+def task_size(resolve_func) -> int:
+    """Pickled size of a single-item task as submitted by PreloadingIterator"""
+    return len(pickle.dumps((resolve_chunk, resolve_func, [0])))
+
+
+def preload(executor, resolve_func, items: int, buf_size: int) -> float:
+    start_time = time.perf_counter()
+    for _ in PreloadingIterator(range(items), executor, buf_size, resolve_func):
+        pass
+    return time.perf_counter() - start_time
+
+
+def main():
+    args = parse_arguments()
+    mp.set_start_method('spawn')
+    dataset = LabeledDataset(args.rows)
+
+    with futures.ProcessPoolExecutor() as executor:
+        elapsed = preload(executor, dataset.process_source_item, args.items, args.buf_size)
+    print(
+        f'bound method: {task_size(dataset.process_source_item)} bytes per task, '
+        f'{args.items / elapsed:.0f} items/s'
+    )
+
+    token = new_dataset_token()
+    with futures.ProcessPoolExecutor(
+        initializer=register_pickled_dataset,
+        initargs=(token, pickle.dumps(dataset)),
+    ) as executor:
+        resolve_func = registered_resolve_func(token)
+        elapsed = preload(executor, resolve_func, args.items, args.buf_size)
+    print(
+        f'registered: {task_size(resolve_func)} bytes per task, '
+        f'{args.items / elapsed:.0f} items/s'
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,8 @@
+from .cache import cache_dataset, CachedDataset
 from .datasets import IterableDataset, RandomAccessDataset
+from .loader import collate, DataLoader, LoaderBackend, LoaderOptions
+from .pools import named_pool, shutdown_named_pools, WorkerPool
+from .preloading import PreloadingIterator, PreloadOrder
+from .samplers import IndexSampler
+from .shards import ShardedDataset, ShardRecord, ShardWriter
+from .stats import LatencyHistogram, PipelineStats
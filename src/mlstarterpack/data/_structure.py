@@ -0,0 +1,108 @@
+"""Helpers for dataset items made of arrays nested in tuples, lists and dicts"""
+from typing import *
+
+import numpy as np
+
+
+# offsets of arrays packed into shared buffers are aligned for vectorized access
+ARRAY_ALIGNMENT = 64
+
+
+def aligned(offset: int) -> int:
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+
+def map_arrays(value: Any, func: Callable[[Any], Any], array_type: type) -> Any:
+    """Apply func to arrays nested in tuples, lists and dicts"""
+    if isinstance(value, array_type):
+        return func(value)
+    elif isinstance(value, tuple):
+        elements = [map_arrays(element, func, array_type) for element in value]
+        # named tuples are constructed from positional arguments
+        return type(value)(*elements) if hasattr(value, '_fields') else tuple(elements)
+    elif isinstance(value, list):
+        return [map_arrays(element, func, array_type) for element in value]
+    elif isinstance(value, dict):
+        return {key: map_arrays(element, func, array_type) for key, element in value.items()}
+    else:
+        return value
+
+
+def collate(samples: Sequence[Any], out: Any = None) -> Any:
+    """Stack samples into contiguous arrays along a new first axis.
+
+    Tuples, lists and dicts are collated element-wise, numbers and arrays are stacked,
+    other values are collected into lists.
+
+    :param out: arrays of the same structure to write into, with at least len(samples) rows,
+        as allocated by allocate_batch
+    """
+    first = samples[0]
+    if isinstance(first, tuple):
+        elements = [
+            collate([sample[i] for sample in samples], None if out is None else out[i])
+            for i in range(len(first))
+        ]
+        return type(first)(*elements) if hasattr(first, '_fields') else tuple(elements)
+    elif isinstance(first, list):
+        return [
+            collate([sample[i] for sample in samples], None if out is None else out[i])
+            for i in range(len(first))
+        ]
+    elif isinstance(first, dict):
+        return {
+            key: collate([sample[key] for sample in samples], None if out is None else out[key])
+            for key in first
+        }
+    elif isinstance(first, (np.ndarray, np.generic, int, float, bool)):
+        if out is None:
+            return np.stack(samples)
+
+        batch = out[:len(samples)]
+        for i, sample in enumerate(samples):
+            batch[i] = sample
+        return batch
+    else:
+        return list(samples)
+
+
+def allocate_batch(sample: Any, batch_size: int) -> Any:
+    """Allocate collate output arrays for batches of samples shaped like this one"""
+    if isinstance(sample, tuple):
+        return tuple(allocate_batch(element, batch_size) for element in sample)
+    elif isinstance(sample, list):
+        return [allocate_batch(element, batch_size) for element in sample]
+    elif isinstance(sample, dict):
+        return {key: allocate_batch(element, batch_size) for key, element in sample.items()}
+    elif isinstance(sample, (np.ndarray, np.generic, int, float, bool)):
+        array = np.asarray(sample)
+        return np.empty((batch_size,) + array.shape, dtype=array.dtype)
+    else:
+        return None
+
+
+def unbatch(batch_value: Any) -> List[Any]:
+    """Split a collated batch of tuples, lists, dicts and arrays back into items"""
+    if isinstance(batch_value, tuple):
+        columns = [unbatch(element) for element in batch_value]
+        if hasattr(batch_value, '_fields'):
+            return [type(batch_value)(*row) for row in zip(*columns)]
+        return [tuple(row) for row in zip(*columns)]
+    elif _is_collated_list(batch_value):
+        columns = [unbatch(element) for element in batch_value]
+        return [list(row) for row in zip(*columns)]
+    elif isinstance(batch_value, dict):
+        keys = list(batch_value)
+        columns = [unbatch(batch_value[key]) for key in keys]
+        return [dict(zip(keys, row)) for row in zip(*columns)]
+    else:
+        return list(batch_value)
+
+
+def _is_collated_list(batch_value: Any) -> bool:
+    # collate returns lists both for list items and for values it can't stack,
+    # only the former are lists of collated columns
+    return (
+        isinstance(batch_value, list) and bool(batch_value)
+        and all(isinstance(element, (np.ndarray, tuple, list, dict)) for element in batch_value)
+    )
@@ -0,0 +1,81 @@
+"""Registry of datasets installed in executor worker processes
+
+Pools pickle registered datasets into a directory of their own, named by a short token.
+Tasks refer to a dataset by its token instead of carrying the pickled dataset,
+a worker loads it from the directory on its first task for it.
+Workers forget datasets whose files were removed once they load another one.
+"""
+import functools
+from pathlib import Path
+import pickle
+import uuid
+from typing import *
+
+
+_DATASETS: Dict[str, Any] = {}
+# dataset directories of the pools the current process is a worker of
+_DATASET_DIRS: List[Path] = []
+# token -> file of a dataset loaded from a dataset directory
+_LOADED_PATHS: Dict[str, Path] = {}
+
+
+def new_dataset_token() -> str:
+    return uuid.uuid4().hex
+
+
+def dataset_path(directory: Path, token: str) -> Path:
+    return directory / f'{token}.pickle'
+
+
+def register_dataset(token: str, dataset: Any):
+    """Make the dataset available to registered_resolve_func in the current process"""
+    _DATASETS[token] = dataset
+
+
+def add_dataset_dir(directory: Path):
+    """Pool initializer, datasets of the directory are loaded when they are first used"""
+    _DATASET_DIRS.append(Path(directory))
+
+
+def registered_resolve_func(token: str) -> Callable[[Any], Any]:
+    """A picklable resolve function calling process_source_item of a registered dataset"""
+    return functools.partial(_process_source_item, token)
+
+
+def registered_getitem_func(token: str) -> Callable[[Any], Any]:
+    """A picklable function indexing a registered random access dataset"""
+    return functools.partial(_getitem, token)
+
+
+def _registered_dataset(token: str) -> Any:
+    if token in _DATASETS:
+        return _DATASETS[token]
+
+    for directory in _DATASET_DIRS:
+        path = dataset_path(directory, token)
+        try:
+            pickled_dataset = path.read_bytes()
+        except FileNotFoundError:
+            continue
+
+        _forget_unregistered()
+        register_dataset(token, pickle.loads(pickled_dataset))
+        _LOADED_PATHS[token] = path
+        return _DATASETS[token]
+
+    raise RuntimeError(f'Dataset {token} is not registered in this process')
+
+
+def _forget_unregistered():
+    for token, path in list(_LOADED_PATHS.items()):
+        if not path.exists():
+            del _LOADED_PATHS[token]
+            del _DATASETS[token]
+
+
+def _process_source_item(token: str, item: Any) -> Any:
+    return _registered_dataset(token).process_source_item(item)
+
+
+def _getitem(token: str, index: Any) -> Any:
+    return _registered_dataset(token)[index]
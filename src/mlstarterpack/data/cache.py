@@ -0,0 +1,443 @@
+"""Caching of processed dataset items in memory and on disk
+
+Items are looked up in an in-memory LRU first, then in an on-disk slab: a memory-mapped
+uint8 `.npy` file holding the arrays of cached items back to back, with an index of
+item key -> array offsets saved next to it. Disk entries are valid for a single
+preprocessing version, opening a cache with a different version discards them.
+
+A slab is append-only, items are no longer added to it once it's full.
+Every process using a cache directory, like the workers of a DataLoader, appends to
+a slab of its own of the configured size and reads the slabs of the others,
+see DiskTier. Entries of other
+processes are seen once they save their index, which workers do periodically.
+The memory tier is per process.
+"""
+import atexit
+from collections import OrderedDict
+import hashlib
+import itertools
+import os
+from pathlib import Path
+import pickle
+import threading
+import time
+from typing import *
+import weakref
+
+import numpy as np
+
+from ._structure import aligned, map_arrays
+from .datasets import IterableDataset, RandomAccessDataset
+
+
+SLAB_FILENAME = 'slab.npy'
+INDEX_FILENAME = 'index.pickle'
+LOCK_FILENAME = 'lock'
+# how often new entries of a process are made visible to the others
+SAVE_INTERVAL = 10.0
+# how often a process looks for new entries of the others on a miss
+REFRESH_INTERVAL = 1.0
+# rough memory overhead of an entry besides its arrays
+ENTRY_OVERHEAD_BYTES = 256
+
+
+class SlabArray(NamedTuple):
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+def item_key(item: Any) -> bytes:
+    return hashlib.blake2b(pickle.dumps(item), digest_size=16).digest()
+
+
+def _arrays_nbytes(value: Any) -> int:
+    arrays: List[np.ndarray] = []
+    map_arrays(value, arrays.append, np.ndarray)
+    return sum(array.nbytes for array in arrays)
+
+
+class MemoryCache:
+    """LRU of processed items bounded by the total size of their arrays"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: 'OrderedDict[bytes, Tuple[Any, int]]' = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: bytes) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: bytes, value: Any):
+        size = _arrays_nbytes(value) + ENTRY_OVERHEAD_BYTES
+        if size > self.max_bytes:
+            return
+
+        # cached values are shared by all readers, the caller keeps its own writable value
+        frozen = map_arrays(value, _frozen_copy, np.ndarray)
+
+        if key in self._entries:
+            self.current_bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (frozen, size)
+        self.current_bytes += size
+
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_size
+
+
+def _frozen_copy(array: np.ndarray) -> np.ndarray:
+    array = array.copy()
+    array.setflags(write=False)
+    return array
+
+
+class DiskCache:
+    """Processed items in a memory-mapped slab, see the module docstring"""
+
+    def __init__(self, path: Path, max_bytes: int, version: str, writable: bool = True):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.version = version
+        self.writable = writable
+
+        # key -> item structure with arrays replaced by SlabArray
+        self._index: Dict[bytes, Any] = {}
+        self._end_offset = 0
+        self._dirty = False
+        self._slab = self._open()
+
+    def __len__(self):
+        return len(self._index)
+
+    def _open(self) -> Optional[np.ndarray]:
+        slab_path = self.path / SLAB_FILENAME
+        index_path = self.path / INDEX_FILENAME
+
+        if slab_path.exists() and index_path.exists():
+            with open(str(index_path), 'rb') as infile:
+                saved = pickle.load(infile)
+            slab = np.load(str(slab_path), mmap_mode='r+' if self.writable else 'r')
+            if saved['version'] == self.version and len(slab) == self.max_bytes:
+                self._index = saved['index']
+                self._end_offset = saved['end_offset']
+                return slab
+            del slab
+
+        if not self.writable:
+            return None
+
+        os.makedirs(str(self.path), exist_ok=True)
+        if index_path.exists():
+            os.remove(str(index_path))
+        return np.lib.format.open_memmap(
+            str(slab_path), mode='w+', dtype=np.uint8, shape=(self.max_bytes,),
+        )
+
+    def get(self, key: bytes) -> Optional[Any]:
+        packed = self._index.get(key)
+        slab = self._slab
+        if packed is None or slab is None:
+            return None
+
+        return map_arrays(
+            packed,
+            lambda ref: slab[ref.offset:ref.offset + _nbytes(ref)]
+            .view(np.dtype(ref.dtype)).reshape(ref.shape).copy(),
+            SlabArray,
+        )
+
+    def put(self, key: bytes, value: Any) -> bool:
+        """Append an item to the slab, unless it's full.
+
+        :returns: whether the item was added
+        """
+        if not self.writable or self._slab is None or key in self._index:
+            return False
+
+        offset = self._end_offset
+        arrays: List[Tuple[int, np.ndarray]] = []
+
+        def place(array: np.ndarray) -> SlabArray:
+            nonlocal offset
+            offset = aligned(offset)
+            arrays.append((offset, array))
+            ref = SlabArray(offset, array.shape, array.dtype.str)
+            offset += array.nbytes
+            return ref
+
+        packed = map_arrays(value, place, np.ndarray)
+        if offset > self.max_bytes:
+            return False
+
+        for array_offset, array in arrays:
+            data = np.ascontiguousarray(array).reshape(-1).view(np.uint8)
+            self._slab[array_offset:array_offset + len(data)] = data
+
+        self._index[key] = packed
+        self._end_offset = offset
+        self._dirty = True
+        return True
+
+    def save(self):
+        """Flush the slab and write the index, entries added since the last save are
+        lost if the process exits without saving"""
+        if not self._dirty or self._slab is None:
+            return
+
+        self._slab.flush()
+        index_path = self.path / INDEX_FILENAME
+        tmp_path = index_path.with_name(index_path.name + '.tmp')
+        with open(str(tmp_path), 'wb') as outfile:
+            pickle.dump({
+                'version': self.version,
+                'end_offset': self._end_offset,
+                'index': self._index,
+            }, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(str(tmp_path), str(index_path))
+        self._dirty = False
+
+
+def _nbytes(ref: SlabArray) -> int:
+    return int(np.prod(ref.shape, dtype=np.int64)) * np.dtype(ref.dtype).itemsize
+
+
+class DiskTier:
+    """Slabs of all processes using a cache directory.
+
+    The directory holds numbered slab directories, a process appends to the first one
+    it can lock and reads all the others. Without fcntl locks only the process that
+    created the cache appends, to the first slab.
+    """
+
+    def __init__(self, path: Path, max_bytes: int, version: str, owner: bool = True):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.version = version
+        os.makedirs(str(self.path), exist_ok=True)
+
+        self.own_slab: Optional[DiskCache] = None
+        claim = _claim_slab(self.path, owner)
+        if claim is not None:
+            lock_fd, slab_path = claim
+            weakref.finalize(self, os.close, lock_fd)
+            self.own_slab = DiskCache(slab_path, max_bytes, version)
+            atexit.register(_save_at_exit, weakref.ref(self.own_slab))
+
+        # slab directory -> (mtime of its index when loaded, its cache)
+        self._other_slabs: Dict[Path, Tuple[int, DiskCache]] = {}
+        self._refresh_time = 0.0
+        self._save_time = time.monotonic()
+        self._refresh()
+
+    def get(self, key: bytes) -> Optional[Any]:
+        value = None if self.own_slab is None else self.own_slab.get(key)
+        if value is None:
+            value = self._get_other(key)
+        if value is None and time.monotonic() - self._refresh_time >= REFRESH_INTERVAL:
+            if self._refresh():
+                value = self._get_other(key)
+        return value
+
+    def put(self, key: bytes, value: Any, save_periodically: bool = False):
+        """
+        :param save_periodically: save the index of the own slab every SAVE_INTERVAL
+            seconds, so that other processes see the new entries
+        """
+        if self.own_slab is None:
+            return
+
+        self.own_slab.put(key, value)
+        if save_periodically and time.monotonic() - self._save_time >= SAVE_INTERVAL:
+            self.save()
+
+    def save(self):
+        self._save_time = time.monotonic()
+        if self.own_slab is not None:
+            self.own_slab.save()
+
+    def _get_other(self, key: bytes) -> Optional[Any]:
+        for _, cache in self._other_slabs.values():
+            value = cache.get(key)
+            if value is not None:
+                return value
+        return None
+
+    def _refresh(self) -> bool:
+        """Load the indexes of other slabs saved since they were last loaded
+
+        :returns: whether anything was loaded
+        """
+        self._refresh_time = time.monotonic()
+        loaded = False
+        for slab_path in self.path.glob('slab-*'):
+            if self.own_slab is not None and slab_path == self.own_slab.path:
+                continue
+            try:
+                mtime_ns = (slab_path / INDEX_FILENAME).stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+            entry = self._other_slabs.get(slab_path)
+            if entry is not None and entry[0] == mtime_ns:
+                continue
+
+            try:
+                cache = DiskCache(slab_path, self.max_bytes, self.version, writable=False)
+            except (OSError, EOFError, pickle.UnpicklingError, ValueError):
+                # replaced or truncated while being read, retried on a later refresh
+                continue
+            self._other_slabs[slab_path] = (mtime_ns, cache)
+            loaded = True
+        return loaded
+
+
+def _claim_slab(path: Path, owner: bool) -> Optional[Tuple[int, Path]]:
+    """Lock the first unlocked slab directory of a cache for the current process
+
+    :returns: the lock file descriptor, kept open while the slab is in use,
+        and the slab directory, None if the process doesn't append to the cache
+    """
+    try:
+        import fcntl  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        fcntl = None  # type: ignore
+
+    for i in itertools.count():
+        slab_path = path / f'slab-{i}'
+        os.makedirs(str(slab_path), exist_ok=True)
+        lock_fd = os.open(str(slab_path / LOCK_FILENAME), os.O_RDWR | os.O_CREAT)
+        if fcntl is None:
+            if owner:
+                return lock_fd, slab_path
+            os.close(lock_fd)
+            return None
+
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(lock_fd)
+            continue
+        return lock_fd, slab_path
+    return None
+
+
+def _save_at_exit(slab_ref: 'weakref.ReferenceType[DiskCache]'):
+    slab = slab_ref()
+    if slab is not None:
+        slab.save()
+
+
+class CachedDataset(IterableDataset):
+    """A dataset caching process_source_item results of another dataset.
+
+    Items are cached by their source item, so preprocessing must be deterministic,
+    and version must be changed whenever it changes.
+    Cached arrays returned from memory are read-only and shared between readers.
+    """
+
+    def __init__(
+        self,
+        dataset: IterableDataset,
+        version: str,
+        memory_bytes: int = 2 ** 30,
+        disk_path: Optional[Path] = None,
+        disk_bytes: Optional[int] = None,
+    ):
+        """
+        :param version: version of the preprocessing
+        :param memory_bytes: size limit of the in-memory tier of each process
+        :param disk_path: directory of the on-disk tier, None to cache in memory only
+        :param disk_bytes: size of the on-disk slab of each process, required with
+            disk_path. Every process using the cache, including each DataLoader worker,
+            allocates a slab of its own, so the tier takes up to disk_bytes times
+            the number of processes on disk
+        """
+        if disk_path is not None and disk_bytes is None:
+            raise ValueError('disk_bytes is required with disk_path')
+
+        self.dataset = dataset
+        self.version = version
+        self.memory_bytes = memory_bytes
+        self.disk_path = None if disk_path is None else Path(disk_path)
+        self.disk_bytes = disk_bytes
+
+        self._owner_pid = os.getpid()
+        self._init_tiers()
+
+    def _init_tiers(self):
+        self._lock = threading.Lock()
+        self.memory_cache = MemoryCache(self.memory_bytes)
+        self.disk_cache: Optional[DiskTier] = None
+        if self.disk_path is not None:
+            self.disk_cache = DiskTier(
+                self.disk_path, self.disk_bytes, self.version,
+                owner=os.getpid() == self._owner_pid,
+            )
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in ['_lock', 'memory_cache', 'disk_cache']:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_tiers()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.save()
+
+    def source_iterable(self) -> Iterable[Any]:
+        return self.dataset.source_iterable()
+
+    def process_source_item(self, item: Any) -> Any:
+        key = item_key(item)
+        with self._lock:
+            value = self.memory_cache.get(key)
+            if value is None and self.disk_cache is not None:
+                value = self.disk_cache.get(key)
+                if value is not None:
+                    self.memory_cache.put(key, value)
+        if value is not None:
+            return value
+
+        value = self.dataset.process_source_item(item)
+        with self._lock:
+            self.memory_cache.put(key, value)
+            if self.disk_cache is not None:
+                # the owner saves explicitly, workers can't be asked to
+                self.disk_cache.put(
+                    key, value, save_periodically=os.getpid() != self._owner_pid,
+                )
+        return value
+
+    def save(self):
+        """Persist the on-disk tier index"""
+        if self.disk_cache is not None:
+            with self._lock:
+                self.disk_cache.save()
+
+
+class CachedRandomAccessDataset(CachedDataset, RandomAccessDataset):
+    @property
+    def source_sequence(self) -> Sequence[Any]:
+        return self.dataset.source_sequence  # type: ignore
+
+
+def cache_dataset(dataset: IterableDataset, version: str, **kwargs) -> CachedDataset:
+    """Wrap a dataset into a cached dataset of the same kind, see CachedDataset"""
+    if isinstance(dataset, RandomAccessDataset):
+        return CachedRandomAccessDataset(dataset, version, **kwargs)
+    else:
+        return CachedDataset(dataset, version, **kwargs)
@@ -1,11 +1,47 @@
 import abc
+import functools
+import time
 from typing import *
 
+from .stats import PipelineStats
+from .transforms import (
+    apply_item_transforms, batch_stream, FILTERED, interleave_stream, ItemTransform,
+    map_batches_stream, shuffle_stream, take_stream, transform_stream,
+)
+
+
+# stream transforms applied to processed items by the consumer, see split_stream
+StreamFunc = Callable[[Iterable[Any]], Iterable[Any]]
+
 
 class IterableDataset(abc.ABC):
     def __iter__(self):
-        for item in self.source_iterable():
-            yield self.process_source_item(item)
+        return self.iterate()
+
+    def iterate(self, stats: Optional[PipelineStats] = None) -> Iterator[Any]:
+        """Iterate over processed items in the calling thread, optionally collecting timings"""
+        if stats is None:
+            for item in self.source_iterable():
+                result = self.process_source_item(item)
+                if result is not FILTERED:
+                    yield result
+            return
+
+        source_iterator = iter(self.source_iterable())
+        while True:
+            start_time = time.perf_counter()
+            try:
+                item = next(source_iterator)
+            except StopIteration:
+                return
+
+            process_start_time = time.perf_counter()
+            stats.record_source(process_start_time - start_time, 1)
+            result = self.process_source_item(item)
+            stats.record_processed([time.perf_counter() - process_start_time])
+            if result is not FILTERED:
+                stats.record_delivered(1)
+                yield result
 
     @abc.abstractmethod
     def source_iterable(self) -> Iterable[Any]:
@@ -14,6 +50,56 @@ class IterableDataset(abc.ABC):
     def process_source_item(self, item: Any) -> Any:
         return item
 
+    def split_stream(self) -> Tuple['IterableDataset', Optional[StreamFunc]]:
+        """Split the dataset for preloading: a dataset whose items workers process
+        and the stream transforms applied to the processed items afterwards, if any.
+
+        Per-item transforms before a stream transform thus still run in parallel.
+        """
+        return self, None
+
+    # Transforms, see data.transforms
+
+    def map(self, func: Callable[[Any], Any]) -> 'IterableDataset':
+        return self._transformed(map_items, func)
+
+    def filter(self, predicate: Callable[[Any], bool]) -> 'IterableDataset':
+        return self._transformed(filter_items, predicate)
+
+    def batch(self, batch_size: int, drop_last: bool = False) -> 'IterableDataset':
+        """Collate items into batches of contiguous arrays, see data.collate"""
+        return self._transformed(batch, batch_size, drop_last)
+
+    def map_batches(self, func: Callable[[Any], Any], batch_size: int) -> 'IterableDataset':
+        """Apply a vectorized function to collated batches of items, yielding items again"""
+        return self._transformed(map_batches, func, batch_size)
+
+    def shuffle_buffer(self, buffer_size: int, seed: Optional[int] = None) -> 'IterableDataset':
+        """Shuffle items through a buffer of buffer_size items, differently in each epoch.
+
+        :param seed: seed of the shuffling, each epoch is still shuffled differently
+        """
+        return self._transformed(shuffle_buffer, buffer_size, seed)
+
+    def interleave(
+        self,
+        func: Callable[[Any], Iterable[Any]],
+        cycle_length: int,
+        block_length: int = 1,
+    ) -> 'IterableDataset':
+        """Map each item to an iterable, ex. a dataset, and interleave the results.
+
+        Items of cycle_length iterables are yielded in turns, block_length at a time.
+        """
+        return self._transformed(interleave, func, cycle_length, block_length)
+
+    def take(self, count: int) -> 'IterableDataset':
+        return self._transformed(take, count)
+
+    def _transformed(self, transform: Callable[..., 'IterableDataset'], *args) -> 'IterableDataset':
+        """Apply a transform function of this module, subclasses may wrap the result"""
+        return transform(self, *args)
+
 
 class RandomAccessDataset(IterableDataset, abc.ABC):
     def __getitem__(self, item):
@@ -29,3 +115,152 @@ class RandomAccessDataset(IterableDataset, abc.ABC):
 
     def source_iterable(self) -> Iterable[Any]:
         return self.source_sequence
+
+
+class ItemTransformedDataset(IterableDataset):
+    """A dataset with per-item transforms fused into its process_source_item"""
+
+    def __init__(self, parent: IterableDataset, transforms: Sequence[ItemTransform]):
+        self.parent = parent
+        self.transforms = tuple(transforms)
+
+    def source_iterable(self) -> Iterable[Any]:
+        return self.parent.source_iterable()
+
+    def process_source_item(self, item: Any) -> Any:
+        return apply_item_transforms(self.parent.process_source_item(item), self.transforms)
+
+    def split_stream(self) -> Tuple[IterableDataset, Optional[StreamFunc]]:
+        head, stream = self.parent.split_stream()
+        if stream is None:
+            return self, None
+        return head, _then(stream, functools.partial(transform_stream, self.transforms))
+
+
+class ItemTransformedRandomAccessDataset(ItemTransformedDataset, RandomAccessDataset):
+    """Maps of a random access dataset keep it random access"""
+
+    @property
+    def source_sequence(self) -> Sequence[Any]:
+        return self.parent.source_sequence  # type: ignore
+
+
+class _StreamTransformedDataset(IterableDataset, abc.ABC):
+    def __init__(self, parent: IterableDataset, stream_func: Callable, *args):
+        self.parent = parent
+        self.stream_func = stream_func
+        self.args = args
+        self._epoch = 0
+
+    def _stream(self, items: Iterable[Any]) -> Iterable[Any]:
+        self._epoch += 1
+        return self.stream_func(items, self._epoch, *self.args)
+
+
+class SourceStreamDataset(_StreamTransformedDataset):
+    """A dataset with a stream transform applied to the source items of another dataset"""
+
+    def source_iterable(self) -> Iterable[Any]:
+        return self._stream(self.parent.source_iterable())
+
+    def process_source_item(self, item: Any) -> Any:
+        return self.parent.process_source_item(item)
+
+    def split_stream(self) -> Tuple[IterableDataset, Optional[StreamFunc]]:
+        head, stream = self.parent.split_stream()
+        if stream is None:
+            return self, None
+        # the source items of the parent are the output of its stream
+        return head, _then(stream, self._stream)
+
+
+class StreamDataset(_StreamTransformedDataset):
+    """A dataset with a stream transform applied to the processed items of another dataset"""
+
+    def source_iterable(self) -> Iterable[Any]:
+        return self._stream(self.parent.iterate())
+
+    def split_stream(self) -> Tuple[IterableDataset, Optional[StreamFunc]]:
+        head, stream = self.parent.split_stream()
+        return head, _then(stream, self._stream)
+
+
+def _then(first: Optional[StreamFunc], second: StreamFunc) -> StreamFunc:
+    if first is None:
+        return second
+    return lambda items: second(first(items))
+
+
+def _split_item_transforms(
+    dataset: IterableDataset,
+) -> Tuple[IterableDataset, Tuple[ItemTransform, ...]]:
+    if isinstance(dataset, ItemTransformedDataset):
+        return dataset.parent, dataset.transforms
+    return dataset, ()
+
+
+def _with_item_transforms(
+    dataset: IterableDataset,
+    transforms: Sequence[ItemTransform],
+) -> IterableDataset:
+    if not transforms:
+        return dataset
+
+    random_access = (
+        isinstance(dataset, RandomAccessDataset)
+        and not any(transform.is_filter for transform in transforms)
+    )
+    if random_access:
+        return ItemTransformedRandomAccessDataset(dataset, transforms)
+    return ItemTransformedDataset(dataset, transforms)
+
+
+def map_items(dataset: IterableDataset, func: Callable[[Any], Any]) -> IterableDataset:
+    parent, transforms = _split_item_transforms(dataset)
+    return _with_item_transforms(parent, transforms + (ItemTransform(func, False),))
+
+
+def filter_items(dataset: IterableDataset, predicate: Callable[[Any], bool]) -> IterableDataset:
+    parent, transforms = _split_item_transforms(dataset)
+    return _with_item_transforms(parent, transforms + (ItemTransform(predicate, True),))
+
+
+def batch(dataset: IterableDataset, batch_size: int, drop_last: bool = False) -> IterableDataset:
+    return StreamDataset(dataset, batch_stream, batch_size, drop_last)
+
+
+def map_batches(
+    dataset: IterableDataset,
+    func: Callable[[Any], Any],
+    batch_size: int,
+) -> IterableDataset:
+    return StreamDataset(dataset, map_batches_stream, func, batch_size)
+
+
+def shuffle_buffer(
+    dataset: IterableDataset,
+    buffer_size: int,
+    seed: Optional[int] = None,
+) -> IterableDataset:
+    # per-item transforms don't depend on the order, source items are shuffled instead
+    parent, transforms = _split_item_transforms(dataset)
+    return _with_item_transforms(
+        SourceStreamDataset(parent, shuffle_stream, buffer_size, seed), transforms,
+    )
+
+
+def interleave(
+    dataset: IterableDataset,
+    func: Callable[[Any], Iterable[Any]],
+    cycle_length: int,
+    block_length: int = 1,
+) -> IterableDataset:
+    return StreamDataset(dataset, interleave_stream, func, cycle_length, block_length)
+
+
+def take(dataset: IterableDataset, count: int) -> IterableDataset:
+    parent, transforms = _split_item_transforms(dataset)
+    if not any(transform.is_filter for transform in transforms):
+        # maps are one to one, the first items of the source are processed into the first items
+        return _with_item_transforms(SourceStreamDataset(parent, take_stream, count), transforms)
+    return StreamDataset(dataset, take_stream, count)
@@ -0,0 +1,234 @@
+"""Parallel loading of datasets into batches of NumPy arrays, without tensorflow"""
+from concurrent import futures
+import enum
+import functools
+import itertools
+from typing import *
+
+from ._structure import allocate_batch, collate
+from ._workers import registered_getitem_func, registered_resolve_func
+from .datasets import FILTERED, IterableDataset, RandomAccessDataset, StreamFunc
+from .pools import WorkerPool
+from .preloading import PreloadingIterator, PreloadOrder
+from .stats import PipelineStats
+
+
+class LoaderBackend(enum.Enum):
+    thread = 'thread'
+    process = 'process'
+
+    def __str__(self):
+        return self.value
+
+
+def _fetch_batch(fetch: Callable[[Any], Any], items: List[Any]) -> List[Any]:
+    # filtered samples make batches smaller, batch the dataset itself for even batches
+    return [sample for sample in map(fetch, items) if sample is not FILTERED]
+
+
+def _batches(iterable: Iterable[Any], batch_size: int, drop_last: bool) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+        if not batch or (drop_last and len(batch) < batch_size):
+            return
+        yield batch
+
+
+class LoaderOptions(NamedTuple):
+    """How a DataLoader batches and loads samples
+
+    batch_size: samples per collated batch, None to yield samples one by one
+    backend: workers loading the samples, see LoaderBackend
+    max_workers: number of workers, by default the executor default
+    prefetch: number of batches, or samples without batching, loaded ahead
+    drop_last: skip the last batch if it's incomplete
+    order: order of the batches, see PreloadOrder
+    output_buffers: number of preallocated batch buffers collated into in rotation,
+        a batch is overwritten once as many batches are loaded after it.
+        0 allocates new arrays for every batch.
+    start_method: multiprocessing start method of the process backend workers
+    pool: worker pool of the process backend to use instead of starting one
+    """
+    batch_size: Optional[int] = None
+    backend: LoaderBackend = LoaderBackend.thread
+    max_workers: Optional[int] = None
+    prefetch: int = 2
+    drop_last: bool = False
+    order: PreloadOrder = PreloadOrder.ordered
+    output_buffers: int = 0
+    start_method: str = 'spawn'
+    pool: Optional[WorkerPool] = None
+
+
+class _Workers(NamedTuple):
+    executor: futures.Executor
+    # the dataset whose items the workers process and the stream transforms after it,
+    # see IterableDataset.split_stream
+    dataset: IterableDataset
+    stream: Optional[StreamFunc]
+    fetch: Callable[[Any], Any]
+    # token of the dataset in the worker pool of the process backend
+    token: Optional[str]
+
+
+class DataLoader:
+    """Load samples of a dataset on a pool of threads or processes.
+
+    Random access datasets are loaded by index, workers fetch dataset[index] themselves.
+    Other iterable datasets are iterated in the calling thread
+    and their source items are processed by the workers. Stream transforms of a dataset,
+    like IterableDataset.batch, run in the calling thread on the processed items.
+
+    With the process backend, the dataset is pickled once when the pool is started,
+    changes made to the dataset afterwards are not seen by the workers.
+    The pool is reused between iterations until the loader is closed.
+    """
+
+    def __init__(
+        self,
+        dataset: IterableDataset,
+        options: LoaderOptions = LoaderOptions(),
+        sampler: Optional[Iterable[int]] = None,
+        stats: Optional[PipelineStats] = None,
+    ):
+        """
+        :param options: batching and workers of the loader, see LoaderOptions
+        :param sampler: indices of a random access dataset to load, ex. an IndexSampler,
+            all indices in order by default
+        :param stats: collects timings of the loader, with batching its items are batches
+        """
+        if options.output_buffers and options.batch_size is None:
+            raise ValueError('Output buffers require a batch_size')
+        if sampler is not None and not isinstance(dataset, RandomAccessDataset):
+            raise ValueError('Samplers require a random access dataset')
+
+        self.dataset = dataset
+        self.options = options
+        self.sampler = sampler
+        self.stats = stats
+
+        self._workers: Optional[_Workers] = None
+        self._buffers: List[Any] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        """Number of batches, or samples without batching, of a random access dataset"""
+        if not isinstance(self.dataset, RandomAccessDataset):
+            raise TypeError('Only loaders of random access datasets have a length')
+
+        if self.sampler is not None:
+            sample_count = len(self.sampler)  # type: ignore
+        else:
+            sample_count = len(self.dataset)
+        batch_size = self.options.batch_size
+        if batch_size is None:
+            return sample_count
+        elif self.options.drop_last:
+            return sample_count // batch_size
+        else:
+            return -(-sample_count // batch_size)
+
+    def __iter__(self) -> Iterator[Any]:
+        workers = self._start()
+        options = self.options
+
+        if self.sampler is not None:
+            source: Iterable[Any] = self.sampler
+        elif isinstance(workers.dataset, RandomAccessDataset):
+            source = range(len(workers.dataset))
+        else:
+            source = workers.dataset.source_iterable()
+
+        if options.batch_size is None or workers.stream is not None:
+            # the stream transforms of the dataset work on single samples
+            preloader = PreloadingIterator(
+                source, workers.executor, options.prefetch, workers.fetch,
+                order=options.order, chunk_size=None, stats=self.stats,
+            )
+        else:
+            preloader = PreloadingIterator(
+                _batches(source, options.batch_size, options.drop_last),
+                workers.executor, options.prefetch,
+                functools.partial(_fetch_batch, workers.fetch),
+                order=options.order, stats=self.stats,
+            )
+
+        try:
+            samples = preloader if workers.stream is None else workers.stream(preloader)
+            if options.batch_size is None:
+                yield from samples
+                return
+
+            if workers.stream is not None:
+                batches: Iterable[List[Any]] = _batches(
+                    samples, options.batch_size, options.drop_last,
+                )
+            else:
+                batches = preloader
+            for i, batch_samples in enumerate(batches):
+                if batch_samples:
+                    yield collate(batch_samples, self._output_buffer(i, batch_samples[0]))
+        finally:
+            preloader.close()
+
+    def close(self):
+        """Shut down the workers, waiting for running tasks to finish.
+
+        A pool passed to the loader is left running.
+        """
+        if self._workers is None:
+            return
+
+        workers = self._workers
+        self._workers = None
+        if workers.executor is self.options.pool:
+            self.options.pool.unregister_dataset(workers.token)
+        else:
+            workers.executor.shutdown(wait=True)
+
+    def _start(self) -> _Workers:
+        if self._workers is not None:
+            return self._workers
+
+        options = self.options
+        dataset, stream = self.dataset.split_stream()
+        random_access = isinstance(dataset, RandomAccessDataset)
+        fetch: Callable[[Any], Any]
+        if options.backend is LoaderBackend.thread:
+            if isinstance(dataset, RandomAccessDataset):
+                fetch = dataset.__getitem__
+            else:
+                fetch = dataset.process_source_item
+            executor = futures.ThreadPoolExecutor(options.max_workers)
+            self._workers = _Workers(executor, dataset, stream, fetch, None)
+        elif options.backend is LoaderBackend.process:
+            pool = options.pool or WorkerPool(options.max_workers,
+                                              start_method=options.start_method)
+            token = pool.register_dataset(dataset)
+            if random_access:
+                fetch = registered_getitem_func(token)
+            else:
+                fetch = registered_resolve_func(token)
+            self._workers = _Workers(pool, dataset, stream, fetch, token)
+        else:
+            raise RuntimeError()
+
+        return self._workers
+
+    def _output_buffer(self, batch_index: int, sample: Any) -> Any:
+        output_buffers = self.options.output_buffers
+        if not output_buffers:
+            return None
+
+        if not self._buffers:
+            self._buffers = [
+                allocate_batch(sample, cast(int, self.options.batch_size))
+                for _ in range(output_buffers)
+            ]
+        return self._buffers[batch_index % output_buffers]
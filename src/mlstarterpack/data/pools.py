@@ -0,0 +1,236 @@
+"""Process pools for dataset preprocessing with explicit configuration and lifecycle"""
+from concurrent import futures
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing as mp
+import os
+from pathlib import Path
+import pickle
+import shutil
+import tempfile
+import threading
+from typing import *
+import warnings
+import weakref
+
+from ._workers import add_dataset_dir, dataset_path, new_dataset_token
+
+
+T = TypeVar('T')  # pylint: disable=invalid-name
+
+
+def _init_worker(
+    cpu_affinity: Optional[List[int]],
+    dataset_dir: Path,
+    initializer: Optional[Callable],
+    initargs: tuple,
+):
+    if cpu_affinity is not None and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpu_affinity)
+    add_dataset_dir(dataset_dir)
+    if initializer is not None:
+        initializer(*initargs)
+
+
+class WorkerPool(futures.Executor):
+    """A process pool that restarts itself when a worker crashes.
+
+    Tasks that fail because the pool broke are resubmitted to the restarted pool
+    up to max_task_retries times. Datasets registered with the pool are pickled into
+    a temporary directory of the pool, workers load them on first use, see data._workers.
+    The pool is started lazily and shut down on exit from a with block.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        start_method: str = 'spawn',
+        cpu_affinity: Optional[Iterable[int]] = None,
+        initializer: Optional[Callable] = None,
+        initargs: tuple = (),
+        max_task_retries: int = 1,
+        name: Optional[str] = None,
+    ):
+        """
+        :param start_method: multiprocessing start method of the workers
+        :param cpu_affinity: CPUs the workers are restricted to, where supported
+        :param initializer: called with initargs in every worker after it starts
+        """
+        self.max_workers = max_workers
+        self.start_method = start_method
+        self.cpu_affinity = None if cpu_affinity is None else list(cpu_affinity)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_task_retries = max_task_retries
+        self.name = name
+        self.restart_count = 0
+
+        self._context = mp.get_context(start_method)
+        self._dataset_dir = Path(tempfile.mkdtemp(prefix='mlstarterpack-pool-'))
+        weakref.finalize(self, shutil.rmtree, str(self._dataset_dir), True)
+        self._executor: Optional[futures.ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def __repr__(self):
+        return (
+            f'{type(self).__name__}(name={self.name!r}, max_workers={self.max_workers}, '
+            f'start_method={self.start_method!r})'
+        )
+
+    def register_dataset(self, dataset: Any) -> str:
+        """Make a dataset available to the workers, as it is now, see data._workers.
+
+        :returns: the token of the dataset
+        """
+        token = new_dataset_token()
+        path = dataset_path(self._dataset_dir, token)
+        tmp_path = path.with_name(f'.{path.name}.tmp')
+        tmp_path.write_bytes(pickle.dumps(dataset))
+        os.replace(str(tmp_path), str(path))
+        return token
+
+    def unregister_dataset(self, token: str):
+        """Remove a dataset, workers drop it once they load another one"""
+        try:
+            os.remove(str(dataset_path(self._dataset_dir, token)))
+        except FileNotFoundError:
+            pass
+
+    def submit(  # pylint: disable=arguments-differ
+        self, __fn: Callable[..., T], *args: Any, **kwargs: Any,
+    ) -> 'futures.Future[T]':
+        result: futures.Future = futures.Future()
+        self._submit_attempt(result, self.max_task_retries, __fn, args, kwargs)
+        return result
+
+    def healthy(self) -> bool:
+        """Whether the pool can run tasks without a restart"""
+        with self._lock:
+            return self._executor is not None and not _is_broken(self._executor)
+
+    def restart(self):
+        """Replace the workers, running tasks are allowed to finish"""
+        with self._lock:
+            executor = self._take_executor()
+            self.restart_count += 1
+        _shutdown_executor(executor)
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        """
+        :param cancel_futures: cancel tasks that haven't started, requires python 3.9
+        """
+        with self._lock:
+            self._shutdown = True
+            executor = self._take_executor()
+        _shutdown_executor(executor, wait, cancel_futures)
+        shutil.rmtree(str(self._dataset_dir), ignore_errors=True)
+
+    def _submit_attempt(self, result: futures.Future, retries: int, fn, args, kwargs):
+        executor = self._get_executor()
+        try:
+            inner = executor.submit(fn, *args, **kwargs)
+        except BrokenProcessPool:
+            self._restart_broken(executor)
+            executor = self._get_executor()
+            inner = executor.submit(fn, *args, **kwargs)
+
+        def done(inner_future: futures.Future):
+            if result.cancelled():
+                return
+            elif inner_future.cancelled():
+                result.cancel()
+                return
+
+            exc = inner_future.exception()
+            if isinstance(exc, BrokenProcessPool) and retries > 0 and not self._shutdown:
+                self._restart_broken(executor)
+                self._submit_attempt(result, retries - 1, fn, args, kwargs)
+            elif exc is not None:
+                result.set_exception(exc)
+            else:
+                result.set_result(inner_future.result())
+
+        # cancelling the returned future cancels the task if it hasn't started
+        result.add_done_callback(lambda _: inner.cancel() if result.cancelled() else None)
+        inner.add_done_callback(done)
+
+    def _get_executor(self) -> futures.ProcessPoolExecutor:
+        broken_executor = None
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError(f'{self!r} is shut down')
+
+            if self._executor is not None and _is_broken(self._executor):
+                warnings.warn(f'{self!r}: a worker terminated abruptly, restarting the pool')
+                broken_executor = self._take_executor()
+                self.restart_count += 1
+
+            if self._executor is None:
+                self._executor = futures.ProcessPoolExecutor(
+                    self.max_workers,
+                    mp_context=self._context,
+                    initializer=_init_worker,
+                    initargs=(
+                        self.cpu_affinity, self._dataset_dir, self.initializer, self.initargs,
+                    ),
+                )
+            executor = self._executor
+
+        _shutdown_executor(broken_executor, wait=False)
+        return executor
+
+    def _restart_broken(self, executor: futures.ProcessPoolExecutor):
+        with self._lock:
+            # tasks of a broken executor fail together, it's replaced only once
+            if self._executor is not executor:
+                return
+            warnings.warn(f'{self!r}: a worker terminated abruptly, restarting the pool')
+            self._take_executor()
+            self.restart_count += 1
+        _shutdown_executor(executor, wait=False)
+
+    def _take_executor(self) -> Optional[futures.ProcessPoolExecutor]:
+        # executors are shut down outside of the lock, their callbacks may need it
+        executor = self._executor
+        self._executor = None
+        return executor
+
+
+def _shutdown_executor(
+    executor: Optional[futures.ProcessPoolExecutor],
+    wait: bool = True,
+    cancel_futures: bool = False,
+):
+    if executor is None:
+        return
+    elif cancel_futures:
+        executor.shutdown(wait=wait, cancel_futures=True)
+    else:
+        executor.shutdown(wait=wait)
+
+
+def _is_broken(executor: futures.ProcessPoolExecutor) -> bool:
+    return bool(getattr(executor, '_broken', False))
+
+
+_NAMED_POOLS: Dict[str, WorkerPool] = {}
+_NAMED_POOLS_LOCK = threading.Lock()
+
+
+def named_pool(name: str, **kwargs) -> WorkerPool:
+    """A pool shared by name within the process, created with kwargs on first use"""
+    with _NAMED_POOLS_LOCK:
+        pool = _NAMED_POOLS.get(name)
+        if pool is None:
+            pool = WorkerPool(name=name, **kwargs)
+            _NAMED_POOLS[name] = pool
+        return pool
+
+
+def shutdown_named_pools(wait: bool = True):
+    with _NAMED_POOLS_LOCK:
+        pools = list(_NAMED_POOLS.values())
+        _NAMED_POOLS.clear()
+
+    for pool in pools:
+        pool.shutdown(wait)
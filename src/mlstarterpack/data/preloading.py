@@ -0,0 +1,211 @@
+from collections import deque
+from concurrent import futures
+import enum
+import time
+from typing import *
+
+from .datasets import FILTERED
+from .stats import PipelineStats
+
+if TYPE_CHECKING:
+    from .shared_memory import SharedMemoryTransport
+
+
+# Adaptive chunking aims for tasks taking about this long to resolve,
+# long enough for the per-task IPC overhead to be negligible
+TARGET_CHUNK_SECONDS = 0.05
+MAX_CHUNK_SIZE = 1024
+
+
+class PreloadOrder(enum.Enum):
+    # results are returned in the order of the source iterable
+    ordered = enum.auto()
+    # results are returned as soon as they are ready
+    unordered = enum.auto()
+    # the source iterable is split into consecutive windows of reorder_window items,
+    # windows are returned in order and items within a window as soon as they are ready
+    windowed = enum.auto()
+
+
+def resolve_chunk(resolve_func: Callable, items: List[Any]) -> Tuple[List[Any], List[float]]:
+    """Resolve a chunk of items, returning the results and the time each one took"""
+    results = []
+    item_seconds = []
+    for item in items:
+        start_time = time.perf_counter()
+        results.append(resolve_func(item))
+        item_seconds.append(time.perf_counter() - start_time)
+    return results, item_seconds
+
+
+class PreloadingIterator:
+    def __init__(
+        self,
+        iterable: Iterable,
+        executor: futures.Executor,
+        buf_size: int,
+        resolve_func: Callable,
+        order: PreloadOrder = PreloadOrder.ordered,
+        reorder_window: Optional[int] = None,
+        chunk_size: Optional[int] = 1,
+        transport: Optional['SharedMemoryTransport'] = None,
+        stats: Optional[PipelineStats] = None,
+    ):
+        """Iterate over resolve_func results, keeping up to buf_size items in flight.
+
+        :param order: how results are ordered, items that take long to resolve
+            stall the whole iterator in ordered mode
+        :param reorder_window: window size of the windowed order
+        :param chunk_size: number of items submitted to the executor as a single task,
+            None to adapt it to the observed time it takes to resolve an item.
+            Chunks never exceed buf_size or cross windows, adaptive chunks are
+            at most half of buf_size so that at least two are in flight
+        :param transport: transfers resolved arrays through shared memory
+            instead of pickling them, see data.shared_memory
+        :param stats: collects timings of the pipeline, see data.stats
+        """
+        self.inner_iterator = iter(iterable)
+        self.executor = executor
+        self.resolve_func = resolve_func
+        self.buf_size = buf_size
+        self.order = order
+        self.transport = transport
+        self.stats = stats
+
+        if buf_size < 1:
+            raise ValueError('buf_size must be positive')
+        if order is PreloadOrder.windowed and (not reorder_window or reorder_window < 1):
+            raise ValueError('Windowed order requires a positive reorder_window')
+        self._window = reorder_window or 1
+
+        self._adaptive_chunking = chunk_size is None
+        self.chunk_size = chunk_size or 1
+        self._item_seconds: Optional[float] = None
+
+        self._exhausted = False
+        self._submitted_count = 0
+        self._in_flight_count = 0
+        # (index of the first item, item count, future of the chunk)
+        self._future_buffer: Deque[Tuple[int, int, futures.Future]] = deque()
+        self._ready_results: Deque[Any] = deque()
+        self._fill_buffer()
+
+    def _next_chunk_size(self) -> int:
+        chunk_size = min(self.chunk_size, self.buf_size - self._in_flight_count)
+        if self.order is PreloadOrder.windowed:
+            # a chunk is returned with the window of its first item
+            chunk_size = min(chunk_size, self._window - self._submitted_count % self._window)
+        return chunk_size
+
+    def _fill_buffer(self):
+        while not self._exhausted and self._in_flight_count < self.buf_size:
+            self._enqueue_one()
+
+    def _enqueue_one(self):
+        start_time = time.perf_counter()
+        chunk_size = self._next_chunk_size()
+        items = []
+        for item in self.inner_iterator:
+            items.append(item)
+            if len(items) >= chunk_size:
+                break
+        else:
+            self._exhausted = True
+        if self.stats is not None:
+            self.stats.record_source(time.perf_counter() - start_time, len(items))
+
+        if not items:
+            return
+
+        if self.transport is not None:
+            future = self.transport.submit(self.executor, self.resolve_func, items)
+        else:
+            future = self.executor.submit(resolve_chunk, self.resolve_func, items)
+
+        self._future_buffer.append((self._submitted_count, len(items), future))
+        self._submitted_count += len(items)
+        self._in_flight_count += len(items)
+
+    def _candidates(self) -> List[Tuple[int, int, futures.Future]]:
+        if self.order is PreloadOrder.ordered:
+            return [self._future_buffer[0]]
+        elif self.order is PreloadOrder.unordered:
+            return list(self._future_buffer)
+
+        current_window = self._future_buffer[0][0] // self._window
+        candidates = []
+        for entry in self._future_buffer:
+            if entry[0] // self._window != current_window:
+                break
+            candidates.append(entry)
+        return candidates
+
+    def _pop_ready(self) -> Tuple[int, futures.Future]:
+        candidates = self._candidates()
+        if len(candidates) > 1 and not any(future.done() for _, _, future in candidates):
+            futures.wait(
+                [future for _, _, future in candidates],
+                return_when=futures.FIRST_COMPLETED,
+            )
+
+        # the oldest ready chunk, or the oldest chunk if only one can be returned
+        entry = next(
+            (candidate for candidate in candidates if candidate[2].done()),
+            candidates[0],
+        )
+        self._future_buffer.remove(entry)
+        return entry[1], entry[2]
+
+    def _update_chunk_size(self, item_count: int, elapsed: float):
+        item_seconds = elapsed / item_count
+        if self._item_seconds is None:
+            self._item_seconds = item_seconds
+        else:
+            self._item_seconds = 0.8 * self._item_seconds + 0.2 * item_seconds
+
+        self.chunk_size = int(min(
+            max(TARGET_CHUNK_SECONDS / max(self._item_seconds, 1e-9), 1),
+            MAX_CHUNK_SIZE,
+            max(self.buf_size // 2, 1),
+        ))
+
+    def __next__(self):
+        while not self._ready_results:
+            if not self._future_buffer:
+                raise StopIteration()
+
+            in_flight_count = self._in_flight_count
+            wait_start_time = time.perf_counter()
+            item_count, future = self._pop_ready()
+            self._in_flight_count -= item_count
+            if self.transport is not None:
+                results, item_seconds = self.transport.unpack(future)
+            else:
+                results, item_seconds = future.result()
+            ready_results = [result for result in results if result is not FILTERED]
+            self._ready_results.extend(ready_results)
+
+            if self.stats is not None:
+                self.stats.record_wait(
+                    time.perf_counter() - wait_start_time, in_flight_count, self.buf_size,
+                )
+                self.stats.record_processed(item_seconds)
+                self.stats.record_delivered(len(ready_results))
+            if self._adaptive_chunking:
+                self._update_chunk_size(item_count, sum(item_seconds))
+            self._fill_buffer()
+
+        return self._ready_results.popleft()
+
+    def __iter__(self):
+        return self
+
+    def close(self):
+        """Stop preloading, cancelling tasks that haven't started yet"""
+        self._exhausted = True
+        for _, _, future in self._future_buffer:
+            future.cancel()
+            if self.transport is not None:
+                self.transport.discard(future)
+        self._future_buffer.clear()
+        self._ready_results.clear()
@@ -0,0 +1,140 @@
+"""Index orders for random access datasets: per-epoch shuffling and sharding across ranks"""
+import itertools
+from typing import *
+
+import numpy as np
+
+
+FEISTEL_ROUNDS = 4
+# positions of a rank permuted at once
+PERMUTATION_CHUNK_SIZE = 4096
+
+
+class IndexPermutation:
+    """A seeded bijection of range(size), evaluated per index without materializing it.
+
+    A Feistel network permutes the smallest range of an even power of two covering size,
+    results outside of size are passed through the network again until they fall in.
+    """
+
+    def __init__(self, size: int, rng: np.random.Generator):
+        half_bits = max(1, (int(size - 1).bit_length() + 1) // 2)
+        self.size = size
+        self._half_bits = np.uint64(half_bits)
+        self._mask = np.uint64((1 << half_bits) - 1)
+        self._keys = rng.integers(0, 2 ** 63, FEISTEL_ROUNDS, dtype=np.uint64)
+
+    def __call__(self, positions: np.ndarray) -> np.ndarray:
+        indices = self._encrypt(np.asarray(positions, dtype=np.uint64))
+        outside = indices >= self.size
+        while outside.any():
+            indices[outside] = self._encrypt(indices[outside])
+            outside = indices >= self.size
+        return indices.astype(np.int64)
+
+    def _encrypt(self, values: np.ndarray) -> np.ndarray:
+        left = values >> self._half_bits
+        right = values & self._mask
+        for key in self._keys:
+            left, right = right, left ^ (_mix(right + key) & self._mask)
+        return (left << self._half_bits) | right
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer, uint64 arithmetic wraps around
+    values = values * np.uint64(0x9E3779B97F4A7C15)
+    values ^= values >> np.uint64(30)
+    values *= np.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> np.uint64(27)
+    values *= np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+class IndexSampler:
+    """Indices of a dataset for one rank of data-parallel training.
+
+    Every epoch is a seeded permutation of the indices, the same on all ranks,
+    which is then dealt out to ranks round-robin so that ranks get disjoint subsets.
+    Indices are generated lazily: without block shuffling a rank computes only its own
+    indices with an IndexPermutation, with block shuffling only the permutation
+    of block order and of a single block are kept in memory.
+    """
+
+    def __init__(
+        self,
+        size: int,
+        shuffle: bool = True,
+        seed: int = 0,
+        block_size: Optional[int] = None,
+        rank: int = 0,
+        world_size: int = 1,
+        drop_last: bool = False,
+    ):
+        """
+        :param size: number of samples in the dataset
+        :param block_size: shuffle the order of contiguous blocks of this many samples
+            and samples within each block, instead of all samples at once,
+            so that reads stay mostly sequential
+        :param drop_last: drop the tail of an epoch so that it's evenly divisible among ranks,
+            otherwise the epoch is padded by repeating it from its start
+        """
+        if not 0 <= rank < world_size:
+            raise ValueError(f'Rank {rank} is out of range for world size {world_size}')
+        if block_size is not None and block_size < 1:
+            raise ValueError('Block size must be positive')
+
+        self.size = size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.block_size = block_size
+        self.rank = rank
+        self.world_size = world_size
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def set_epoch(self, epoch: int):
+        """Select the permutation of an epoch, must be called the same way on all ranks"""
+        self.epoch = epoch
+
+    @property
+    def total_size(self) -> int:
+        """Number of indices in an epoch across all ranks"""
+        if self.drop_last:
+            return self.size // self.world_size * self.world_size
+        else:
+            return -(-self.size // self.world_size) * self.world_size
+
+    def __len__(self):
+        return self.total_size // self.world_size
+
+    def __iter__(self) -> Iterator[int]:
+        if not self.size:
+            return iter(())
+        if self.shuffle and self.block_size is None:
+            return self._permuted_indices()
+
+        # padding wraps around to the start of the same order, as many times as needed
+        epoch_order = itertools.chain.from_iterable(
+            self._epoch_order() for _ in itertools.count()
+        )
+        return itertools.islice(epoch_order, self.rank, self.total_size, self.world_size)
+
+    def _permuted_indices(self) -> Iterator[int]:
+        permutation = IndexPermutation(self.size, np.random.default_rng([self.seed, self.epoch]))
+        positions = range(self.rank, self.total_size, self.world_size)
+        for start in range(0, len(positions), PERMUTATION_CHUNK_SIZE):
+            chunk = np.asarray(positions[start:start + PERMUTATION_CHUNK_SIZE]) % self.size
+            yield from permutation(chunk).tolist()
+
+    def _epoch_order(self) -> Iterator[int]:
+        if not self.shuffle:
+            yield from range(self.size)
+            return
+
+        rng = np.random.default_rng([self.seed, self.epoch])
+        block_size = self.block_size or self.size
+        block_count = -(-self.size // block_size)
+        for block in rng.permutation(block_count).tolist():
+            start = block * block_size
+            stop = min(start + block_size, self.size)
+            yield from (start + rng.permutation(stop - start)).tolist()
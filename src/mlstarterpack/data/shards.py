@@ -0,0 +1,245 @@
+"""Packed shard record format for reading many small objects sequentially
+
+A shard directory contains:
+- shard-00000.bin, shard-00001.bin, ...: object contents stored back to back
+- index.parquet: one row per record with key, shard, offset and size columns,
+    followed by metadata columns stored along with the records
+
+The index is written last, a directory without it is an incomplete shard set.
+ShardWriter writes into a temporary directory renamed once the index is written.
+"""
+import contextlib
+import mmap
+import os
+from pathlib import Path
+import random
+import shutil
+from typing import *
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .datasets import RandomAccessDataset
+
+
+INDEX_FILENAME = 'index.parquet'
+RECORD_COLUMNS = ['key', 'shard', 'offset', 'size']
+
+
+def shard_filename(shard: int) -> str:
+    return f'shard-{shard:05d}.bin'
+
+
+class ShardRecord(NamedTuple):
+    key: str
+    data: bytes
+    metadata: Dict[str, Any]
+
+
+class ShardWriter:
+    """Packs records into shards of about shard_size bytes.
+
+    The shards appear at path only once closed, a writer left by an exception
+    removes what it has written.
+    """
+
+    def __init__(self, path: Path, shard_size: int = 2 ** 30):
+        self.path = Path(path)
+        self.shard_size = shard_size
+
+        if self.path.exists():
+            raise FileExistsError(f'{self.path} already exists')
+        # left by a writer that was killed
+        shutil.rmtree(str(self._tmp_path), ignore_errors=True)
+        os.makedirs(str(self._tmp_path))
+        self._rows: List[Dict[str, Any]] = []
+        self._shard = -1
+        # holds the open shard file
+        self._shard_files = contextlib.ExitStack()
+        self._shard_file: Optional[BinaryIO] = None
+        self._offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def _tmp_path(self) -> Path:
+        return self.path.with_name(f'.{self.path.name}.tmp')
+
+    def add(self, key: str, data: bytes, metadata: Optional[Dict[str, Any]] = None):
+        shard_file = self._shard_file
+        shard_full = self._offset and self._offset + len(data) > self.shard_size
+        if shard_file is None or shard_full:
+            shard_file = self._next_shard()
+
+        shard_file.write(data)
+        row = {'key': key, 'shard': self._shard, 'offset': self._offset, 'size': len(data)}
+        row.update(metadata or {})
+        self._rows.append(row)
+        self._offset += len(data)
+
+    def close(self):
+        """Finish the last shard, write the index and move the shards to path"""
+        self._shard_files.close()
+        self._shard_file = None
+
+        index_df = pd.DataFrame(self._rows)
+        if index_df.empty:
+            index_df = pd.DataFrame(columns=RECORD_COLUMNS)
+        pq.write_table(
+            pa.Table.from_pandas(index_df, preserve_index=False),
+            str(self._tmp_path / INDEX_FILENAME),
+        )
+        os.rename(str(self._tmp_path), str(self.path))
+
+    def abort(self):
+        """Discard the records written so far"""
+        self._shard_files.close()
+        self._shard_file = None
+        shutil.rmtree(str(self._tmp_path), ignore_errors=True)
+
+    def _next_shard(self) -> BinaryIO:
+        # closes the previous shard
+        self._shard_files.close()
+
+        self._shard += 1
+        self._offset = 0
+        self._shard_file = self._shard_files.enter_context(
+            open(str(self._tmp_path / shard_filename(self._shard)), 'wb')
+        )
+        return self._shard_file
+
+
+class ShardedDataset(RandomAccessDataset):
+    """Records of a shard directory as ShardRecord items.
+
+    Iteration reads shards one by one in file order, which keeps reads sequential,
+    shards can be shuffled and split between ranks of data-parallel training.
+    Indexing reads single records through the index.
+    Shards are memory-mapped lazily in each process using the dataset,
+    with the kernel advised to read them ahead sequentially.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        shuffle_shards: bool = False,
+        seed: Optional[int] = None,
+        rank: int = 0,
+        world_size: int = 1,
+    ):
+        """
+        :param shuffle_shards: iterate over shards in a different order every epoch,
+            combine with shuffle_buffer to mix records of different shards
+        :param rank: iterate over shards rank, rank + world_size, ...
+        """
+        if not 0 <= rank < world_size:
+            raise ValueError(f'Rank {rank} is out of range for world size {world_size}')
+
+        self.path = Path(path)
+        self.shuffle_shards = shuffle_shards
+        self.seed = seed
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+
+        self.index_df = pd.read_parquet(str(self.path / INDEX_FILENAME))
+        self.metadata_columns = [
+            column for column in self.index_df.columns if column not in RECORD_COLUMNS
+        ]
+        # plain arrays are much faster to index per record than the frame
+        self._keys = self.index_df['key'].to_numpy()
+        self._shards = self.index_df['shard'].to_numpy()
+        self._offsets = self.index_df['offset'].to_numpy()
+        self._sizes = self.index_df['size'].to_numpy()
+        self._metadata = {
+            column: self.index_df[column].to_numpy() for column in self.metadata_columns
+        }
+        self._maps: Dict[int, mmap.mmap] = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_maps'] = {}
+        return state
+
+    @property
+    def source_sequence(self) -> Sequence[int]:
+        return range(len(self.index_df))
+
+    @property
+    def shard_count(self) -> int:
+        return int(self.index_df['shard'].max()) + 1 if len(self.index_df) else 0
+
+    def set_epoch(self, epoch: int):
+        self.epoch = epoch
+
+    def sampler(self) -> 'ShardOrderSampler':
+        """Indices in shard order for loaders of random access datasets"""
+        return ShardOrderSampler(self)
+
+    def shards(self) -> List[int]:
+        """Shards read by this rank in the current epoch, in order"""
+        shards = list(range(self.shard_count))
+        if self.shuffle_shards:
+            seed = None if self.seed is None else f'{self.seed}:{self.epoch}'
+            random.Random(seed).shuffle(shards)
+        return shards[self.rank::self.world_size]
+
+    def source_iterable(self) -> Iterable[int]:
+        shard_starts = self._shard_starts()
+        for shard in self.shards():
+            yield from range(shard_starts[shard], shard_starts[shard + 1])
+
+    def process_source_item(self, item: int) -> ShardRecord:
+        offset = int(self._offsets[item])
+        size = int(self._sizes[item])
+        # empty files can't be mapped
+        data = self._map(int(self._shards[item]))[offset:offset + size] if size else b''
+        return ShardRecord(
+            key=self._keys[item],
+            data=data,
+            metadata={column: values[item] for column, values in self._metadata.items()},
+        )
+
+    def _shard_starts(self) -> List[int]:
+        # records are written in shard and offset order
+        return self._shards.searchsorted(list(range(self.shard_count + 1))).tolist()
+
+    def _map(self, shard: int) -> mmap.mmap:
+        """Map a shard in the process reading it, only called for records with data"""
+        shard_map = self._maps.get(shard)
+        if shard_map is None:
+            with open(str(self.path / shard_filename(shard)), 'rb') as infile:
+                shard_map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+            # the advice applies to the mapping, so it's given by the process reading records
+            if hasattr(shard_map, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                shard_map.madvise(mmap.MADV_SEQUENTIAL)
+            self._maps[shard] = shard_map
+        return shard_map
+
+
+class ShardOrderSampler:
+    """Record indices of a sharded dataset in the order of its iteration"""
+
+    def __init__(self, dataset: ShardedDataset):
+        self.dataset = dataset
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.dataset.source_iterable())
+
+    def __len__(self):
+        shard_starts = self.dataset._shard_starts()  # pylint: disable=protected-access
+        return sum(
+            shard_starts[shard + 1] - shard_starts[shard]
+            for shard in self.dataset.shards()
+        )
@@ -0,0 +1,261 @@
+"""Zero-copy transport of NumPy arrays from executor workers through shared memory
+
+The consumer owns a pool of shared memory slots and assigns a slot to each submitted item.
+Workers write the arrays of a resolved item into its slot and return only their
+descriptors, the consumer wraps them as NumPy views over the slot without copying.
+A slot is recycled once all arrays viewing it are garbage collected,
+so results must not be kept around longer than necessary.
+
+Items that don't fit into a slot, or are submitted while all slots are in use,
+are transferred by pickling as usual.
+
+Workers keep the blocks of a transport attached until they see a block of another
+transport, blocks of closed transports are detached then.
+
+Shared memory requires python 3.8 or newer, SHARED_MEMORY_AVAILABLE is False on older
+versions and results of loaders asked to use it are pickled instead.
+"""
+from collections import deque
+from concurrent import futures
+import threading
+import time
+from typing import *
+import weakref
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None  # type: ignore
+
+import numpy as np
+
+from ._structure import aligned, map_arrays
+
+
+SHARED_MEMORY_AVAILABLE = shared_memory is not None
+
+
+class SharedArray(NamedTuple):
+    offset: int
+    shape: Tuple[int, ...]
+    dtype: str
+
+
+class SlotInfo(NamedTuple):
+    transport_id: str
+    slot: int
+    name: str
+    size: int
+
+
+# shared memory blocks attached by the current worker process, by transport id and name
+_ATTACHED_BLOCKS: Dict[str, Dict[str, 'shared_memory.SharedMemory']] = {}
+
+
+def _attach(slot: SlotInfo) -> 'shared_memory.SharedMemory':
+    blocks = _ATTACHED_BLOCKS.get(slot.transport_id)
+    if blocks is None:
+        _detach_closed_transports()
+        blocks = {}
+    block = blocks.get(slot.name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=slot.name)
+        blocks[slot.name] = block
+        _ATTACHED_BLOCKS[slot.transport_id] = blocks
+    return block
+
+
+def _block_exists(name: str) -> bool:
+    # names of closed transports are unlinked, attached blocks stay mapped regardless
+    try:
+        probe = shared_memory.SharedMemory(name=name)
+    except FileNotFoundError:
+        return False
+    probe.close()
+    return True
+
+
+def _detach_closed_transports():
+    for transport_id, blocks in list(_ATTACHED_BLOCKS.items()):
+        if _block_exists(next(iter(blocks))):
+            continue
+
+        for block in blocks.values():
+            try:
+                block.close()
+            except BufferError:
+                pass
+        del _ATTACHED_BLOCKS[transport_id]
+
+
+def _pack(result: Any, slot: Optional[SlotInfo]) -> Tuple[bool, Any]:
+    """Write the arrays of a result into the slot.
+
+    :returns: whether the slot was used, and the result with arrays replaced by descriptors
+    """
+    if slot is None:
+        return False, result
+
+    arrays: List[np.ndarray] = []
+    map_arrays(result, arrays.append, np.ndarray)
+    total_size = 0
+    for array in arrays:
+        total_size = aligned(total_size) + array.nbytes
+    if not arrays or total_size > slot.size:
+        return False, result
+
+    buffer = _attach(slot).buf
+    offset = 0
+
+    def write(array: np.ndarray) -> SharedArray:
+        nonlocal offset
+        offset = aligned(offset)
+        view = np.ndarray(array.shape, array.dtype, buffer=buffer, offset=offset)
+        view[...] = array
+        descriptor = SharedArray(offset, array.shape, array.dtype.str)
+        offset += array.nbytes
+        return descriptor
+
+    return True, map_arrays(result, write, np.ndarray)
+
+
+def resolve_chunk_shared(
+    resolve_func: Callable,
+    items: List[Any],
+    slots: List[Optional[SlotInfo]],
+) -> Tuple[List[Tuple[bool, Any]], List[float]]:
+    """Resolve a chunk of items, writing their arrays into the assigned slots"""
+    results = []
+    item_seconds = []
+    for item, slot in zip(items, slots):
+        start_time = time.perf_counter()
+        results.append(_pack(resolve_func(item), slot))
+        item_seconds.append(time.perf_counter() - start_time)
+    return results, item_seconds
+
+
+class SharedMemoryTransport:
+    def __init__(self, slot_count: int, slot_size: int):
+        """
+        :param slot_count: number of slots, should exceed the number of items in flight
+            plus the number of results held by the consumer at once
+        :param slot_size: size of a slot in bytes, the total size of the arrays of an item
+        """
+        if not SHARED_MEMORY_AVAILABLE:
+            raise RuntimeError('Shared memory requires python 3.8 or newer')
+
+        self.slot_size = slot_size
+        self._blocks = [
+            shared_memory.SharedMemory(create=True, size=slot_size)
+            for _ in range(slot_count)
+        ]
+        self._free_slots: Deque[int] = deque(range(slot_count))
+        self._view_counts = [0] * slot_count
+        self._lock = threading.Lock()
+        self._slots_by_future: Dict[futures.Future, List[Optional[SlotInfo]]] = {}
+        self._closed = False
+
+    @property
+    def id(self) -> str:
+        """Identifies the transport in the workers, the random name of its first block"""
+        return self._blocks[0].name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def submit(
+        self,
+        executor: futures.Executor,
+        resolve_func: Callable,
+        items: List[Any],
+    ) -> futures.Future:
+        slots = [self._acquire() for _ in items]
+        future = executor.submit(resolve_chunk_shared, resolve_func, items, slots)
+        self._slots_by_future[future] = slots
+        return future
+
+    def unpack(self, future: futures.Future) -> Tuple[List[Any], List[float]]:
+        """Wait for a submitted chunk, the counterpart of resolve_chunk"""
+        slots = self._slots_by_future.pop(future)
+        try:
+            packed_results, item_seconds = future.result()
+        except BaseException:
+            for slot in slots:
+                if slot is not None:
+                    self._release(slot.slot)
+            raise
+
+        results = []
+        for slot, (used_slot, packed_result) in zip(slots, packed_results):
+            if slot is None:
+                results.append(packed_result)
+            elif not used_slot:
+                self._release(slot.slot)
+                results.append(packed_result)
+            else:
+                results.append(self._wrap(slot, packed_result))
+        return results, item_seconds
+
+    def discard(self, future: futures.Future):
+        """Forget a submitted chunk, its slots are recycled once the worker is done with them"""
+        slots = self._slots_by_future.pop(future)
+
+        def release(_):
+            for slot in slots:
+                if slot is not None:
+                    self._release(slot.slot)
+
+        future.add_done_callback(release)
+
+    def close(self):
+        """Free the shared memory, views that are still alive keep their blocks mapped"""
+        if self._closed:
+            return
+        self._closed = True
+
+        for block in self._blocks:
+            try:
+                block.close()
+            except BufferError:
+                pass
+            block.unlink()
+
+    def _acquire(self) -> Optional[SlotInfo]:
+        with self._lock:
+            if not self._free_slots:
+                return None
+            index = self._free_slots.popleft()
+
+        return SlotInfo(self.id, index, self._blocks[index].name, self.slot_size)
+
+    def _release(self, index: int):
+        with self._lock:
+            self._free_slots.append(index)
+
+    def _release_view(self, index: int):
+        with self._lock:
+            self._view_counts[index] -= 1
+            if self._view_counts[index] == 0:
+                self._free_slots.append(index)
+
+    def _wrap(self, slot: SlotInfo, packed_result: Any) -> Any:
+        buffer = self._blocks[slot.slot].buf
+        views: List[np.ndarray] = []
+
+        def view(descriptor: SharedArray) -> np.ndarray:
+            array = np.ndarray(
+                descriptor.shape, np.dtype(descriptor.dtype),
+                buffer=buffer, offset=descriptor.offset,
+            )
+            views.append(array)
+            return array
+
+        result = map_arrays(packed_result, view, SharedArray)
+        with self._lock:
+            self._view_counts[slot.slot] = len(views)
+        for array in views:
+            weakref.finalize(array, self._release_view, slot.slot)
+        return result
@@ -0,0 +1,174 @@
+"""Timing statistics of input pipelines
+
+Stats are collected by PreloadingIterator and the loaders built on it when given
+a PipelineStats instance. Processing latencies are measured in the workers
+and sent back along with the results, the rest is measured by the consumer.
+"""
+import json
+import threading
+import time
+from typing import *
+
+
+# bucket i counts latencies below 2 ** i microseconds
+HISTOGRAM_BUCKETS = 32
+
+
+class LatencyHistogram:
+    """Latency counts in power of two buckets, from 1us to about an hour"""
+
+    def __init__(self):
+        self.counts = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def add(self, seconds: float):
+        bucket = min(int(seconds * 1e6).bit_length(), HISTOGRAM_BUCKETS - 1)
+        self.counts[bucket] += 1
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Approximate quantile in seconds, interpolated within its bucket"""
+        if not self.count:
+            return 0.0
+
+        threshold = q * self.count
+        cumulative = 0
+        for bucket, bucket_count in enumerate(self.counts):
+            if bucket_count and cumulative + bucket_count >= threshold:
+                lower = 2 ** (bucket - 1) if bucket else 0
+                fraction = (threshold - cumulative) / bucket_count
+                return min((lower + fraction * (2 ** bucket - lower)) / 1e6, self.max_seconds)
+            cumulative += bucket_count
+        return self.max_seconds
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'mean': self.total_seconds / self.count if self.count else 0.0,
+            'p50': self.quantile(0.5),
+            'p90': self.quantile(0.9),
+            'p99': self.quantile(0.99),
+            'max': self.max_seconds,
+            # upper bucket bound in microseconds -> count
+            'buckets': {
+                str(2 ** bucket): bucket_count
+                for bucket, bucket_count in enumerate(self.counts)
+                if bucket_count
+            },
+        }
+
+
+class PipelineStats:
+    """Thread-safe collector of input pipeline timings.
+
+    - source: time spent pulling items from the source iterable
+    - process: per-item processing latency measured in the workers
+    - wait: time the consumer waited for results
+    - occupancy: items in flight relative to the number the preloader aims to keep
+      in flight, sampled before every wait
+    """
+
+    def __init__(self, name: str = 'pipeline', log_interval: Optional[float] = None):
+        """
+        :param log_interval: print a snapshot at most every this many seconds
+        """
+        self.name = name
+        self.log_interval = log_interval
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.start_time: Optional[float] = None
+            self.source_seconds = 0.0
+            self.source_items = 0
+            self.process_latency = LatencyHistogram()
+            self.wait_latency = LatencyHistogram()
+            self.occupancy_sum = 0.0
+            self.occupancy_samples = 0
+            self.occupancy_max = 0.0
+            self.delivered_items = 0
+            self._last_log_time = time.monotonic()
+
+    def _started(self):
+        if self.start_time is None:
+            self.start_time = time.monotonic()
+
+    def record_source(self, seconds: float, item_count: int):
+        with self._lock:
+            self._started()
+            self.source_seconds += seconds
+            self.source_items += item_count
+
+    def record_processed(self, item_seconds: Iterable[float]):
+        with self._lock:
+            for seconds in item_seconds:
+                self.process_latency.add(seconds)
+
+    def record_wait(self, seconds: float, in_flight: int, capacity: int):
+        """Record a wait for results, and the buffer occupancy before it"""
+        occupancy = in_flight / capacity if capacity else 0.0
+        with self._lock:
+            self.wait_latency.add(seconds)
+            self.occupancy_sum += occupancy
+            self.occupancy_samples += 1
+            self.occupancy_max = max(self.occupancy_max, occupancy)
+
+    def record_delivered(self, item_count: int):
+        with self._lock:
+            self._started()
+            self.delivered_items += item_count
+        self.maybe_log()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.monotonic() - self.start_time if self.start_time is not None else 0.0
+            return {
+                'name': self.name,
+                'elapsed': elapsed,
+                'items': self.delivered_items,
+                'items_per_second': self.delivered_items / elapsed if elapsed else 0.0,
+                'source': {
+                    'seconds': self.source_seconds,
+                    'items': self.source_items,
+                },
+                'process': self.process_latency.to_dict(),
+                'wait': self.wait_latency.to_dict(),
+                'occupancy': {
+                    'mean': (
+                        self.occupancy_sum / self.occupancy_samples
+                        if self.occupancy_samples else 0.0
+                    ),
+                    'max': self.occupancy_max,
+                },
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def summary(self) -> str:
+        snapshot = self.snapshot()
+        return (
+            f'{self.name}: {snapshot["items"]} items, '
+            f'{snapshot["items_per_second"]:.1f} items/s, '
+            f'source {snapshot["source"]["seconds"]:.2f}s, '
+            f'process p50 {snapshot["process"]["p50"] * 1e3:.2f}ms '
+            f'p99 {snapshot["process"]["p99"] * 1e3:.2f}ms, '
+            f'wait {snapshot["wait"]["count"] * snapshot["wait"]["mean"]:.2f}s, '
+            f'occupancy {snapshot["occupancy"]["mean"]:.0%}'
+        )
+
+    def maybe_log(self):
+        if self.log_interval is None:
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_log_time < self.log_interval:
+                return
+            self._last_log_time = now
+        print(self.summary())
@@ -1,57 +1,32 @@
 import abc
-from collections import deque
-from concurrent import futures
-import multiprocessing as mp
+import threading
 from typing import *
+import warnings
+import weakref
 
 try:
     import tensorflow as tf
 except ImportError as exc:
     raise ImportError('This module requires tensorflow extra feature') from exc
 
-from .datasets import IterableDataset
+from ._workers import registered_resolve_func
+from .datasets import batch, IterableDataset, StreamFunc
+from .pools import named_pool, WorkerPool
+from .preloading import PreloadingIterator, PreloadOrder
+from .shared_memory import SHARED_MEMORY_AVAILABLE, SharedMemoryTransport
+from .stats import PipelineStats
 
 
-class PreloadingIterator:
-    def __init__(
-        self,
-        iterable: Iterable,
-        executor: futures.Executor,
-        buf_size: int,
-        resolve_func: Callable,
-    ):
-        self.inner_iterator = iter(iterable)
-        self.executor = executor
-        self.resolve_func = resolve_func
-        self.buf_size = buf_size
-
-        self._future_buffer: Deque[futures.Future] = deque(maxlen=buf_size)
-        for _ in range(buf_size):
-            self._enqueue_one()
-
-    def _enqueue_one(self):
-        try:
-            self._future_buffer.append(
-                self.executor.submit(self.resolve_func, next(self.inner_iterator))
-            )
-        except StopIteration:
-            pass
-
-    def __next__(self):
-        try:
-            future: futures.Future = self._future_buffer.popleft()
-        except IndexError:
-            raise StopIteration()
-        self._enqueue_one()
-        return future.result()
-
-    def __iter__(self):
-        return self
+TF_SAFE_START_METHODS = ('spawn', 'forkserver')
+# the pool shared by datasets converted without one, see pools.named_pool
+DEFAULT_POOL_NAME = 'tensorflow'
 
+# (id(dataset), id(pool)) -> token of the dataset registered in the pool
+_POOL_TOKENS: Dict[Tuple[int, int], str] = {}
+_POOL_TOKENS_LOCK = threading.Lock()
 
-class TensorflowConvertibleDataset(IterableDataset, abc.ABC):
-    _PROCESS_POOL_EXECUTOR = None
 
+class TensorflowConvertibleDataset(IterableDataset, abc.ABC):
     @property
     @abc.abstractmethod
     def tf_dataset_dtype(self) -> Union[tf.DType, Collection[tf.DType]]:
@@ -62,24 +37,169 @@ class TensorflowConvertibleDataset(IterableDataset, abc.ABC):
     def tf_dataset_shape(self) -> Union[tf.TensorShape, Collection[tf.TensorShape]]:
         ...
 
-    def to_tf_dataset(self, preload_buf_size: int) -> tf.data.Dataset:
-        assert mp.get_start_method() == 'spawn'
-        return (
-            tf.data.Dataset.from_generator(
-                lambda: PreloadingIterator(
-                    self.source_iterable(),
-                    self._get_process_pool_executor(),
-                    preload_buf_size,
-                    self.process_source_item,
-                ),
-                self.tf_dataset_dtype,
-                self.tf_dataset_shape,
+    def to_tf_dataset(
+        self,
+        preload_buf_size: int,
+        order: PreloadOrder = PreloadOrder.ordered,
+        reorder_window: Optional[int] = None,
+        chunk_size: Optional[int] = 1,
+        shared_memory_slot_size: Optional[int] = None,
+        pool: Optional[WorkerPool] = None,
+        stats: Optional[PipelineStats] = None,
+    ) -> tf.data.Dataset:
+        """
+        :param order: order of the items, see PreloadOrder
+        :param reorder_window: window size for PreloadOrder.windowed
+        :param chunk_size: number of source items processed by a single worker task,
+            None to adapt it to the observed processing time of an item
+        :param shared_memory_slot_size: if set, arrays of processed items up to this
+            total size in bytes are returned from workers through shared memory,
+            requires python 3.8, items are pickled with a warning on older versions
+        :param pool: pool of the workers processing items, by default the pool named
+            DEFAULT_POOL_NAME with a worker per CPU, shared by all converted datasets
+        :param stats: collects timings of the pipeline, see data.stats
+
+        The dataset is installed in the worker processes as it was when it was first
+        converted, later changes to the dataset are not seen by the workers.
+        Stream transforms, like batch, run on the processed items in the generator,
+        see IterableDataset.split_stream.
+        """
+        dataset, stream = self.split_stream()
+        if pool is None:
+            pool = named_pool(DEFAULT_POOL_NAME, start_method='spawn')
+        if pool.start_method not in TF_SAFE_START_METHODS:
+            raise ValueError(
+                f'Tensorflow is not fork-safe, pool start method must be one of '
+                f'{TF_SAFE_START_METHODS}'
             )
+        token = _pool_token(pool, self, dataset)
+
+        transport = None
+        if shared_memory_slot_size is not None and not SHARED_MEMORY_AVAILABLE:
+            warnings.warn('Shared memory requires python 3.8 or newer, items are pickled')
+        elif shared_memory_slot_size is not None:
+            # results are copied by tensorflow right away, so slots are
+            # held only by items in flight, unused slots fall back to pickling
+            transport = SharedMemoryTransport(2 * preload_buf_size, shared_memory_slot_size)
+
+        def generate():
+            preloader = PreloadingIterator(
+                dataset.source_iterable(),
+                pool,
+                preload_buf_size,
+                registered_resolve_func(token),
+                order=order,
+                reorder_window=reorder_window,
+                chunk_size=chunk_size,
+                transport=transport,
+                stats=stats,
+            )
+            try:
+                yield from (preloader if stream is None else stream(preloader))
+            finally:
+                preloader.close()
+
+        tf_dataset = tf.data.Dataset.from_generator(
+            generate,
+            self.tf_dataset_dtype,
+            self.tf_dataset_shape,
+        )
+        if transport is not None:
+            # shared by all epochs, workers detach from it once it is closed
+            weakref.finalize(tf_dataset, transport.close)
+        return tf_dataset
+
+    def with_tf_spec(
+        self,
+        dtype: Union[tf.DType, Collection[tf.DType]],
+        shape: Union[tf.TensorShape, Collection[tf.TensorShape]],
+    ) -> 'TensorflowConvertibleDataset':
+        """The same dataset converted with other types, ex. after a map changing the items"""
+        return TensorflowTransformedDataset(self._untransformed(), dtype, shape)
+
+    def batch(self, batch_size: int, drop_last: bool = False) -> 'TensorflowConvertibleDataset':
+        return TensorflowTransformedDataset(
+            batch(self._untransformed(), batch_size, drop_last),
+            self.tf_dataset_dtype,
+            _batched_shape(self.tf_dataset_shape),
+        )
+
+    def _transformed(self, transform: Callable[..., IterableDataset], *args) -> IterableDataset:
+        # transforms keep the types, ones that don't must be followed by with_tf_spec
+        return TensorflowTransformedDataset(
+            transform(self._untransformed(), *args), self.tf_dataset_dtype, self.tf_dataset_shape,
         )
 
-    @classmethod
-    def _get_process_pool_executor(cls) -> futures.ProcessPoolExecutor:
-        if cls._PROCESS_POOL_EXECUTOR is None:
-            cls._PROCESS_POOL_EXECUTOR = futures.ProcessPoolExecutor()
+    def _untransformed(self) -> IterableDataset:
+        """The dataset further transforms apply to"""
+        return self
+
+
+class TensorflowTransformedDataset(TensorflowConvertibleDataset):
+    """Transforms of a convertible dataset, see IterableDataset transform methods"""
+
+    def __init__(
+        self,
+        dataset: IterableDataset,
+        dtype: Union[tf.DType, Collection[tf.DType]],
+        shape: Union[tf.TensorShape, Collection[tf.TensorShape]],
+    ):
+        self.dataset = dataset
+        self._dtype = dtype
+        self._shape = shape
+
+    @property
+    def tf_dataset_dtype(self) -> Union[tf.DType, Collection[tf.DType]]:
+        return self._dtype
+
+    @property
+    def tf_dataset_shape(self) -> Union[tf.TensorShape, Collection[tf.TensorShape]]:
+        return self._shape
+
+    def source_iterable(self) -> Iterable[Any]:
+        return self.dataset.source_iterable()
+
+    def process_source_item(self, item: Any) -> Any:
+        return self.dataset.process_source_item(item)
+
+    def split_stream(self) -> Tuple[IterableDataset, Optional[StreamFunc]]:
+        return self.dataset.split_stream()
+
+    def _untransformed(self) -> IterableDataset:
+        return self.dataset
+
+
+def _batched_shape(shape: Any) -> Any:
+    if isinstance(shape, tf.TensorShape):
+        return tf.TensorShape([None]).concatenate(shape)
+    elif isinstance(shape, dict):
+        return {key: _batched_shape(element) for key, element in shape.items()}
+    elif isinstance(shape, list):
+        return [_batched_shape(element) for element in shape]
+    else:
+        return tuple(_batched_shape(element) for element in shape)
+
+
+def _pool_token(
+    pool: WorkerPool,
+    converted: TensorflowConvertibleDataset,
+    dataset: IterableDataset,
+) -> str:
+    """Token of the dataset to process items of converted with, registered in the pool
+    on the first conversion and unregistered when converted is collected"""
+    key = (id(converted), id(pool))
+    with _POOL_TOKENS_LOCK:
+        token = _POOL_TOKENS.get(key)
+        if token is None:
+            token = pool.register_dataset(dataset)
+            _POOL_TOKENS[key] = token
+            # the finalizer keeps the pool alive, so its id isn't reused while registered
+            weakref.finalize(converted, _unregister_from_pool, key, pool)
+
+    return token
+
 
-        return cls._PROCESS_POOL_EXECUTOR
+def _unregister_from_pool(key: Tuple[int, int], pool: WorkerPool):
+    with _POOL_TOKENS_LOCK:
+        token = _POOL_TOKENS.pop(key)
+    pool.unregister_dataset(token)
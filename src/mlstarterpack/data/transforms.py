@@ -0,0 +1,126 @@
+"""Transforms of dataset items, the building blocks of the IterableDataset transform methods
+
+Per-item transforms (map and filter) are fused into the process_source_item of a single
+dataset, so a chain of them runs as one call per item and is shipped to parallel workers
+along with the dataset. Functions must be picklable to run on process pools.
+
+Stream transforms (batch, map_batches, shuffle_buffer, interleave and take) work
+on the processed items in the iterating thread, per-item transforms after them are
+parallelizable again. When a dataset is preloaded, per-item transforms before a stream
+transform still run on the workers, see IterableDataset.split_stream. Shuffling and
+taking from a chain of maps are applied to the source items instead.
+
+Filtered items are returned as FILTERED by process_source_item and skipped by iterators.
+
+Stream functions here take the items, the 1-based epoch of the iteration and their
+arguments, the datasets applying them are in data.datasets.
+"""
+import itertools
+import random
+from typing import *
+
+from ._structure import collate, unbatch
+
+
+class _Filtered:
+    def __repr__(self):
+        return 'FILTERED'
+
+    def __reduce__(self):
+        # unpickled as the module-level singleton, so it can be compared by identity
+        return 'FILTERED'
+
+
+# returned by process_source_item for items removed by a filter, skipped by all iterators
+FILTERED = _Filtered()
+
+
+class ItemTransform(NamedTuple):
+    func: Callable[[Any], Any]
+    is_filter: bool
+
+
+def apply_item_transforms(value: Any, transforms: Sequence[ItemTransform]) -> Any:
+    for func, is_filter in transforms:
+        if value is FILTERED:
+            break
+        if is_filter:
+            if not func(value):
+                value = FILTERED
+        else:
+            value = func(value)
+    return value
+
+
+def transform_stream(transforms: Sequence[ItemTransform], items: Iterable[Any]) -> Iterator[Any]:
+    """Per-item transforms applied to a stream of processed items"""
+    for item in items:
+        value = apply_item_transforms(item, transforms)
+        if value is not FILTERED:
+            yield value
+
+
+def batch_stream(items: Iterable[Any], _epoch: int, batch_size: int, drop_last: bool):
+    iterator = iter(items)
+    while True:
+        samples = list(itertools.islice(iterator, batch_size))
+        if not samples or (drop_last and len(samples) < batch_size):
+            return
+        yield collate(samples)
+
+
+def map_batches_stream(items: Iterable[Any], epoch: int, func: Callable, batch_size: int):
+    for batch_value in batch_stream(items, epoch, batch_size, False):
+        yield from unbatch(func(batch_value))
+
+
+def shuffle_stream(items: Iterable[Any], epoch: int, buffer_size: int, seed: Optional[int]):
+    rng = random.Random(None if seed is None else f'{seed}:{epoch}')
+    buffer: List[Any] = []
+    for item in items:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+
+        index = rng.randrange(buffer_size)
+        yield buffer[index]
+        buffer[index] = item
+
+    rng.shuffle(buffer)
+    yield from buffer
+
+
+_END = object()
+
+
+def interleave_stream(
+    items: Iterable[Any],
+    _epoch: int,
+    func: Callable[[Any], Iterable[Any]],
+    cycle_length: int,
+    block_length: int,
+):
+    items_iterator = iter(items)
+    iterators: List[Iterator[Any]] = []
+    for item in itertools.islice(items_iterator, cycle_length):
+        iterators.append(iter(func(item)))
+
+    index = 0
+    while iterators:
+        block = list(itertools.islice(iterators[index], block_length))
+        yield from block
+        if len(block) < block_length:
+            # replace the exhausted iterator with the next item's one, keeping its place
+            next_item = next(items_iterator, _END)
+            if next_item is _END:
+                del iterators[index]
+                if not iterators:
+                    return
+                index %= len(iterators)
+                continue
+            iterators[index] = iter(func(next_item))
+        index = (index + 1) % len(iterators)
+
+
+def take_stream(items: Iterable[Any], _epoch: int, count: int):
+    return itertools.islice(items, count)
@@ -13,11 +13,18 @@ usually it's the path of the file relative to the root data directory,
 but for tabular data it can be a value of a column in the source data frame.
 
 \<root data dir\>:
+- .ecdata/
+    - Caches maintained by the ecdata tools, safe to delete
+    - key_index/: persistent index of keys referenced by tables and object files
+    - content_hashes.parquet: content hashes of imported objects used to skip duplicates
+    - verify_cache.parquet: results of image verification done by check --verify
 - datasets/
     - \<annotationname\>_\<splitname\>.csv: simply a one-columnt list of object
         keys belonging to the dataset
     - class_train.csv: as an example
-    - \<other formats TBD\>
+    - Any table (dataset lists, metadata, tabular source data) can be stored
+        as .csv, .parquet or .feather/.arrow (Arrow IPC) files without a header,
+        see the convert_tables tool
 - processed/
     - Any data with preprocessing applied after taking source data
     - Usually this directory will mirror contents of the `source/` directory
@@ -34,3 +41,5 @@ but for tabular data it can be a value of a column in the source data frame.
             (usually as one column)
         - class.csv: as an example
 """
+
+from .root import ECDataRoot
@@ -3,53 +3,184 @@ from pathlib import Path
 from typing import *
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 
+from mlstarterpack.filescan import scan_files
 
-TABLE_EXTENSIONS = ('.csv',)
 
+CSV_EXTENSIONS = ('.csv',)
+PARQUET_EXTENSIONS = ('.parquet',)
+FEATHER_EXTENSIONS = ('.feather', '.arrow')
+TABLE_EXTENSIONS = CSV_EXTENSIONS + PARQUET_EXTENSIONS + FEATHER_EXTENSIONS
+# the table used when one is stored in several formats, ex. after convert_tables --keep-originals
+TABLE_FORMAT_PREFERENCE = PARQUET_EXTENSIONS + FEATHER_EXTENSIONS + CSV_EXTENSIONS
 
-def load_dataframe(path: Path) -> pd.DataFrame:
-    if path.suffix.lower() == '.csv':
-        return pd.read_csv(path, header=None)
+
+def table_format_rank(path: Union[str, Path]) -> int:
+    """Lower is preferred, see TABLE_FORMAT_PREFERENCE"""
+    return TABLE_FORMAT_PREFERENCE.index(os.path.splitext(str(path))[1].lower())
+
+
+def load_dataframe(
+    path: Path,
+    columns: Optional[Sequence[int]] = None,
+    memory_map: bool = True,
+) -> pd.DataFrame:
+    """Load a headerless table, columns are numbered like in csv files without a header.
+
+    :param columns: only load these columns
+    :param memory_map: memory-map parquet and feather files instead of reading them
+    """
+    suffix = path.suffix.lower()
+    if suffix in CSV_EXTENSIONS:
+        return pd.read_csv(path, header=None, usecols=columns)
+
+    column_names = None if columns is None else [str(column) for column in columns]
+    if suffix in PARQUET_EXTENSIONS:
+        table = pq.read_table(str(path), columns=column_names, memory_map=memory_map)
+    elif suffix in FEATHER_EXTENSIONS:
+        table = feather.read_table(str(path), columns=column_names, memory_map=memory_map)
     else:
         raise ValueError(f'Unknown table file format: {path.suffix}')
 
+    return _from_arrow_table(table)
+
+
+def _from_arrow_table(table: pa.Table) -> pd.DataFrame:
+    df = table.to_pandas()
+    df.columns = [int(column) if column.isdigit() else column for column in df.columns]
+    return df
+
+
+def iter_dataframe_chunks(path: Path, chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Load a table in chunks of roughly chunk_size rows"""
+    suffix = path.suffix.lower()
+    if suffix in CSV_EXTENSIONS:
+        if path.stat().st_size == 0:
+            return
+        yield from pd.read_csv(path, header=None, chunksize=chunk_size)
+    elif suffix in PARQUET_EXTENSIONS:
+        parquet_file = pq.ParquetFile(str(path), memory_map=True)
+        for i in range(parquet_file.num_row_groups):
+            yield _from_arrow_table(parquet_file.read_row_group(i))
+    else:
+        # feather files are memory-mapped anyway
+        yield load_dataframe(path)
+
 
 def save_dataframe(df: pd.DataFrame, path: Path):
-    if path.suffix.lower() == '.csv':
+    suffix = path.suffix.lower()
+    if suffix in CSV_EXTENSIONS:
         df.to_csv(path, header=None, index=False)
+    elif suffix in PARQUET_EXTENSIONS:
+        pq.write_table(_to_arrow_table(df), str(path))
+    elif suffix in FEATHER_EXTENSIONS:
+        feather.write_feather(_to_arrow_table(df), str(path))
     else:
         raise ValueError(f'Unknown table file format: {path.suffix}')
 
 
+def _to_arrow_table(df: pd.DataFrame) -> pa.Table:
+    # arrow formats require string column names
+    df = df.rename(columns=str)
+    try:
+        return pa.Table.from_pandas(df, preserve_index=False)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # columns with values of mixed types (as parsed from csv) are stored as strings
+        df = df.apply(
+            lambda column: (
+                column.where(column.isna(), column.astype(str))
+                if column.dtype == object else column
+            )
+        )
+        return pa.Table.from_pandas(df, preserve_index=False)
+
+
 def find_table_files(where: Path) -> Iterable[Path]:
-    for dirpath, _dirnames, filenames in os.walk(str(where)):
-        for filename in filenames:
-            file_path = Path(dirpath) / filename
-            if not file_path.suffix or file_path.suffix.lower() not in TABLE_EXTENSIONS:
-                continue
+    for file_path in scan_files(where, extensions=TABLE_EXTENSIONS):
+        yield Path(file_path)
+
+
+def find_existing_table(path: Path) -> Path:
+    """Return an existing table with the same name as path in the preferred format,
+    see TABLE_FORMAT_PREFERENCE, or path itself if there is none
+    """
+    existing_paths = [
+        other_path
+        for other_path in [path] + [path.with_suffix(extension) for extension in TABLE_EXTENSIONS]
+        if other_path.exists()
+    ]
+    if not existing_paths:
+        return path
+
+    # the same table ECDataRoot reads, ties go to the path sorting first
+    return min(existing_paths, key=lambda other_path: (table_format_rank(other_path), other_path))
 
-            yield file_path
+
+def save_dataframe_atomic(df: pd.DataFrame, path: Path):
+    """Save a dataframe so that readers never observe a partially written file"""
+    tmp_path = path.with_name(f'.{path.stem}.tmp{path.suffix}')
+    save_dataframe(df, tmp_path)
+    os.replace(str(tmp_path), str(path))
+
+
+def remap_keys(keys: pd.Series, key_map: Dict[str, str]) -> pd.Series:
+    """Replace keys present in key_map, leave the rest intact"""
+    return keys.map(key_map).fillna(keys)
+
+
+def _can_append_csv(source_df: pd.DataFrame, target_path: Path) -> bool:
+    if target_path.suffix.lower() not in CSV_EXTENSIONS or target_path.stat().st_size == 0:
+        return False
+
+    # only the first row is parsed to compare the schemas
+    target_head_df = pd.read_csv(target_path, header=None, nrows=1)
+    return len(target_head_df.columns) == len(source_df.columns)
+
+
+def _append_csv(source_df: pd.DataFrame, target_path: Path):
+    with open(target_path, 'rb+') as outfile:
+        outfile.seek(-1, os.SEEK_END)
+        if outfile.read(1) != b'\n':
+            outfile.write(b'\n')
+
+    source_df.to_csv(target_path, mode='a', header=None, index=False)
 
 
 def append_table(
     source_path: Path,
     target_path: Path,
     key_map: Optional[Dict[str, str]] = None,
+    skip_keys: Optional[Collection[str]] = None,
 ):
+    """Append rows of the source table to the target table.
+
+    Rows are appended to the end of the target file when possible,
+    so the cost doesn't depend on the size of the target table.
+    The target is rewritten (atomically) only if the schemas differ
+    or the format doesn't support appending.
+
+    :param skip_keys: don't append rows with these keys (first column, before
+        mapping with key_map)
+    """
     source_df = load_dataframe(source_path)
 
+    if skip_keys:
+        source_df = source_df[~source_df.iloc[:, 0].astype(str).isin(skip_keys)].copy()
+        if source_df.empty:
+            return
+
     if key_map:
         # map image names in the first column to the new ones
-        source_df.iloc[:, 0] = source_df.apply(
-            lambda row: key_map.get(row[0], row[0]),
-            axis=1,
-        )
+        source_df.iloc[:, 0] = remap_keys(source_df.iloc[:, 0], key_map)
 
-    if target_path.exists():
+    if not target_path.exists():
+        save_dataframe_atomic(source_df, target_path)
+    elif _can_append_csv(source_df, target_path):
+        _append_csv(source_df, target_path)
+    else:
         target_df = load_dataframe(target_path)
         result_df = pd.concat([target_df, source_df])
-    else:
-        result_df = source_df
-
-    save_dataframe(result_df, target_path)
+        save_dataframe_atomic(result_df, target_path)
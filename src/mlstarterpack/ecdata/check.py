@@ -1,14 +1,12 @@
 import argparse
+import os
 from pathlib import Path
+from typing import *
 
-import pandas as pd
-
-from mlstarterpack.vision.images import find_images
-from ._tabular import find_table_files, load_dataframe
-from .utils import (
-    find_dataset_csvs,
-    find_metadata_csvs,
-)
+from mlstarterpack.vision.images import IMAGE_EXTENSIONS
+from .key_index import KeyKind
+from .root import ECDataRoot
+from .verify import verify_objects, VerifyLevel
 
 
 def parse_arguments():
@@ -17,52 +15,98 @@ def parse_arguments():
         '--data-root', type=Path, required=False, default=Path('data/'),
         help='Data root to check',
     )
-    return parser.parse_args()
+    parser.add_argument(
+        '--rebuild-index', action='store_true', default=False,
+        help='Re-read all tables instead of only the changed ones',
+    )
+    parser.add_argument(
+        '--verify', type=str, required=False, default=None,
+        choices=[level.name for level in VerifyLevel],
+        help=(
+            'Also verify referenced images: header checks file structure, '
+            'decode fully decodes every image'
+        ),
+    )
+    parser.add_argument(
+        '--verify-jobs', type=int, required=False, default=None,
+        help='Number of processes verifying images',
+    )
+    parser.add_argument(
+        '--verify-report', type=Path, required=False, default=None,
+        help='Write verification results to this json file',
+    )
+    args = parser.parse_args()
 
+    if args.verify is not None:
+        args.verify = VerifyLevel[args.verify]
+    return args
 
-def main():
-    args = parse_arguments()
 
-    print('Reading datasets...')
-    dataset_keys = set()
-    for dataset_csv_path in find_dataset_csvs(args.data_root / 'datasets'):
-        input_df = pd.read_csv(dataset_csv_path, header=None)
-        dataset_keys.update(input_df[0])
+def check(
+    root: ECDataRoot,
+    rebuild_index: bool = False,
+    verify_level: Optional[VerifyLevel] = None,
+    verify_jobs: Optional[int] = None,
+    verify_report_path: Optional[Path] = None,
+):
+    print('Updating key index...')
+    key_index = root.key_index
+    updated_count = key_index.refresh(rebuild=rebuild_index)
+    print(f'{updated_count} tables re-read')
 
     print('Checking metadata...')
-    metadata_keys = set()
-    for metadata_csv_path in find_metadata_csvs(args.data_root / 'source/metadata'):
-        df = pd.read_csv(metadata_csv_path, header=None)
-        metadata_keys.update(df[0])
-
-    not_in_metadata = dataset_keys - metadata_keys
-    if not_in_metadata:
-        print('WARNING: Keys in dataset csvs, but not in metadata csvs:')
+    dataset_keys = key_index.keys(KeyKind.dataset)
+    metadata_keys = key_index.keys(KeyKind.metadata)
+
+    not_in_metadata = dataset_keys.difference(metadata_keys)
+    if len(not_in_metadata):
+        print('WARNING: Keys in dataset tables, but not in metadata tables:')
         for key in not_in_metadata:
             print(f'  {key}')
         print()
 
     print('Checking object files...')
-    object_keys = frozenset(
-        str(image_path.relative_to(args.data_root))
-        for image_path in find_images(args.data_root / 'source/')
-    )
-
-    print('Checking tabular files...')
-    table_keys = set()
-    for table_path in find_table_files(args.data_root / 'source/'):
-        df = load_dataframe(table_path)
-        table_keys.update(df[0])
+    object_keys = key_index.keys(KeyKind.object, KeyKind.table)
 
-    missing_keys = (dataset_keys | metadata_keys) - (object_keys | table_keys)
-    if missing_keys:
-        print('ERROR: Keys in csvs, but not among object files:')
+    missing_keys = dataset_keys.union(metadata_keys).difference(object_keys)
+    if len(missing_keys):
+        print('ERROR: Keys in tables, but not among object files:')
         for key in missing_keys:
             print(f'  {key}')
         print()
 
+    if verify_level is not None:
+        print(f'Verifying images ({verify_level})...')
+        image_keys = [
+            key
+            for key in dataset_keys.union(metadata_keys).intersection(object_keys)
+            if os.path.splitext(key)[1].lower() in IMAGE_EXTENSIONS
+        ]
+        report = verify_objects(root.path, image_keys, verify_level, verify_jobs)
+        print(report.summary())
+
+        if report.failures:
+            print('ERROR: Broken images:')
+            for failure in report.failures:
+                print(f'  {failure.key}: {failure.error}')
+            print()
+
+        if verify_report_path is not None:
+            report.to_file(verify_report_path)
+
     print('Done')
 
 
+def main():
+    args = parse_arguments()
+    check(
+        ECDataRoot(args.data_root),
+        rebuild_index=args.rebuild_index,
+        verify_level=args.verify,
+        verify_jobs=args.verify_jobs,
+        verify_report_path=args.verify_report,
+    )
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,101 @@
+"""Persistent index of object file content hashes
+
+Stored as `<root>/.ecdata/content_hashes.parquet` with (hash, key) rows,
+hashes are blake2b hex digests like the ones computed by hashdupfinder.
+"""
+from concurrent import futures
+import os
+from pathlib import Path
+import threading
+from typing import *
+
+import pandas as pd
+
+from ._tabular import load_dataframe, save_dataframe_atomic
+from .transfer import hash_file
+
+
+CONTENT_INDEX_PATH = Path('.ecdata/content_hashes.parquet')
+
+
+class ContentHashIndex:
+    def __init__(self, data_root: Path):
+        self.data_root = Path(data_root)
+        self.path = self.data_root / CONTENT_INDEX_PATH
+
+        self._keys_by_hash: Dict[str, str] = {}
+        # hashes claimed by this instance, their objects are placed or being placed
+        # and are trusted without checking that the object file exists
+        self._claimed_hashes: Set[str] = set()
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        if self.path.exists():
+            df = load_dataframe(self.path)
+            self._keys_by_hash = dict(zip(df['hash'], df['key']))
+
+    def __len__(self):
+        return len(self._keys_by_hash)
+
+    def indexed_keys(self) -> FrozenSet[str]:
+        with self._lock:
+            return frozenset(self._keys_by_hash.values())
+
+    def claim(self, digest: str, key: str) -> str:
+        """Register key as the owner of the content, unless some object has it.
+
+        A claim holds until it's released, so a file with the same content
+        is mapped to key even while the object of key is still being written.
+
+        :returns: the key of the object with this content
+        """
+        with self._lock:
+            existing_key = self._keys_by_hash.get(digest)
+            if existing_key is not None and (
+                digest in self._claimed_hashes
+                # objects can be deleted from the root without updating the saved index
+                or os.path.isfile(str(self.data_root / existing_key))
+            ):
+                return existing_key
+
+            self._keys_by_hash[digest] = key
+            self._claimed_hashes.add(digest)
+            self._dirty = True
+            return key
+
+    def release(self, digest: str, key: str):
+        """Undo a claim of key, ex. when its object failed to be written"""
+        with self._lock:
+            if self._keys_by_hash.get(digest) == key:
+                del self._keys_by_hash[digest]
+                self._claimed_hashes.discard(digest)
+                self._dirty = True
+
+    def add_objects(self, keys: Iterable[str], max_workers: Optional[int] = None) -> int:
+        """Hash existing object files that aren't indexed yet.
+
+        :returns: the number of hashed files
+        """
+        indexed_keys = self.indexed_keys()
+        new_keys = [key for key in keys if key not in indexed_keys]
+
+        with futures.ThreadPoolExecutor(max_workers) as executor:
+            digests = executor.map(lambda key: hash_file(self.data_root / key), new_keys)
+            for key, digest in zip(new_keys, digests):
+                self.claim(digest, key)
+
+        return len(new_keys)
+
+    def save(self):
+        if not self._dirty:
+            return
+
+        with self._lock:
+            df = pd.DataFrame(
+                list(self._keys_by_hash.items()),
+                columns=['hash', 'key'],
+            )
+            self._dirty = False
+
+        os.makedirs(str(self.path.parent), exist_ok=True)
+        save_dataframe_atomic(df, self.path)
@@ -0,0 +1,79 @@
+"""Convert all tables of a data root to another table format"""
+import argparse
+import os
+from pathlib import Path
+
+from ._tabular import (
+    CSV_EXTENSIONS,
+    FEATHER_EXTENSIONS,
+    find_table_files,
+    load_dataframe,
+    PARQUET_EXTENSIONS,
+    save_dataframe_atomic,
+)
+from .key_index import KeyIndex
+
+
+FORMAT_EXTENSIONS = {
+    'csv': CSV_EXTENSIONS[0],
+    'parquet': PARQUET_EXTENSIONS[0],
+    'feather': FEATHER_EXTENSIONS[0],
+}
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--data-root', type=Path, required=False, default=Path('data/'),
+        help='Data root to convert',
+    )
+    parser.add_argument(
+        '--format', type=str, required=False, default='parquet',
+        choices=list(FORMAT_EXTENSIONS),
+        help='Target table format',
+    )
+    parser.add_argument(
+        '--keep-originals', action='store_true', default=False,
+        help='Do not delete the converted tables',
+    )
+    return parser.parse_args()
+
+
+def convert_table(path: Path, extension: str, keep_original: bool = False) -> Path:
+    new_path = path.with_suffix(extension)
+    if new_path.exists():
+        raise RuntimeError(f'Cannot convert {path}, {new_path} already exists')
+
+    save_dataframe_atomic(load_dataframe(path), new_path)
+    if not keep_original:
+        os.unlink(str(path))
+
+    return new_path
+
+
+def main():
+    args = parse_arguments()
+    extension = FORMAT_EXTENSIONS[args.format]
+
+    table_paths = [
+        path
+        for where in (args.data_root / 'datasets', args.data_root / 'source')
+        for path in find_table_files(where)
+        if path.suffix.lower() != extension
+    ]
+    print(f'{len(table_paths)} tables to convert')
+
+    for table_path in table_paths:
+        new_path = convert_table(table_path, extension, args.keep_originals)
+        print(f'Converted {table_path} -> {new_path}')
+
+    key_index = KeyIndex(args.data_root)
+    if key_index.exists():
+        print('Updating key index...')
+        key_index.refresh()
+
+    print('Done')
+
+
+if __name__ == '__main__':
+    main()
@@ -3,16 +3,18 @@ import argparse
 from dataclasses import dataclass
 import os
 from pathlib import Path
-import shutil
 from typing import *
 import uuid
 
-from ._tabular import append_table, TABLE_EXTENSIONS
-from .utils import (
-    create_minimal_data_dirs,
-    find_dataset_csvs,
-    find_metadata_csvs,
+from mlstarterpack.filescan import scan_files
+from ._tabular import append_table, find_existing_table, TABLE_EXTENSIONS
+from .content_index import ContentHashIndex
+from .key_index import KeyKind
+from .root import ECDataRoot
+from .transfer import (
+    add_transfer_arguments, ContentClaim, ContentRelease, FileTransferer, transferer_from_args,
 )
+from .utils import create_minimal_data_dirs
 
 
 @dataclass
@@ -25,43 +27,102 @@ def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('data_drop_dir', type=str)
     parser.add_argument('--output-data-root', type=str, default='data/', required=False)
+    parser.add_argument(
+        '--no-dedup', action='store_true', default=False,
+        help='Copy all files instead of mapping duplicates to existing objects',
+    )
+    parser.add_argument(
+        '--hash-existing', action='store_true', default=False,
+        help=(
+            'Hash existing objects missing from the content index first, '
+            'so that duplicates of them are detected'
+        ),
+    )
+    add_transfer_arguments(parser)
     return parser.parse_args()
 
 
-def import_source_data(params: PathParameters) -> Dict[str, str]:
+def _content_claim(
+    content_index: Optional[ContentHashIndex],
+    object_name_map: Dict[str, str],
+    original_names: Dict[Path, str],
+    duplicate_names: Set[str],
+) -> Tuple[Optional[ContentClaim], Optional[ContentRelease]]:
+    """Claim and release functions mapping duplicates to existing keys in object_name_map
+    and adding their names to duplicate_names"""
+    if content_index is None:
+        return None, None
+
+    def claim(digest: str, new_path: Path) -> bool:
+        original_name = original_names[new_path]
+        new_key = object_name_map[original_name]
+        existing_key = content_index.claim(digest, new_key)
+        if existing_key != new_key:
+            object_name_map[original_name] = existing_key
+            duplicate_names.add(original_name)
+            return False
+        return True
+
+    def release(digest: str, new_path: Path):
+        content_index.release(digest, object_name_map[original_names[new_path]])
+
+    return claim, release
+
+
+def import_source_data(
+    params: PathParameters,
+    transferer: Optional[FileTransferer] = None,
+    content_index: Optional[ContentHashIndex] = None,
+) -> Tuple[Dict[str, str], Set[str]]:
     """Copy renamed objects to output and return mapping
     from source names to renamed ones
+
+    :param content_index: if passed, files with the same content as
+        an existing object are not copied, but mapped to the existing key
+    :returns: the mapping and source names of files mapped to existing objects
     """
+    if transferer is None:
+        transferer = FileTransferer()
+
     object_name_map = {}
-    for dirpath, _dirnames, filenames in os.walk(str(params.data_drop_dir / 'source')):
-        rel_dirpath = str(Path(dirpath).relative_to(params.data_drop_dir / 'source'))
-        if rel_dirpath in ('.', 'metadata'):
+    duplicate_names: Set[str] = set()
+    original_names = {}  # new path -> original name
+    transfer_jobs = []
+    source_dir = os.path.normpath(str(params.data_drop_dir / 'source'))
+    for path in scan_files(
+        source_dir,
+        exclude_dirs=[os.path.join(source_dir, 'metadata')],
+        skip_hidden=True,
+    ):
+        if os.path.dirname(path) == source_dir:
             continue
 
-        for filename in filenames:
-            if filename.startswith('.'):
-                continue
+        file_path = Path(path)
 
-            file_path = Path(dirpath) / filename
+        extension = file_path.suffix.lower()
+        original_name = str(file_path.relative_to(params.data_drop_dir))
 
-            extension = file_path.suffix.lower()
-            original_name = str(file_path.relative_to(params.data_drop_dir))
+        if extension in TABLE_EXTENSIONS:
+            append_table(file_path, find_existing_table(params.output_dir / original_name))
+        else:
+            new_name = (
+                file_path.parent.relative_to(params.data_drop_dir)
+                / f'{uuid.uuid4()}{extension}'
+            )
+            new_path = params.output_dir / new_name
 
-            if extension in TABLE_EXTENSIONS:
-                append_table(file_path, params.output_dir / original_name)
-            else:
-                uid = str(uuid.uuid4())
-                new_name = (
-                    file_path.parent.relative_to(params.data_drop_dir)
-                    / f'{uid}{extension}'
-                )
-                new_path = params.output_dir / new_name
+            object_name_map[original_name] = str(new_name)
+            original_names[new_path] = original_name
 
-                object_name_map[original_name] = str(new_name)
+            transfer_jobs.append((file_path, new_path))
 
-                shutil.copy(str(file_path), str(new_path))
+    stats = transferer.transfer(
+        transfer_jobs,
+        *_content_claim(content_index, object_name_map, original_names, duplicate_names),
+    )
+    print(f'Transferred {stats}')
 
-    return object_name_map
+    return object_name_map, duplicate_names
 
 
 def main():
@@ -74,25 +135,50 @@ def main():
 
     create_minimal_data_dirs(params.output_dir)
 
+    drop_root = ECDataRoot(params.data_drop_dir)
+    output_root = ECDataRoot(output_dir)
+
+    content_index = None
+    if not args.no_dedup:
+        content_index = ContentHashIndex(output_dir)
+        if args.hash_existing:
+            print('Hashing existing objects...')
+            output_root.key_index.refresh()
+            object_keys = output_root.key_index.keys(KeyKind.object)
+            hashed_count = content_index.add_objects(object_keys, args.transfer_jobs)
+            print(f'{hashed_count} objects hashed')
+
     print('Importing source files...')
-    object_key_map = import_source_data(params)
+    object_key_map, duplicate_names = import_source_data(
+        params, transferer_from_args(args), content_index,
+    )
+    if content_index is not None:
+        content_index.save()
 
+    # rows of duplicates are skipped, the objects they're mapped to already have rows
     print('Importing metadata...')
-    for metadata_csv_path in find_metadata_csvs(params.data_drop_dir):
+    for metadata_path in drop_root.metadata_paths().values():
         append_table(
-            metadata_csv_path,
-            output_dir / 'source/metadata' / metadata_csv_path.name,
+            metadata_path,
+            find_existing_table(output_root.metadata_dir / metadata_path.name),
             object_key_map,
+            skip_keys=duplicate_names,
         )
 
     print('Importing datasets...')
-    for dataset_csv_path in find_dataset_csvs(params.data_drop_dir):
+    for dataset_path in drop_root.dataset_paths().values():
         append_table(
-            dataset_csv_path,
-            output_dir / 'datasets' / dataset_csv_path.name,
-            object_key_map
+            dataset_path,
+            find_existing_table(output_root.datasets_dir / dataset_path.name),
+            object_key_map,
+            skip_keys=duplicate_names,
         )
 
+    key_index = output_root.key_index
+    if key_index.exists():
+        print('Updating key index...')
+        key_index.refresh()
+
     print('Done')
 
 
@@ -0,0 +1,233 @@
+"""Persistent index of object keys referenced by a data root
+
+The index is stored as parquet files under `<root>/.ecdata/key_index/`:
+- files.parquet: every indexed table file with its size and mtime
+- keys.parquet: (key, file, kind) rows, one per key occurrence
+
+Refreshing the index only re-reads table files whose size or mtime changed.
+"""
+import enum
+import os
+from pathlib import Path
+from typing import *
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from mlstarterpack.filescan import ListingCache, scan_files
+from ._tabular import load_dataframe, TABLE_EXTENSIONS
+from .utils import DATASET_TABLE_RE, METADATA_TABLE_RE
+
+
+INDEX_DIR = Path('.ecdata/key_index')
+FILES_FILENAME = 'files.parquet'
+KEYS_FILENAME = 'keys.parquet'
+LISTING_CACHE_PATH = Path('.ecdata/listing_cache.pickle')
+
+
+class KeyKind(enum.Enum):
+    dataset = 'dataset'
+    metadata = 'metadata'
+    table = 'table'
+    object = 'object'
+
+
+TABLE_KINDS = (KeyKind.dataset, KeyKind.metadata, KeyKind.table)
+
+
+class KeyIndex:
+    def __init__(self, data_root: Path, use_listing_cache: bool = True):
+        """
+        :param use_listing_cache: reuse directory listings of unchanged directories
+            between refreshes
+        """
+        self.data_root = Path(data_root)
+        self.index_dir = self.data_root / INDEX_DIR
+        self.use_listing_cache = use_listing_cache
+
+        self._files_df: Optional[pd.DataFrame] = None
+        self._keys_df: Optional[pd.DataFrame] = None
+        self._listing_cache_instance: Optional[ListingCache] = None
+
+    @property
+    def files_df(self) -> pd.DataFrame:
+        if self._files_df is None:
+            self._load()
+        return self._files_df
+
+    @property
+    def keys_df(self) -> pd.DataFrame:
+        if self._keys_df is None:
+            self._load()
+        return self._keys_df
+
+    @property
+    def _listing_cache(self) -> Optional[ListingCache]:
+        if not self.use_listing_cache:
+            return None
+        if self._listing_cache_instance is None:
+            self._listing_cache_instance = ListingCache(self.data_root / LISTING_CACHE_PATH)
+        return self._listing_cache_instance
+
+    def exists(self) -> bool:
+        return (self.index_dir / KEYS_FILENAME).exists()
+
+    def keys(self, *kinds: KeyKind) -> pd.Index:
+        """Unique keys referenced by files of given kinds (all kinds if none passed)"""
+        keys_df = self.keys_df
+        if kinds:
+            keys_df = keys_df[keys_df.kind.isin([kind.value for kind in kinds])]
+        return pd.Index(keys_df.key.unique())
+
+    def files(self, *kinds: KeyKind) -> List[Path]:
+        """Indexed table files of given kinds (all table kinds if none passed)"""
+        files_df = self.files_df
+        if kinds:
+            files_df = files_df[files_df.kind.isin([kind.value for kind in kinds])]
+        return [self.data_root / file for file in files_df.file]
+
+    def lookup(self, keys: Iterable[str], *kinds: KeyKind) -> pd.DataFrame:
+        """Return (key, file, kind) rows of all files referencing the keys"""
+        keys_df = self.keys_df
+        mask = keys_df.key.isin(pd.Index(keys))
+        if kinds:
+            mask &= keys_df.kind.isin([kind.value for kind in kinds])
+        return keys_df[mask].reset_index(drop=True)
+
+    def refresh(self, rebuild: bool = False) -> int:
+        """Bring the index up to date with the data root.
+
+        :returns: the number of table files that had to be (re)read
+        """
+        if rebuild and self._listing_cache is not None:
+            self._listing_cache.clear()
+
+        if rebuild or not self.exists():
+            old_files_df = _empty_files_df()
+            old_keys_df = _empty_keys_df()
+        else:
+            old_files_df = self.files_df
+            old_keys_df = self.keys_df
+
+        current_files_df, objects_df = self._scan()
+
+        merged = current_files_df.merge(
+            old_files_df, on=['file', 'kind'], how='left', suffixes=('', '_old'),
+        )
+        stale_mask = (
+            (merged['size'] != merged['size_old'])
+            | (merged['mtime_ns'] != merged['mtime_ns_old'])
+        )
+        stale_files_df = merged[stale_mask]
+        fresh_files = pd.Index(merged.file[~stale_mask])
+
+        keys_parts = [
+            old_keys_df[
+                old_keys_df.kind.isin([kind.value for kind in TABLE_KINDS])
+                & old_keys_df.file.isin(fresh_files)
+            ]
+        ]
+        for file, kind in zip(stale_files_df.file, stale_files_df.kind):
+            keys_parts.append(self._read_table_keys(file, kind))
+        keys_parts.append(objects_df)
+
+        self._files_df = current_files_df.reset_index(drop=True)
+        self._keys_df = _normalize_keys_df(pd.concat(keys_parts, ignore_index=True))
+        self._save()
+
+        return len(stale_files_df)
+
+    def _scan(self) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """List tables and object files of the data root in a single pass.
+
+        :returns: a files dataframe of tables and a keys dataframe of object files
+        """
+        table_files: List[Tuple[str, KeyKind]] = []
+        object_keys: List[str] = []
+
+        datasets_dir = os.path.normpath(str(self.data_root / 'datasets'))
+        for path in scan_files(
+            datasets_dir, pattern=DATASET_TABLE_RE, skip_hidden=True,
+            cache=self._listing_cache,
+        ):
+            table_files.append(('datasets' + path[len(datasets_dir):], KeyKind.dataset))
+
+        source_dir = os.path.normpath(str(self.data_root / 'source'))
+        metadata_prefix = os.path.join('source', 'metadata', '')
+        table_extensions = frozenset(TABLE_EXTENSIONS)
+        for path in scan_files(source_dir, skip_hidden=True, cache=self._listing_cache):
+            file = 'source' + path[len(source_dir):]
+            filename = os.path.basename(file)
+            is_table = os.path.splitext(filename)[1].lower() in table_extensions
+
+            if file.startswith(metadata_prefix):
+                if METADATA_TABLE_RE.match(filename):
+                    table_files.append((file, KeyKind.metadata))
+            elif is_table:
+                table_files.append((file, KeyKind.table))
+            else:
+                object_keys.append(file)
+
+        rows = []
+        for file, kind in table_files:
+            stat = os.stat(str(self.data_root / file))
+            rows.append((file, kind.value, stat.st_size, stat.st_mtime_ns))
+        files_df = pd.DataFrame(rows, columns=['file', 'kind', 'size', 'mtime_ns'])
+
+        objects_df = pd.DataFrame({
+            'key': object_keys, 'file': object_keys, 'kind': KeyKind.object.value,
+        })
+
+        return files_df, objects_df
+
+    def _read_table_keys(self, file: str, kind: str) -> pd.DataFrame:
+        df = load_dataframe(self.data_root / file, columns=[0])
+        keys = df[0].dropna().astype(str)
+        return pd.DataFrame({'key': keys, 'file': file, 'kind': kind})
+
+    def _load(self):
+        if not self.exists():
+            self._files_df = _empty_files_df()
+            self._keys_df = _empty_keys_df()
+            return
+
+        self._files_df = pq.read_table(str(self.index_dir / FILES_FILENAME)).to_pandas()
+        self._keys_df = _normalize_keys_df(
+            pq.read_table(str(self.index_dir / KEYS_FILENAME)).to_pandas()
+        )
+
+    def _save(self):
+        os.makedirs(self.index_dir, exist_ok=True)
+        _write_parquet_atomic(self._files_df, self.index_dir / FILES_FILENAME)
+        _write_parquet_atomic(self._keys_df, self.index_dir / KEYS_FILENAME)
+
+
+def _empty_files_df() -> pd.DataFrame:
+    return pd.DataFrame({
+        'file': pd.Series([], dtype=object),
+        'kind': pd.Series([], dtype=object),
+        'size': pd.Series([], dtype=np.int64),
+        'mtime_ns': pd.Series([], dtype=np.int64),
+    })
+
+
+def _empty_keys_df() -> pd.DataFrame:
+    return _normalize_keys_df(pd.DataFrame({
+        'key': pd.Series([], dtype=object),
+        'file': pd.Series([], dtype=object),
+        'kind': pd.Series([], dtype=object),
+    }))
+
+
+def _normalize_keys_df(keys_df: pd.DataFrame) -> pd.DataFrame:
+    # file and kind values repeat a lot, categoricals keep them compact in memory
+    # and are stored dictionary-encoded in parquet
+    return keys_df.astype({'key': object, 'file': 'category', 'kind': 'category'})
+
+
+def _write_parquet_atomic(df: pd.DataFrame, path: Path):
+    tmp_path = path.with_name(f'.{path.name}.tmp')
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), str(tmp_path))
+    os.replace(str(tmp_path), str(path))
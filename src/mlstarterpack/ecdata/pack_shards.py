@@ -0,0 +1,135 @@
+"""Pack objects of a data root into shards readable by data.shards.ShardedDataset"""
+import argparse
+from concurrent import futures
+import itertools
+import os
+from pathlib import Path
+from typing import *
+
+import pandas as pd
+
+from mlstarterpack.data.shards import ShardWriter
+from .root import ECDataRoot, KEY_COLUMN
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        '--data-root', type=Path, required=False, default=Path('data/'),
+        help='Data root with the objects to pack',
+    )
+    parser.add_argument(
+        '--dataset', type=str, action='append', default=None,
+        help=(
+            'Dataset to pack as <annotation>_<split>, can be repeated, '
+            'all datasets by default'
+        ),
+    )
+    parser.add_argument(
+        '--annotations', type=str, nargs='*', default=[],
+        help='Metadata annotations stored along with the objects',
+    )
+    parser.add_argument(
+        '--output-dir', type=Path, required=True,
+        help='Where to store the shards, must not exist',
+    )
+    parser.add_argument(
+        '--shard-size', type=int, required=False, default=1024,
+        help='Approximate size of a shard in MiB',
+    )
+    parser.add_argument(
+        '--jobs', type=int, required=False, default=16,
+        help='Number of object files read concurrently',
+    )
+    return parser.parse_args()
+
+
+def dataset_keys(root: ECDataRoot, dataset_names: Optional[List[str]]) -> pd.DataFrame:
+    dataset_paths = root.dataset_paths()
+    if dataset_names is None:
+        selected = sorted(dataset_paths)
+    else:
+        selected = [_dataset_name(name) for name in dataset_names]
+        missing = [name for name in selected if name not in dataset_paths]
+        if missing:
+            raise ValueError(f'No datasets {missing} in {root.path}')
+
+    keys_df = pd.concat([
+        root.dataset(annotation, split) for annotation, split in selected
+    ] or [pd.DataFrame({KEY_COLUMN: []})], ignore_index=True)
+    return keys_df.drop_duplicates(KEY_COLUMN)
+
+
+def _dataset_name(name: str) -> Tuple[str, str]:
+    annotation, _, split = name.partition('_')
+    return annotation, split
+
+
+def _read_object(path: Path) -> Optional[bytes]:
+    try:
+        with open(str(path), 'rb') as infile:
+            return infile.read()
+    except FileNotFoundError:
+        return None
+
+
+def pack_objects(
+    root: ECDataRoot,
+    records_df: pd.DataFrame,
+    writer: ShardWriter,
+    max_workers: int,
+) -> int:
+    """Write objects of records_df keys with the rest of its columns as metadata.
+
+    :returns: the number of keys without an object file
+    """
+    metadata_columns = [column for column in records_df.columns if column != KEY_COLUMN]
+    rows = records_df.itertuples(index=False, name=None)
+    missing_count = 0
+
+    with futures.ThreadPoolExecutor(max_workers) as executor:
+        # a bounded window of reads keeps memory flat and the shard order stable
+        window = 8 * max_workers
+        while True:
+            batch = list(itertools.islice(rows, window))
+            if not batch:
+                break
+
+            contents = executor.map(_read_object, [root.path / row[0] for row in batch])
+            for row, data in zip(batch, contents):
+                if data is None:
+                    missing_count += 1
+                    continue
+                writer.add(row[0], data, dict(zip(metadata_columns, row[1:])))
+
+            print(f'Packed {len(writer)} objects', end='\r')
+
+    print()
+    return missing_count
+
+
+def main():
+    args = parse_arguments()
+    if args.output_dir.exists():
+        raise RuntimeError('Output directory must not exist')
+
+    root = ECDataRoot(args.data_root)
+    records_df = dataset_keys(root, args.dataset)
+    for name in args.annotations:
+        records_df = records_df.merge(root.annotation(name), on=KEY_COLUMN, how='left')
+    # keys are repeated in annotations by repeated imports, the first value wins
+    records_df = records_df.drop_duplicates(KEY_COLUMN)
+
+    print(f'Packing {len(records_df)} objects...')
+    # the writer moves the shards to the output directory once all are written
+    with ShardWriter(args.output_dir, shard_size=args.shard_size * 2 ** 20) as writer:
+        missing_count = pack_objects(root, records_df, writer, args.jobs)
+
+    if missing_count:
+        print(f'Skipped {missing_count} keys without object files')
+    shard_count = len(list(args.output_dir.glob('shard-*.bin')))
+    print(f'Wrote {len(writer)} objects into {shard_count} shards at {os.fspath(args.output_dir)}')
+
+
+if __name__ == '__main__':
+    main()
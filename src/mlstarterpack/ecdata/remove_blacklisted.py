@@ -1,25 +1,140 @@
 """Remove images in blacklist from all other datasets"""
 import argparse
+from concurrent import futures
+import enum
+import os
 from pathlib import Path
 from typing import *
 
 import pandas as pd
 
+from ._tabular import (
+    CSV_EXTENSIONS,
+    load_dataframe,
+    save_dataframe_atomic,
+    TABLE_EXTENSIONS,
+)
+from .key_index import KeyKind
+from .root import ECDataRoot
+
+
+class ObjectAction(enum.Enum):
+    keep = 'keep'
+    delete = 'delete'
+    quarantine = 'quarantine'
+
+    def __str__(self):
+        return self.value
+
 
 def parse_arguments():
     parser = argparse.ArgumentParser()
     parser.add_argument('dataset_dir', type=str, default='data/datasets/')
     parser.add_argument('blacklist', type=str)
-    return parser.parse_args()
+    parser.add_argument(
+        '--data-root', type=Path, required=False, default=None,
+        help=(
+            'Data root of the datasets. When passed, its key index is used to skip '
+            'unaffected datasets, and metadata tables are filtered as well'
+        ),
+    )
+    parser.add_argument(
+        '--objects', type=ObjectAction, required=False, default=ObjectAction.keep,
+        choices=list(ObjectAction),
+        help='What to do with blacklisted object files, requires --data-root',
+    )
+    parser.add_argument(
+        '--quarantine-dir', type=Path, required=False, default=None,
+        help='Where to move quarantined objects, <data-root>/quarantine/ by default',
+    )
+    parser.add_argument(
+        '--jobs', type=int, required=False, default=None,
+        help='Number of tables filtered concurrently',
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, required=False, default=1_000_000,
+        help='Number of rows of csv tables processed at once',
+    )
+    args = parser.parse_args()
 
+    if args.objects is not ObjectAction.keep and args.data_root is None:
+        parser.error('--objects requires --data-root')
+    if args.data_root is not None:
+        try:
+            Path(args.dataset_dir).resolve().relative_to(args.data_root.resolve())
+        except ValueError:
+            parser.error(
+                f'dataset_dir {args.dataset_dir} is not under --data-root {args.data_root}'
+            )
+    return args
+
+
+def load_blacklist(path: Path) -> pd.Index:
+    blacklist = pd.read_csv(
+        path, header=None, names=['image_name'], dtype=str, keep_default_na=False,
+    )
+    return pd.Index(blacklist.image_name.unique())
 
-def load_dataset(path):
-    return list(pd.read_csv(path, header=None, names=['image_name']).image_name)
 
+def filter_table(path: Path, blacklist: pd.Index, chunk_size: int) -> int:
+    """Remove rows with blacklisted keys from a table.
 
-def save_dataset(image_names: List[str], path):
-    images_df = pd.DataFrame({'image_name': image_names})
-    images_df.to_csv(path, index=False, header=False)
+    The table is replaced atomically and only if any rows were removed.
+
+    :returns: the number of removed rows
+    """
+    if path.suffix.lower() not in CSV_EXTENSIONS:
+        df = load_dataframe(path)
+        mask = df.iloc[:, 0].astype(str).isin(blacklist)
+        removed_count = int(mask.sum())
+        if removed_count:
+            save_dataframe_atomic(df[~mask], path)
+        return removed_count
+
+    if path.stat().st_size == 0:
+        return 0
+
+    # csv tables are streamed, and all values are kept as strings
+    # so that the rows that are kept are written back unchanged
+    tmp_path = path.with_name(f'.{path.stem}.tmp{path.suffix}')
+    removed_count = 0
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as outfile:
+            reader = pd.read_csv(
+                path, header=None, dtype=str, keep_default_na=False, chunksize=chunk_size,
+            )
+            for chunk in reader:
+                mask = chunk[0].isin(blacklist)
+                removed_count += int(mask.sum())
+                chunk[~mask].to_csv(outfile, header=None, index=False)
+
+        if removed_count:
+            os.replace(str(tmp_path), str(path))
+    finally:
+        if tmp_path.exists():
+            os.unlink(str(tmp_path))
+
+    return removed_count
+
+
+def remove_objects(
+    data_root: Path,
+    keys: Iterable[str],
+    action: ObjectAction,
+    quarantine_dir: Path,
+) -> int:
+    count = 0
+    for key in keys:
+        object_path = data_root / key
+        if action is ObjectAction.delete:
+            os.unlink(str(object_path))
+        elif action is ObjectAction.quarantine:
+            os.renames(str(object_path), str(quarantine_dir / key))
+        else:
+            raise RuntimeError()
+        count += 1
+
+    return count
 
 
 def main():
@@ -27,22 +142,42 @@ def main():
     dataset_dir = Path(args.dataset_dir)
     blacklist_path = Path(args.blacklist)
 
-    blacklist_names = list(
-        pd.read_csv(blacklist_path, header=None, names=['image_name'])
-        .image_name
-    )
+    blacklist = load_blacklist(blacklist_path)
 
-    for dataset_path in dataset_dir.glob('*.csv'):
-        dataset = load_dataset(dataset_path)
-
-        filtered_dataset = [
-            name
-            for name in dataset
-            if name not in blacklist_names
+    table_paths = [
+        path for path in dataset_dir.iterdir()
+        if path.is_file() and path.suffix.lower() in TABLE_EXTENSIONS
+    ]
+    if args.data_root is not None:
+        root = ECDataRoot(args.data_root)
+        key_index = root.key_index
+        key_index.refresh()
+        affected_files = frozenset(
+            key_index.lookup(blacklist, KeyKind.dataset, KeyKind.metadata)
+            .file.astype(str)
+        )
+        table_paths = [
+            path for path in table_paths
+            if str(path.resolve().relative_to(args.data_root.resolve())) in affected_files
         ]
+        table_paths.extend(
+            path for path in root.metadata_paths().values()
+            if str(path.relative_to(args.data_root)) in affected_files
+        )
+
+    with futures.ThreadPoolExecutor(args.jobs) as executor:
+        removed_counts = executor.map(
+            lambda path: filter_table(path, blacklist, args.chunk_size),
+            table_paths,
+        )
+        for table_path, removed_count in zip(table_paths, removed_counts):
+            print(f'{table_path}: {removed_count} images removed')
 
-        save_dataset(filtered_dataset, dataset_path)
-        print(f'{len(dataset) - len(filtered_dataset)} images removed')
+    if args.objects is not ObjectAction.keep:
+        quarantine_dir = args.quarantine_dir or args.data_root / 'quarantine'
+        object_keys = key_index.lookup(blacklist, KeyKind.object).key
+        count = remove_objects(args.data_root, object_keys, args.objects, quarantine_dir)
+        print(f'{count} object files processed ({args.objects})')
 
 
 if __name__ == '__main__':
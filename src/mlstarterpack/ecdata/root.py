@@ -0,0 +1,208 @@
+"""In-process access to an ecdata data root"""
+import os
+from pathlib import Path
+import threading
+from typing import *
+
+import pandas as pd
+
+from mlstarterpack.filescan import ListingCache, scan_files
+from ._tabular import load_dataframe, table_format_rank, TABLE_EXTENSIONS
+from .key_index import KeyIndex
+from .utils import DATASET_TABLE_RE, METADATA_TABLE_RE
+
+
+KEY_COLUMN = 'key'
+
+
+class ECDataRoot:
+    """A data root with lazily loaded tables.
+
+    Loaded tables are cached and reloaded only when the file's size or mtime changes,
+    so a root can be shared by tools and training code running in the same process.
+    Frames returned by this class are shared by all callers and must not be modified.
+    """
+
+    def __init__(self, path: Union[str, os.PathLike]):
+        self.path = Path(path)
+
+        self._listing_cache = ListingCache()
+        # (path, variant) -> ((size, mtime), frame)
+        self._table_cache: Dict[Tuple[Path, tuple], Tuple[tuple, pd.DataFrame]] = {}
+        self._lock = threading.Lock()
+        self._key_index: Optional[KeyIndex] = None
+
+    def __repr__(self):
+        return f'{type(self).__name__}({str(self.path)!r})'
+
+    @property
+    def datasets_dir(self) -> Path:
+        return self.path / 'datasets'
+
+    @property
+    def source_dir(self) -> Path:
+        return self.path / 'source'
+
+    @property
+    def metadata_dir(self) -> Path:
+        return self.path / 'source/metadata'
+
+    @property
+    def key_index(self) -> KeyIndex:
+        if self._key_index is None:
+            self._key_index = KeyIndex(self.path)
+        return self._key_index
+
+    def dataset_paths(self) -> Dict[Tuple[str, str], Path]:
+        """Dataset tables by (annotation name, split name).
+
+        A table stored in several formats is read from the preferred one,
+        see _tabular.TABLE_FORMAT_PREFERENCE.
+        """
+        return _preferred_tables(
+            (_dataset_name(path), path)
+            for path in self._scan(self.datasets_dir, pattern=DATASET_TABLE_RE)
+        )
+
+    def metadata_paths(self) -> Dict[str, Path]:
+        """Metadata tables by annotation name, see dataset_paths for multiple formats"""
+        return _preferred_tables(
+            (_stem(path), path)
+            for path in self._scan(self.metadata_dir, pattern=METADATA_TABLE_RE)
+        )
+
+    def source_table_paths(self) -> List[Path]:
+        """Tables with tabular source data"""
+        return [
+            Path(path)
+            for path in self._scan(
+                self.source_dir, extensions=TABLE_EXTENSIONS, exclude_dirs=[self.metadata_dir],
+            )
+        ]
+
+    def annotations(self) -> List[str]:
+        return sorted(self.metadata_paths())
+
+    def splits(self, annotation: str) -> List[str]:
+        return sorted(
+            split
+            for dataset_annotation, split in self.dataset_paths()
+            if dataset_annotation == annotation
+        )
+
+    def table(self, path: Path, columns: Optional[Sequence[int]] = None) -> pd.DataFrame:
+        """Load a headerless table, reusing the cached frame if the file didn't change"""
+        column_tuple = None if columns is None else tuple(columns)
+        return self._cached(
+            Path(path), ('table', column_tuple),
+            lambda: load_dataframe(Path(path), columns=columns),
+        )
+
+    def dataset(self, annotation: str, split: str) -> pd.DataFrame:
+        """Keys of a split as a frame with a single key column"""
+        try:
+            path = self.dataset_paths()[(annotation, split)]
+        except KeyError:
+            raise KeyError(f'No dataset {annotation}_{split} in {self.path}') from None
+
+        return self._cached(path, ('dataset',), lambda: pd.DataFrame({
+            KEY_COLUMN: load_dataframe(path, columns=[0])[0].astype(str),
+        }))
+
+    def annotation(self, name: str) -> pd.DataFrame:
+        """Metadata table with a key column followed by annotation columns.
+
+        A single annotation column is named after the annotation,
+        multiple columns are named <annotation>_1, <annotation>_2 etc.
+        """
+        try:
+            path = self.metadata_paths()[name]
+        except KeyError:
+            raise KeyError(f'No annotation {name} in {self.path}') from None
+
+        def load():
+            df = load_dataframe(path)
+            value_columns = list(df.columns[1:])
+            if len(value_columns) == 1:
+                names = [name]
+            else:
+                names = [f'{name}_{column}' for column in value_columns]
+
+            result = df.iloc[:, 1:].copy()
+            result.columns = names
+            result.insert(0, KEY_COLUMN, df.iloc[:, 0].astype(str))
+            return result
+
+        return self._cached(path, ('annotation',), load)
+
+    def join(
+        self,
+        annotation: str,
+        split: str,
+        annotations: Optional[Iterable[str]] = None,
+        how: str = 'left',
+    ) -> pd.DataFrame:
+        """Join a split with metadata annotations on the key column.
+
+        :param annotations: annotations to attach, the split's own annotation by default
+        :param how: 'left' keeps keys without annotations, 'inner' drops them
+        """
+        if annotations is None:
+            annotations = [annotation]
+
+        result = self.dataset(annotation, split)
+        for name in annotations:
+            result = result.merge(self.annotation(name), on=KEY_COLUMN, how=how)
+        return result
+
+    def invalidate(self):
+        """Forget all cached tables and listings"""
+        with self._lock:
+            self._table_cache.clear()
+            self._listing_cache.clear()
+        self._key_index = None
+
+    def _cached(
+        self,
+        path: Path,
+        variant: tuple,
+        load: Callable[[], pd.DataFrame],
+    ) -> pd.DataFrame:
+        stat = os.stat(str(path))
+        signature = (stat.st_size, stat.st_mtime_ns)
+        cache_key = (path, variant)
+
+        with self._lock:
+            cached = self._table_cache.get(cache_key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        df = load()
+        with self._lock:
+            self._table_cache[cache_key] = (signature, df)
+        return df
+
+    def _scan(self, where: Path, **kwargs) -> List[str]:
+        return list(scan_files(where, skip_hidden=True, cache=self._listing_cache, **kwargs))
+
+
+N = TypeVar('N')  # pylint: disable=invalid-name
+
+
+def _preferred_tables(named_paths: Iterable[Tuple[N, str]]) -> Dict[N, Path]:
+    result: Dict[N, Path] = {}
+    # ties between extensions of the same format go to the path sorting first
+    for name, path in sorted(
+        named_paths, key=lambda named_path: (table_format_rank(named_path[1]), named_path[1]),
+    ):
+        result.setdefault(name, Path(path))
+    return result
+
+
+def _dataset_name(path: str) -> Tuple[str, str]:
+    annotation, split = _stem(path).split('_')
+    return annotation, split
+
+
+def _stem(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
@@ -1,16 +1,26 @@
 import argparse
+import enum
 import os
 from pathlib import Path
 import shutil
+from typing import *
 
+import numpy as np
 import pandas as pd
 
-from ._tabular import TABLE_EXTENSIONS
-from .utils import (
-    create_minimal_data_dirs,
-    find_dataset_csvs,
-    find_metadata_csvs,
-)
+from ._tabular import iter_dataframe_chunks, save_dataframe
+from .key_index import KeyKind
+from .root import ECDataRoot, KEY_COLUMN
+from .transfer import add_transfer_arguments, transferer_from_args
+from .utils import create_minimal_data_dirs
+
+
+class SamplingMethod(enum.Enum):
+    hash = 'hash'
+    random = 'random'
+
+    def __str__(self):
+        return self.value
 
 
 def parse_arguments():
@@ -23,6 +33,30 @@ def parse_arguments():
         '--min-per-dataset', type=int, required=False, default=10,
         help='Keep at least this many samples from each dataset',
     )
+    parser.add_argument(
+        '--method', type=SamplingMethod, required=False, default=SamplingMethod.hash,
+        choices=list(SamplingMethod),
+        help=(
+            'hash: select keys by a seeded hash of the key, so that the selection is '
+            'reproducible and consistent between datasets; random: sample each dataset '
+            'independently'
+        ),
+    )
+    parser.add_argument(
+        '--seed', type=int, required=False, default=0,
+        help='Seed of the key hash or of the random sampling',
+    )
+    parser.add_argument(
+        '--stratify-by', type=str, required=False, default=None,
+        help=(
+            'Name of a metadata annotation, the fraction is then applied to each '
+            'of its values separately'
+        ),
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, required=False, default=1_000_000,
+        help='Number of dataset rows processed at once',
+    )
     parser.add_argument(
         '--input-data-root', type=Path, required=False, default=Path('data/'),
         help='Input dataset',
@@ -31,15 +65,147 @@ def parse_arguments():
         '--output-data-root', type=Path, required=True,
         help='Where to store resulting dataset',
     )
+    add_transfer_arguments(parser)
     return parser.parse_args()
 
 
-def downsample_dataset(df: pd.DataFrame, fraction: float, min_count: int) -> pd.DataFrame:
+def downsample_dataset(
+    df: pd.DataFrame,
+    fraction: float,
+    min_count: int,
+    seed: Optional[int] = None,
+) -> pd.DataFrame:
     count_by_fraction = len(df) * fraction
     if count_by_fraction < min_count:
-        return df.sample(n=min_count)
+        return df.sample(n=min(min_count, len(df)), random_state=seed)
     else:
-        return df.sample(frac=fraction)
+        return df.sample(frac=fraction, random_state=seed)
+
+
+def key_hashes(keys: pd.Series, seed: int) -> np.ndarray:
+    """Stable uint64 hashes of keys, uniformly distributed for a given seed"""
+    hash_key = f'{seed % 10 ** 16:016d}'
+    return pd.util.hash_array(keys.astype(str).to_numpy(dtype=object), hash_key=hash_key)
+
+
+def hash_threshold(fraction: float) -> np.uint64:
+    return np.uint64(min(int(fraction * 2 ** 64), 2 ** 64 - 1))
+
+
+def hash_downsample_chunks(
+    chunks: Iterable[pd.DataFrame],
+    fraction: float,
+    min_count: int,
+    seed: int,
+) -> pd.DataFrame:
+    """Keep rows whose key hash falls below the fraction of the hash range.
+
+    Rows are processed chunk by chunk, only the selected rows and
+    min_count rows with the smallest hashes are kept in memory.
+    If fewer than min_count rows are selected, the min_count rows
+    with the smallest hashes are returned instead.
+    """
+    threshold = hash_threshold(fraction)
+    selected_parts = []
+    smallest_df: Optional[pd.DataFrame] = None
+    for chunk in chunks:
+        hashes = key_hashes(chunk[0], seed)
+        selected_parts.append(chunk[hashes < threshold])
+
+        candidates_df = chunk.assign(_hash=hashes)
+        if smallest_df is not None:
+            candidates_df = pd.concat([smallest_df, candidates_df])
+        smallest_df = candidates_df.nsmallest(min_count, '_hash')
+
+    if smallest_df is None:
+        return pd.DataFrame()
+
+    selected_df = pd.concat(selected_parts)
+    if len(selected_df) < min_count:
+        return smallest_df.sort_index().drop(columns='_hash')
+    return selected_df
+
+
+def hash_downsample_stratified(
+    df: pd.DataFrame,
+    strata: pd.Series,
+    fraction: float,
+    min_count: int,
+    seed: int,
+) -> pd.DataFrame:
+    """Keep the same fraction of rows in each stratum, picking the smallest key hashes"""
+    # missing annotations become a separate 'nan' stratum
+    ranked_df = df.assign(
+        _hash=key_hashes(df[0], seed),
+        _stratum=strata.astype(str).to_numpy(),
+    )
+    ranked_df = ranked_df.sort_values('_hash')
+    ranks = ranked_df.groupby('_stratum').cumcount()
+    stratum_sizes = ranked_df.groupby('_stratum')['_hash'].transform('size')
+
+    result_df = ranked_df[ranks < np.ceil(stratum_sizes * fraction)]
+    if len(result_df) < min_count:
+        result_df = ranked_df.iloc[:min_count]
+
+    return result_df.sort_index().drop(columns=['_hash', '_stratum'])
+
+
+def load_strata(root: ECDataRoot, annotation: str) -> pd.Series:
+    """Values of a single-column annotation by key, the first value of a repeated key wins"""
+    if annotation not in root.metadata_paths():
+        raise ValueError(f'No annotation {annotation} to stratify by in {root.path}')
+
+    annotation_df = root.annotation(annotation)
+    if len(annotation_df.columns) != 2:
+        raise ValueError(
+            f'Cannot stratify by {annotation}, it has {len(annotation_df.columns) - 1} '
+            f'value columns instead of one'
+        )
+
+    strata = annotation_df.set_index(KEY_COLUMN)[annotation]
+    # keys are repeated by repeated imports, mapping by a non-unique index fails
+    return strata[~strata.index.duplicated()]
+
+
+def sample_dataset(
+    args,
+    root: ECDataRoot,
+    dataset_path: Path,
+    strata: Optional[pd.Series],
+) -> pd.DataFrame:
+    if args.method is SamplingMethod.random:
+        return downsample_dataset(
+            root.table(dataset_path), args.fraction, args.min_per_dataset, args.seed,
+        )
+
+    if strata is not None:
+        df = root.table(dataset_path)
+        return hash_downsample_stratified(
+            df, df[0].astype(str).map(strata),
+            args.fraction, args.min_per_dataset, args.seed,
+        )
+
+    # streamed instead of loading through the root, large datasets don't fit in memory
+    return hash_downsample_chunks(
+        iter_dataframe_chunks(dataset_path, args.chunk_size),
+        args.fraction, args.min_per_dataset, args.seed,
+    )
+
+
+def existing_object_keys(root: ECDataRoot, keys: Set[str]) -> List[str]:
+    """Keys of object files among keys, looked up in the key index if the root has one"""
+    if root.key_index.exists():
+        return list(root.key_index.lookup(keys, KeyKind.object).key)
+
+    # without an index the selected keys are checked directly,
+    # building one would walk the whole source tree
+    return [key for key in keys if os.path.isfile(root.path / key)]
+
+
+def source_table_paths(root: ECDataRoot) -> List[Path]:
+    if root.key_index.exists():
+        return root.key_index.files(KeyKind.table)
+    return root.source_table_paths()
 
 
 def main():  # pylint: disable=too-many-locals
@@ -47,44 +213,61 @@ def main():  # pylint: disable=too-many-locals
 
     if args.output_data_root.exists():
         raise RuntimeError('Output directory must not exist')
+
+    root = ECDataRoot(args.input_data_root)
+    if root.key_index.exists():
+        print('Updating key index...')
+        root.key_index.refresh()
+
+    # validated before any output is created
+    strata = None
+    if args.stratify_by is not None:
+        strata = load_strata(root, args.stratify_by)
+
     create_minimal_data_dirs(args.output_data_root)
 
     print('Sampling datasets...')
-    remaining_object_names = set()
-    for dataset_csv_path in find_dataset_csvs(args.input_data_root / 'datasets'):
-        input_df = pd.read_csv(dataset_csv_path, header=None)
-        downsampled_df = downsample_dataset(input_df, args.fraction, args.min_per_dataset)
+    remaining_object_names: Set[str] = set()
+    for dataset_path in root.dataset_paths().values():
+        downsampled_df = sample_dataset(args, root, dataset_path, strata)
 
-        relative_path = dataset_csv_path.relative_to(args.input_data_root)
+        relative_path = dataset_path.relative_to(args.input_data_root)
         downsampled_path = args.output_data_root / relative_path
-        downsampled_df.to_csv(downsampled_path, header=None, index=False)
+        os.makedirs(downsampled_path.parent, exist_ok=True)
+        save_dataframe(downsampled_df, downsampled_path)
+
+        if len(downsampled_df):
+            remaining_object_names.update(downsampled_df[0].astype(str))
 
-        remaining_object_names.update(downsampled_df[0])
+    remaining_keys = pd.Index(list(remaining_object_names))
 
     print('Copying metadata...')
-    for metadata_csv_path in find_metadata_csvs(args.input_data_root / 'source/metadata'):
-        df = pd.read_csv(metadata_csv_path, header=None)
-        downsampled_df = df[df[0].isin(remaining_object_names)]
+    for metadata_path in root.metadata_paths().values():
+        downsampled_df = pd.concat([
+            chunk[chunk[0].astype(str).isin(remaining_keys)]
+            for chunk in iter_dataframe_chunks(metadata_path, args.chunk_size)
+        ] or [pd.DataFrame()])
 
-        relative_path = metadata_csv_path.relative_to(args.input_data_root)
+        relative_path = metadata_path.relative_to(args.input_data_root)
         downsampled_path = args.output_data_root / relative_path
-        downsampled_df.to_csv(downsampled_path, header=None, index=False)
+        os.makedirs(downsampled_path.parent, exist_ok=True)
+        save_dataframe(downsampled_df, downsampled_path)
 
     print('Copying source data...')
-    for dirpath, _dirnames, filenames in os.walk(args.input_data_root / 'source/'):
-        if Path(dirpath).relative_to(args.input_data_root) == Path('source/metadata/'):
-            continue
-
-        for filename in filenames:
-            file_path = Path(dirpath) / filename
-            file_name = file_path.relative_to(args.input_data_root)
-            new_file_path = args.output_data_root / file_name
-
-            if (
-                file_path.suffix.lower() in TABLE_EXTENSIONS
-                or str(file_name) in remaining_object_names
-            ):
-                shutil.copy(file_path, new_file_path)
+    # tables can later be appended to in place, so they are never linked
+    for table_path in source_table_paths(root):
+        relative_path = table_path.relative_to(args.input_data_root)
+        new_table_path = args.output_data_root / relative_path
+        os.makedirs(new_table_path.parent, exist_ok=True)
+        shutil.copy(table_path, new_table_path)
+
+    # objects are found by their keys, so no source tree walk is needed
+    object_keys = existing_object_keys(root, remaining_object_names)
+    stats = transferer_from_args(args).transfer(
+        (args.input_data_root / key, args.output_data_root / key)
+        for key in object_keys
+    )
+    print(f'Transferred {stats}')
 
     print('Done')
 
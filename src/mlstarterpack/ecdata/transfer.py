@@ -0,0 +1,288 @@
+"""Parallel file transfer used to populate data roots"""
+import argparse
+from collections import deque
+from concurrent import futures
+from dataclasses import dataclass
+import enum
+import errno
+import hashlib
+import os
+from pathlib import Path
+import shutil
+import time
+from typing import *
+
+
+HASH_CHUNK_SIZE = 2 ** 20
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+# errors meaning that a link can't be created between these paths,
+# but a plain copy will still work
+LINK_FALLBACK_ERRNOS = frozenset({
+    errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EINVAL, errno.ENOTTY,
+    errno.EOPNOTSUPP, errno.ENOTSUP,
+})
+
+
+class TransferMode(enum.Enum):
+    copy = 'copy'
+    hardlink = 'hardlink'
+    symlink = 'symlink'
+    reflink = 'reflink'
+
+    def __str__(self):
+        return self.value
+
+
+@dataclass
+class TransferStats:
+    files: int = 0
+    bytes: int = 0
+    fallbacks: int = 0
+    duplicates: int = 0
+    elapsed: float = 0.0
+
+    @property
+    def files_per_second(self) -> float:
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        result = (
+            f'{self.files} files, {self.bytes / 2 ** 20:.1f} MiB in {self.elapsed:.1f}s '
+            f'({self.files_per_second:.1f} files/s, '
+            f'{self.bytes_per_second / 2 ** 20:.1f} MiB/s)'
+        )
+        if self.fallbacks:
+            result += f', {self.fallbacks} copied instead of linked'
+        if self.duplicates:
+            result += f', {self.duplicates} duplicates skipped'
+        return result
+
+
+# Called with the content hash and the target path of a file before it's placed
+# at the target, returns whether to place it or skip it as a duplicate
+ContentClaim = Callable[[str, Path], bool]
+# Called with the same arguments when placing a claimed file failed
+ContentRelease = Callable[[str, Path], None]
+
+
+def content_hash():
+    return hashlib.blake2b()
+
+
+def hash_file(path: Path) -> str:
+    hasher = content_hash()
+    with open(str(path), 'rb') as infile:
+        for chunk in iter(lambda: infile.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _copy_hashing(source_path: Path, target_path: Path) -> Tuple[int, str]:
+    hasher = content_hash()
+    size = 0
+    with open(str(source_path), 'rb') as infile, open(str(target_path), 'wb') as outfile:
+        for chunk in iter(lambda: infile.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+            outfile.write(chunk)
+            size += len(chunk)
+    shutil.copymode(str(source_path), str(target_path))
+    return size, hasher.hexdigest()
+
+
+class FileTransferer:
+    def __init__(
+        self,
+        mode: TransferMode = TransferMode.copy,
+        max_workers: Optional[int] = None,
+        report_interval: Optional[float] = None,
+    ):
+        self.mode = mode
+        self.max_workers = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.report_interval = report_interval
+
+        self._created_dirs: Set[Path] = set()
+
+    def transfer(
+        self,
+        jobs: Iterable[Tuple[Path, Path]],
+        claim: Optional[ContentClaim] = None,
+        release: Optional[ContentRelease] = None,
+    ) -> TransferStats:
+        """Transfer (source, target) file pairs using a thread pool.
+
+        :param claim: if passed, files are hashed while being transferred
+            and the claim decides whether each of them is placed at the target
+        :param release: undoes a claim of a file that failed to be placed
+        """
+        stats = TransferStats()
+        start_time = time.monotonic()
+        last_report_time = start_time
+
+        def account(future: futures.Future):
+            nonlocal last_report_time
+
+            size, fell_back, duplicate = future.result()
+            stats.files += 1
+            stats.bytes += size
+            stats.fallbacks += fell_back
+            stats.duplicates += duplicate
+            stats.elapsed = time.monotonic() - start_time
+
+            if (
+                self.report_interval is not None
+                and time.monotonic() - last_report_time >= self.report_interval
+            ):
+                last_report_time = time.monotonic()
+                print(f'  {stats}')
+
+        with futures.ThreadPoolExecutor(self.max_workers) as executor:
+            # bound the number of pending jobs so that lazy job iterables
+            # don't get materialized in memory
+            pending: Deque[futures.Future] = deque()
+            for source_path, target_path in jobs:
+                if len(pending) >= self.max_workers * 4:
+                    account(pending.popleft())
+                pending.append(
+                    executor.submit(self.transfer_one, source_path, target_path, claim, release)
+                )
+
+            while pending:
+                account(pending.popleft())
+
+        stats.elapsed = time.monotonic() - start_time
+        return stats
+
+    def transfer_one(
+        self,
+        source_path: Path,
+        target_path: Path,
+        claim: Optional[ContentClaim] = None,
+        release: Optional[ContentRelease] = None,
+    ) -> Tuple[int, bool, bool]:
+        """Transfer a single file.
+
+        :returns: the size of the file, whether a copy was made instead of a link
+            and whether the file was skipped as a duplicate
+        """
+        self._ensure_dir(target_path.parent)
+        if claim is None:
+            return (*self._place(source_path, target_path), False)
+
+        if self.mode is TransferMode.copy:
+            # the file is read only once: hashed while copied to a temporary file
+            tmp_path = target_path.with_name(f'.{target_path.name}.part')
+            try:
+                size, digest = _copy_hashing(source_path, tmp_path)
+                if not claim(digest, target_path):
+                    return size, False, True
+                _place_claimed(
+                    lambda: os.replace(str(tmp_path), str(target_path)),
+                    digest, target_path, release,
+                )
+            finally:
+                if tmp_path.exists():
+                    os.unlink(str(tmp_path))
+            return size, False, False
+
+        digest = hash_file(source_path)
+        if not claim(digest, target_path):
+            return os.stat(str(source_path)).st_size, False, True
+        size, fell_back = _place_claimed(
+            lambda: self._place(source_path, target_path), digest, target_path, release,
+        )
+        return size, fell_back, False
+
+    def _place(self, source_path: Path, target_path: Path) -> Tuple[int, bool]:
+        if self.mode is TransferMode.copy:
+            shutil.copy(str(source_path), str(target_path))
+            return os.stat(str(target_path)).st_size, False
+
+        size = os.stat(str(source_path)).st_size
+        try:
+            if self.mode is TransferMode.hardlink:
+                os.link(str(source_path), str(target_path))
+            elif self.mode is TransferMode.symlink:
+                os.symlink(os.path.abspath(str(source_path)), str(target_path))
+            elif self.mode is TransferMode.reflink:
+                _reflink(source_path, target_path)
+            else:
+                raise RuntimeError()
+        except OSError as exc:
+            if exc.errno not in LINK_FALLBACK_ERRNOS:
+                raise
+            shutil.copy(str(source_path), str(target_path))
+            return size, True
+
+        return size, False
+
+    def _ensure_dir(self, dirname: Path):
+        if dirname in self._created_dirs:
+            return
+
+        os.makedirs(str(dirname), exist_ok=True)
+        self._created_dirs.add(dirname)
+
+
+R = TypeVar('R')  # pylint: disable=invalid-name
+
+
+def _place_claimed(
+    place: Callable[[], R],
+    digest: str,
+    target_path: Path,
+    release: Optional[ContentRelease],
+) -> R:
+    try:
+        return place()
+    except BaseException:
+        # the claimed content must not be attributed to a file that doesn't exist
+        if release is not None:
+            release(digest, target_path)
+        raise
+
+
+def _reflink(source_path: Path, target_path: Path):
+    try:
+        import fcntl  # pylint: disable=import-outside-toplevel
+    except ImportError as exc:
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported') from exc
+
+    with open(str(source_path), 'rb') as infile, open(str(target_path), 'wb') as outfile:
+        try:
+            fcntl.ioctl(outfile.fileno(), FICLONE, infile.fileno())
+        except OSError:
+            outfile.close()
+            os.unlink(str(target_path))
+            raise
+
+    shutil.copymode(str(source_path), str(target_path))
+
+
+def add_transfer_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--transfer-mode', type=TransferMode, required=False, default=TransferMode.copy,
+        choices=list(TransferMode),
+        help=(
+            'How to transfer object files: copy, hardlink, symlink or reflink. '
+            'Links fall back to copying when not possible'
+        ),
+    )
+    parser.add_argument(
+        '--transfer-jobs', type=int, required=False, default=None,
+        help='Number of threads transferring files',
+    )
+
+
+def transferer_from_args(args: argparse.Namespace) -> FileTransferer:
+    return FileTransferer(
+        mode=args.transfer_mode,
+        max_workers=args.transfer_jobs,
+        report_interval=10.0,
+    )
@@ -1,9 +1,10 @@
-import os
 import re
 from pathlib import Path
 from typing import *
 
 import mlstarterpack as mlsp
+from mlstarterpack.filescan import scan_files
+from ._tabular import TABLE_EXTENSIONS
 
 
 DATA_DIR_STRUCTURE: Dict[str, dict] = {
@@ -15,6 +16,13 @@ DATA_DIR_STRUCTURE: Dict[str, dict] = {
 }
 
 
+_TABLE_EXTENSION_RE = '|'.join(re.escape(extension) for extension in TABLE_EXTENSIONS)
+METADATA_TABLE_RE = re.compile(rf'^[a-zA-Z0-9]+({_TABLE_EXTENSION_RE})$', re.IGNORECASE)
+DATASET_TABLE_RE = re.compile(
+    rf'^[a-zA-Z0-9]+_[a-zA-Z0-9]+({_TABLE_EXTENSION_RE})$', re.IGNORECASE,
+)
+
+
 def create_minimal_data_dirs(data_dir: Path):
     mlsp.dirs.prepare_directory(
         data_dir,
@@ -24,22 +32,12 @@ def create_minimal_data_dirs(data_dir: Path):
 
 
 def find_metadata_csvs(where: Path) -> Iterable[Path]:
-    for dirpath, _dirnames, filenames in os.walk(str(where)):
-        for filename in filenames:
-            file_path = Path(dirpath) / filename
-
-            if not re.match(r'^[a-zA-Z0-9]+\.csv$', filename):
-                continue
-
-            yield file_path
+    """Find metadata tables: csv, parquet or feather files named <annotationname>"""
+    for file_path in scan_files(where, pattern=METADATA_TABLE_RE):
+        yield Path(file_path)
 
 
 def find_dataset_csvs(where: Path) -> Iterable[Path]:
-    for dirpath, _dirnames, filenames in os.walk(str(where)):
-        for filename in filenames:
-            file_path = Path(dirpath) / filename
-
-            if not re.match(r'^[a-zA-Z0-9]+_[a-zA-Z0-9]+\.csv$', filename):
-                continue
-
-            yield file_path
+    """Find dataset tables: csv, parquet or feather files named <annotationname>_<splitname>"""
+    for file_path in scan_files(where, pattern=DATASET_TABLE_RE):
+        yield Path(file_path)
@@ -0,0 +1,168 @@
+"""Integrity verification of image object files
+
+Verification results are cached in `<root>/.ecdata/verify_cache.parquet`
+per (key, size, mtime), so only new or changed files are verified again.
+"""
+from concurrent import futures
+from dataclasses import asdict, dataclass, field
+import enum
+import json
+import os
+from pathlib import Path
+import time
+from typing import *
+
+import pandas as pd
+from PIL import Image
+
+from ._tabular import load_dataframe, save_dataframe_atomic
+
+
+VERIFY_CACHE_PATH = Path('.ecdata/verify_cache.parquet')
+
+
+class VerifyLevel(enum.IntEnum):
+    # open the file and validate its structure without decoding pixel data
+    header = 1
+    # fully decode the image, catches truncated and corrupt data
+    decode = 2
+
+    def __str__(self):
+        return self.name
+
+
+@dataclass
+class VerifyFailure:
+    key: str
+    error: str
+
+
+@dataclass
+class VerifyReport:
+    level: str
+    files: int = 0
+    cached: int = 0
+    verified_bytes: int = 0
+    elapsed: float = 0.0
+    failures: List[VerifyFailure] = field(default_factory=list)
+
+    @property
+    def verified(self) -> int:
+        return self.files - self.cached
+
+    def summary(self) -> str:
+        files_per_second = self.verified / self.elapsed if self.elapsed else 0.0
+        bytes_per_second = self.verified_bytes / self.elapsed if self.elapsed else 0.0
+        return (
+            f'{self.files} files ({self.cached} cached), {self.verified} verified '
+            f'in {self.elapsed:.1f}s ({files_per_second:.1f} files/s, '
+            f'{bytes_per_second / 2 ** 20:.1f} MiB/s), {len(self.failures)} failed'
+        )
+
+    def to_file(self, path: Path):
+        data = asdict(self)
+        data['verified'] = self.verified
+        with open(str(path), 'w', encoding='utf-8') as outfile:
+            json.dump(data, outfile, indent=2)
+
+
+def verify_image(path: str, level: VerifyLevel) -> Optional[str]:
+    """Return a description of the problem with an image, or None if it's fine"""
+    try:
+        with Image.open(path) as image:
+            if level >= VerifyLevel.decode:
+                image.load()
+            else:
+                image.verify()
+    except Exception as exc:  # pylint: disable=broad-except
+        return f'{type(exc).__name__}: {exc}'
+
+    return None
+
+
+def _verify_images(paths: List[str], level: VerifyLevel) -> List[Optional[str]]:
+    return [verify_image(path, level) for path in paths]
+
+
+class VerifyCache:
+    def __init__(self, data_root: Path):
+        self.path = Path(data_root) / VERIFY_CACHE_PATH
+
+        if self.path.exists():
+            self.df = load_dataframe(self.path)
+        else:
+            self.df = pd.DataFrame({
+                'key': pd.Series([], dtype=object),
+                'size': pd.Series([], dtype='int64'),
+                'mtime_ns': pd.Series([], dtype='int64'),
+                'level': pd.Series([], dtype='int64'),
+                'error': pd.Series([], dtype=object),
+            })
+
+    def lookup(self, files_df: pd.DataFrame, level: VerifyLevel) -> pd.DataFrame:
+        """Return cached results for files (key, size, mtime_ns) still up to date"""
+        cached_df = files_df.merge(self.df, on=['key', 'size', 'mtime_ns'], how='inner')
+        return cached_df[cached_df.level >= int(level)]
+
+    def update(self, results_df: pd.DataFrame):
+        self.df = pd.concat([
+            self.df[~self.df.key.isin(results_df.key)],
+            results_df,
+        ], ignore_index=True)
+
+    def save(self):
+        os.makedirs(str(self.path.parent), exist_ok=True)
+        save_dataframe_atomic(self.df, self.path)
+
+
+def verify_objects(
+    data_root: Path,
+    keys: Iterable[str],
+    level: VerifyLevel = VerifyLevel.header,
+    max_workers: Optional[int] = None,
+    chunk_size: int = 64,
+) -> VerifyReport:
+    """Verify object files across a process pool, skipping files verified before"""
+    data_root = Path(data_root)
+    report = VerifyReport(level=str(level))
+    start_time = time.monotonic()
+
+    rows = []
+    for key in keys:
+        try:
+            stat = os.stat(str(data_root / key))
+        except FileNotFoundError:
+            report.failures.append(VerifyFailure(key, 'File not found'))
+            continue
+        rows.append((key, stat.st_size, stat.st_mtime_ns))
+    files_df = pd.DataFrame(rows, columns=['key', 'size', 'mtime_ns'])
+    report.files = len(files_df) + len(report.failures)
+
+    cache = VerifyCache(data_root)
+    cached_df = cache.lookup(files_df, level)
+    report.cached = len(cached_df)
+
+    todo_df = files_df[~files_df.key.isin(cached_df.key)]
+    paths = [str(data_root / key) for key in todo_df.key]
+    report.verified_bytes = int(todo_df['size'].sum())
+
+    with futures.ProcessPoolExecutor(max_workers) as executor:
+        chunks = [paths[i:i + chunk_size] for i in range(0, len(paths), chunk_size)]
+        errors = [
+            error
+            for chunk_errors in executor.map(_verify_images, chunks, [level] * len(chunks))
+            for error in chunk_errors
+        ]
+
+    results_df = todo_df.assign(level=int(level), error=errors)
+    cache.update(results_df)
+    cache.save()
+
+    all_results_df = pd.concat([cached_df, results_df], ignore_index=True)
+    failed_df = all_results_df[all_results_df.error.notna()]
+    report.failures.extend(
+        VerifyFailure(key, error)
+        for key, error in zip(failed_df.key, failed_df.error)
+    )
+    report.elapsed = time.monotonic() - start_time
+    return report
@@ -0,0 +1,167 @@
+"""Fast recursive file listing
+
+Directories are listed with os.scandir in parallel, which matters on network
+filesystems where every listing is a round trip. Files are filtered by name
+before any Path objects are created, and listings of unchanged directories
+can be reused from a persistent cache.
+"""
+from concurrent import futures
+import os
+from pathlib import Path
+import pickle
+import threading
+import time
+from typing import *
+
+
+# Directories modified this recently are not cached: a change happening
+# within the filesystem's mtime granularity would go unnoticed otherwise
+RACY_MTIME_NS = 2 * 10 ** 9
+
+
+class DirListing(NamedTuple):
+    mtime_ns: int
+    filenames: List[str]
+    dirnames: List[str]
+
+
+class ListingCache:
+    """Directory listings keyed on directory path and validated by directory mtime"""
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self._listings: Dict[str, DirListing] = {}
+        self._lock = threading.Lock()
+        self._dirty = False
+
+        if path is not None and Path(path).exists():
+            with open(str(path), 'rb') as infile:
+                self._listings = pickle.load(infile)
+
+    def get(self, dirpath: str, mtime_ns: int) -> Optional[DirListing]:
+        listing = self._listings.get(dirpath)
+        if listing is None or listing.mtime_ns != mtime_ns:
+            return None
+        return listing
+
+    def put(self, dirpath: str, listing: DirListing):
+        if time.time_ns() - listing.mtime_ns < RACY_MTIME_NS:
+            return
+
+        with self._lock:
+            self._listings[dirpath] = listing
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._listings = {}
+            self._dirty = True
+
+    def save(self):
+        if self.path is None or not self._dirty:
+            return
+
+        os.makedirs(str(Path(self.path).parent), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'wb') as outfile:
+            pickle.dump(self._listings, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, str(self.path))
+        self._dirty = False
+
+
+def _list_dir(dirpath: str, cache: Optional[ListingCache]) -> DirListing:
+    if cache is not None:
+        mtime_ns = os.stat(dirpath).st_mtime_ns
+        listing = cache.get(dirpath, mtime_ns)
+        if listing is not None:
+            return listing
+
+    filenames = []
+    dirnames = []
+    with os.scandir(dirpath) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+
+            if is_dir:
+                # like os.walk, don't descend into symlinked directories
+                if not entry.is_symlink():
+                    dirnames.append(entry.name)
+            else:
+                filenames.append(entry.name)
+
+    if cache is None:
+        return DirListing(0, filenames, dirnames)
+
+    listing = DirListing(mtime_ns, filenames, dirnames)
+    cache.put(dirpath, listing)
+    return listing
+
+
+def scan_files(
+    where: Union[str, os.PathLike],
+    extensions: Optional[Collection[str]] = None,
+    pattern: Optional[Pattern] = None,
+    exclude_dirs: Collection[Union[str, os.PathLike]] = (),
+    skip_hidden: bool = False,
+    max_workers: Optional[int] = None,
+    cache: Optional[ListingCache] = None,
+) -> Iterator[str]:
+    """Recursively find files, yielding their paths as strings.
+
+    The order of the results is not defined.
+
+    :param extensions: only yield files with these (lowercase) extensions
+    :param pattern: only yield files whose names match the compiled regex
+    :param exclude_dirs: don't descend into these directories
+    :param skip_hidden: skip files and directories starting with a dot
+    :param max_workers: number of threads listing directories
+    :param cache: reuse listings of directories that didn't change since caching
+    """
+    extension_set = (
+        None if extensions is None
+        else frozenset(extension.lower() for extension in extensions)
+    )
+    excluded = frozenset(os.path.normpath(str(dirpath)) for dirpath in exclude_dirs)
+    root = os.path.normpath(str(where))
+    if not os.path.isdir(root) or root in excluded:
+        return
+
+    def matches(filename: str) -> bool:
+        if skip_hidden and filename.startswith('.'):
+            return False
+        if extension_set is not None:
+            _base, dot, extension = filename.rpartition('.')
+            if not dot or f'.{extension.lower()}' not in extension_set:
+                return False
+        if pattern is not None and not pattern.match(filename):
+            return False
+        return True
+
+    if max_workers is None:
+        max_workers = min(32, (os.cpu_count() or 1) * 4)
+
+    with futures.ThreadPoolExecutor(max_workers) as executor:
+        pending = {executor.submit(_list_dir, root, cache): root}
+        while pending:
+            done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+            for future in done:
+                dirpath = pending.pop(future)
+                listing = future.result()
+
+                for dirname in listing.dirnames:
+                    if skip_hidden and dirname.startswith('.'):
+                        continue
+                    subdirpath = os.path.join(dirpath, dirname)
+                    if subdirpath in excluded:
+                        continue
+                    pending[executor.submit(_list_dir, subdirpath, cache)] = subdirpath
+
+                for filename in listing.filenames:
+                    if matches(filename):
+                        yield os.path.join(dirpath, filename)
+
+    if cache is not None:
+        cache.save()
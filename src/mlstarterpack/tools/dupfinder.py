@@ -13,7 +13,9 @@ except ImportError as exc:
 
 from mlstarterpack.vision.images import find_images
 from .dupbrowser import DuplicateBrowser, ImagePair
-from .embedder import compute_embeddings, get_model
+from .embedder import (
+    add_preprocessing_argument, compute_embeddings, get_model, table_preprocessing,
+)
 
 
 def parse_arguments():
@@ -34,6 +36,7 @@ def parse_arguments():
         '--output-file', type=str, required=True,
         help='Path to a the file where removed images will be saved',
     )
+    add_preprocessing_argument(parser)
     return parser.parse_args()
 
 
@@ -66,10 +69,16 @@ def main():  # pylint: disable=too-many-locals
         model = get_model()
 
         image_paths = list(find_images(images_dir))
-        embeddings = compute_embeddings(model, image_paths)
-        image_names = [path.relative_to(args.data_root) for path in image_paths]
+        embeddings, valid = compute_embeddings(model, image_paths, args.preprocessing)
+        embeddings = embeddings[valid]
+        image_names = [
+            path.relative_to(args.data_root)
+            for path, is_valid in zip(image_paths, valid) if is_valid
+        ]
     elif args.embeddings_file:
-        data_df = pq.read_pandas(args.embeddings_file).to_pandas()
+        table = pq.read_pandas(args.embeddings_file)
+        print(f'Embeddings computed with {table_preprocessing(table)} preprocessing')
+        data_df = table.to_pandas()
 
         data_df = data_df[~data_df.image_paths.isin(blacklisted)]
 
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import argparse
+import enum
 from functools import partial
 from pathlib import Path
 from typing import *
@@ -15,7 +16,25 @@ try:
 except ImportError as exc:
     raise ImportError('This module requires tensorflow extra feature') from exc
 
-from mlstarterpack.vision.images import find_images, load_img
+from mlstarterpack.vision.image_layout import ImageLayout
+from mlstarterpack.vision.images import find_images, load_images_batch, load_img
+
+
+IMAGE_SIZE = 224
+BATCH_SIZE = 32
+# key of the preprocessing in the schema metadata of the output table,
+# tables without it were computed with crop_or_pad
+PREPROCESSING_METADATA_KEY = b'preprocessing'
+
+
+class Preprocessing(enum.Enum):
+    # the full-size image cropped or padded to IMAGE_SIZE
+    crop_or_pad = 'crop_or_pad'
+    # the image resized and center-cropped to IMAGE_SIZE, see vision.images.extract_square
+    resize_crop = 'resize_crop'
+
+    def __str__(self):
+        return self.value
 
 
 def parse_arguments():
@@ -26,9 +45,28 @@ def parse_arguments():
         help='Path to the data root directory',
     )
     parser.add_argument('--output', type=str, help='Path to the output parquet file')
+    add_preprocessing_argument(parser)
     return parser.parse_args()
 
 
+def add_preprocessing_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--preprocessing', type=Preprocessing, required=False,
+        default=Preprocessing.crop_or_pad, choices=list(Preprocessing),
+        help=(
+            'crop_or_pad: crop or pad full-size images; resize_crop: resize and center-crop '
+            'images, loaded in parallel. Embeddings of the two are not comparable'
+        ),
+    )
+
+
+def table_preprocessing(table: pa.Table) -> Preprocessing:
+    metadata = table.schema.metadata or {}
+    return Preprocessing(
+        metadata.get(PREPROCESSING_METADATA_KEY, b'crop_or_pad').decode('utf-8')
+    )
+
+
 def get_model() -> tfk.Model:
     assert tfk.backend.image_data_format() == 'channels_last'
     model = tfk.applications.ResNet50(
@@ -39,21 +77,68 @@ def get_model() -> tfk.Model:
     return model
 
 
-def compute_embeddings(model: tfk.Model, image_paths: List[Path]):
+def compute_embeddings(
+    model: tfk.Model,
+    image_paths: List[Path],
+    preprocessing: Preprocessing = Preprocessing.crop_or_pad,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :returns: embeddings of the images and a mask of images that loaded successfully,
+        embeddings of the rest are computed from blank images
+    """
+    if preprocessing is Preprocessing.crop_or_pad:
+        return _crop_or_pad_embeddings(model, image_paths)
+
+    valid_masks = []
+
     def generator_factory():
-        return (
-            np.array(load_img(path), np.float32)
-            for path in image_paths
-        )
+        for start in range(0, len(image_paths), BATCH_SIZE):
+            batch = load_images_batch(
+                image_paths[start:start + BATCH_SIZE], IMAGE_SIZE, ImageLayout.HWC,
+            )
+            for index, exc in batch.errors.items():
+                print(f'Failed to load {image_paths[start + index]}: {exc!r}')
+            valid_masks.append(batch.valid)
+            yield batch.images.astype(np.float32)
+
     dataset = (
         tf.data.Dataset.from_generator(generator_factory, tf.float32)
-        .map(partial(tf.image.resize_with_crop_or_pad, target_height=224, target_width=224))
         .map(tfk.applications.resnet50.preprocess_input)
-        .batch(32)
         .prefetch(3)
     )
     embeddings = model.predict(dataset, verbose=1)
-    return embeddings
+    return embeddings, np.concatenate(valid_masks or [np.zeros(0, dtype=bool)])
+
+
+def _crop_or_pad_embeddings(
+    model: tfk.Model,
+    image_paths: List[Path],
+) -> Tuple[np.ndarray, np.ndarray]:
+    valid = np.ones(len(image_paths), dtype=bool)
+
+    def generator_factory():
+        for index, path in enumerate(image_paths):
+            try:
+                with load_img(path) as image:
+                    yield np.array(image.convert('RGB'), np.float32)
+            except Exception as exc:  # pylint: disable=broad-except
+                print(f'Failed to load {path}: {exc!r}')
+                valid[index] = False
+                yield np.zeros((IMAGE_SIZE, IMAGE_SIZE, 3), np.float32)
+
+    dataset = (
+        tf.data.Dataset.from_generator(
+            generator_factory, tf.float32, tf.TensorShape([None, None, 3]),
+        )
+        .map(partial(
+            tf.image.resize_with_crop_or_pad, target_height=IMAGE_SIZE, target_width=IMAGE_SIZE,
+        ))
+        .map(tfk.applications.resnet50.preprocess_input)
+        .batch(BATCH_SIZE)
+        .prefetch(3)
+    )
+    embeddings = model.predict(dataset, verbose=1)
+    return embeddings, valid
 
 
 def main():
@@ -63,13 +148,20 @@ def main():
     model = get_model()
 
     image_paths = list(find_images(images_dir))
-    embeddings = compute_embeddings(model, image_paths)
+    embeddings, valid = compute_embeddings(model, image_paths, args.preprocessing)
 
     df = pd.DataFrame({
-        'image_paths': [str(path.relative_to(args.data_root)) for path in image_paths],
-        'embeddings': list(embeddings),
+        'image_paths': [
+            str(path.relative_to(args.data_root))
+            for path, is_valid in zip(image_paths, valid) if is_valid
+        ],
+        'embeddings': list(embeddings[valid]),
     })
     table = pa.Table.from_pandas(df)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        PREPROCESSING_METADATA_KEY: str(args.preprocessing).encode('utf-8'),
+    })
     pq.write_table(table, args.output)
 
 
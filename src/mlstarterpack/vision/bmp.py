@@ -1,13 +1,22 @@
 import argparse
 from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+import json
 import os
 from pathlib import Path
+import time
 import traceback
+from typing import *
 
 from PIL import Image
 
-from .images import find_images, get_resized_dims
+from .images import find_images, get_resized_dims, resize_smaller_side
+
+
+# one json entry per converted image, appended as conversions finish,
+# with the size and mtime of the target so that changed or truncated targets are redone
+MANIFEST_FILENAME = '.convert-manifest.jsonl'
+PROGRESS_INTERVAL = 1.0
 
 
 def parse_arguments():
@@ -27,6 +36,24 @@ def parse_arguments():
     convert_parser.add_argument(
         '--target-smaller-size', type=int, required=False, default=224,
     )
+    convert_parser.add_argument(
+        '--draft-oversampling', type=float, required=False, default=2.0,
+        help=(
+            'Decode jpegs at a reduced scale that keeps at least this many times '
+            'the target size, 0 to always decode at the full resolution'
+        ),
+    )
+    convert_parser.add_argument(
+        '--reducing-gap', type=float, required=False, default=3.0,
+        help=(
+            'Reduce images by an integer factor before the final resampling '
+            'when they are more than this many times larger, 0 to disable'
+        ),
+    )
+    convert_parser.add_argument(
+        '--chunksize', type=int, required=False, default=16,
+        help='Number of images sent to a worker at once',
+    )
     convert_parser.set_defaults(func=_convert)
 
     return parser.parse_args()
@@ -37,54 +64,195 @@ class ConvertJob:
     source_path: Path
     target_path: Path
     target_smaller_size: int
+    draft_oversampling: Optional[float]
+    reducing_gap: Optional[float]
+
+    def parameters(self) -> Dict[str, Any]:
+        return {
+            'target_smaller_size': self.target_smaller_size,
+            'draft_oversampling': self.draft_oversampling,
+            'reducing_gap': self.reducing_gap,
+        }
+
 
+def _process_image(job: ConvertJob) -> Optional[str]:
+    """Convert an image, writing through a temporary file.
 
-def _process_image(job: ConvertJob):
+    :returns: the formatted exception if the conversion failed
+    """
+    tmp_path = job.target_path.with_name(f'.{job.target_path.name}.tmp')
     try:
         image: Image.Image = Image.open(job.source_path)
-
-        new_height, new_width = get_resized_dims(
-            image.height, image.width,
-            job.target_smaller_size,
-        )
-        image = image.resize(
-            (new_width, new_height),
-            Image.LANCZOS,
+        image = resize_smaller_side(
+            image, job.target_smaller_size,
+            draft_oversampling=job.draft_oversampling,
+            reducing_gap=job.reducing_gap,
         )
 
-        image.save(job.target_path)
-        print(f'Processed {job.source_path} -> {job.target_path}')
+        os.makedirs(job.target_path.parent, exist_ok=True)
+        image.save(tmp_path, format='BMP')
+        os.replace(tmp_path, job.target_path)
+        return None
     except Exception:  # pylint: disable=broad-except
-        traceback.print_exc()
+        if tmp_path.exists():
+            tmp_path.unlink()
+        return f'Failed to convert {job.source_path}:\n{traceback.format_exc()}'
 
 
-def _convert(args):
+def _read_manifest(manifest_path: Path) -> Dict[str, Dict[str, Any]]:
+    """Manifest entries by target name, the last entry of a target wins"""
+    manifest: Dict[str, Dict[str, Any]] = {}
+    if not manifest_path.exists():
+        return manifest
+
+    with open(manifest_path, encoding='utf-8') as infile:
+        for line in infile:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line of an interrupted run may be incomplete
+                continue
+            manifest[entry['target']] = entry
+    return manifest
+
+
+def _write_manifest(manifest_path: Path, manifest: Dict[str, Dict[str, Any]]):
+    tmp_path = manifest_path.with_name(f'{manifest_path.name}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as outfile:
+        for entry in manifest.values():
+            outfile.write(json.dumps(entry) + '\n')
+    os.replace(tmp_path, manifest_path)
+
+
+def _manifest_entry(job: ConvertJob, sourcedir: Path, targetdir: Path) -> Dict[str, Any]:
+    source_stat = job.source_path.stat()
+    return {
+        'source': str(job.source_path.relative_to(sourcedir)),
+        'source_size': source_stat.st_size,
+        'source_mtime_ns': source_stat.st_mtime_ns,
+        'parameters': job.parameters(),
+        'target': str(job.target_path.relative_to(targetdir)),
+    }
+
+
+def _with_target_stat(entry: Dict[str, Any], target_path: Path) -> Dict[str, Any]:
+    target_stat = target_path.stat()
+    return dict(entry, target_size=target_stat.st_size, target_mtime_ns=target_stat.st_mtime_ns)
+
+
+def _is_converted(
+    recorded: Optional[Dict[str, Any]],
+    entry: Dict[str, Any],
+    target_path: Path,
+) -> bool:
+    """Whether the target was converted from the same source with the same parameters
+    and is still the file written then"""
+    if recorded is None or any(recorded.get(key) != value for key, value in entry.items()):
+        return False
+
+    try:
+        target_stat = target_path.stat()
+    except FileNotFoundError:
+        return False
+    return (
+        recorded.get('target_size') == target_stat.st_size
+        and recorded.get('target_mtime_ns') == target_stat.st_mtime_ns
+    )
+
+
+def _converted_before_manifest(job: ConvertJob) -> bool:
+    """Whether the target is newer than the source, decodes completely
+    and has the size the source is resized to"""
+    try:
+        if job.target_path.stat().st_mtime_ns <= job.source_path.stat().st_mtime_ns:
+            return False
+
+        with Image.open(job.source_path) as source:
+            height, width = get_resized_dims(
+                source.height, source.width, job.target_smaller_size,
+            )
+        with Image.open(job.target_path) as target:
+            # decoding finds truncated files, verify only checks the headers of some formats
+            target.load()
+            return target.size == (width, height)
+    except Exception:  # pylint: disable=broad-except
+        # missing, truncated or not an image, it's converted again
+        return False
+
+
+def _print_progress(done: int, total: int, failed: int, start_time: float, end: str = '\r'):
+    elapsed = time.monotonic() - start_time
+    rate = done / elapsed if elapsed else 0.0
+    print(f'{done}/{total} files, {rate:.1f} files/s, {failed} failed', end=end, flush=True)
+
+
+def _pending_jobs(args, manifest_path: Path) -> Tuple[List[ConvertJob], List[Dict[str, Any]]]:
+    """Jobs of images not converted yet with their manifest entries, the manifest is
+    rewritten compacted, so reruns don't grow it with superseded entries"""
     sourcedir = Path(args.sourcedir)
     targetdir = Path(args.targetdir)
-
-    os.makedirs(targetdir, exist_ok=True)
+    # targets of a directory converted before manifests existed are trusted if they're
+    # newer than their sources and intact images of the requested size, they're recorded
+    # as converted with the current parameters
+    seed_manifest = not manifest_path.exists()
+    manifest = _read_manifest(manifest_path)
 
     jobs = []
+    entries = []
     for source_path in find_images(args.sourcedir):
         source_name = source_path.relative_to(sourcedir)
 
         target_name = Path(str(source_name).replace(source_name.suffix, '.bmp'))
         target_path = targetdir / target_name
 
-        if target_path.exists() and target_path.stat().st_size > 0:
-            continue
-
-        jobs.append(ConvertJob(
+        job = ConvertJob(
             source_path, target_path,
             args.target_smaller_size,
-        ))
+            args.draft_oversampling or None,
+            args.reducing_gap or None,
+        )
+        entry = _manifest_entry(job, sourcedir, targetdir)
+        if seed_manifest and _converted_before_manifest(job):
+            manifest[entry['target']] = _with_target_stat(entry, target_path)
+            continue
+        if _is_converted(manifest.get(entry['target']), entry, target_path):
+            continue
+
+        jobs.append(job)
+        entries.append(entry)
+
+    _write_manifest(manifest_path, manifest)
+    return jobs, entries
 
+
+def _convert(args):
+    targetdir = Path(args.targetdir)
+    os.makedirs(targetdir, exist_ok=True)
+    manifest_path = targetdir / MANIFEST_FILENAME
+    jobs, entries = _pending_jobs(args, manifest_path)
     print(f'{len(jobs)} files to process')
 
-    executor = ProcessPoolExecutor()
-    iterator = executor.map(_process_image, jobs)
-    for _ in iterator:
-        pass
+    failed = 0
+    start_time = time.monotonic()
+    last_progress_time = start_time
+    with ProcessPoolExecutor() as executor, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest_file:
+        errors = executor.map(_process_image, jobs, chunksize=args.chunksize)
+        for done, (job, entry, error) in enumerate(zip(jobs, entries, errors), 1):
+            if error is None:
+                entry = _with_target_stat(entry, job.target_path)
+                manifest_file.write(json.dumps(entry) + '\n')
+                manifest_file.flush()
+            else:
+                failed += 1
+                print()
+                print(error)
+
+            if time.monotonic() - last_progress_time >= PROGRESS_INTERVAL:
+                last_progress_time = time.monotonic()
+                _print_progress(done, len(jobs), failed, start_time)
+
+    _print_progress(len(jobs), len(jobs), failed, start_time, end='\n')
     print('Done')
 
 
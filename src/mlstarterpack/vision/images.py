@@ -1,9 +1,15 @@
-import os
+from concurrent import futures
+import functools
 from pathlib import Path
+import threading
 from typing import *
 
+import numpy as np
 from PIL import Image
 
+from mlstarterpack.filescan import scan_files
+from .image_layout import ImageLayout
+
 
 IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
 
@@ -29,6 +35,65 @@ def get_resized_dims(
     return new_height, new_width
 
 
+def resize_smaller_side(
+    image: Image.Image,
+    target_smaller_side: int,
+    draft_oversampling: Optional[float] = 2.0,
+    reducing_gap: Optional[float] = 3.0,
+) -> Image.Image:
+    """Resize an opened image so that its smaller side is target_smaller_side.
+
+    JPEG images are decoded directly at a 1/2, 1/4 or 1/8 scale (Image.draft)
+    as long as that keeps at least draft_oversampling times the target size,
+    the rest is resized with LANCZOS, reducing by an integer factor first when
+    the image is more than reducing_gap times larger than the target.
+
+    :param draft_oversampling: None to always decode at the full resolution
+    :param reducing_gap: None to resize with LANCZOS only
+    """
+    new_height, new_width = get_resized_dims(image.height, image.width, target_smaller_side)
+
+    if draft_oversampling is not None:
+        image.draft(image.mode, (
+            int(new_width * draft_oversampling),
+            int(new_height * draft_oversampling),
+        ))
+
+    if image.size == (new_width, new_height):
+        return image
+    return image.resize((new_width, new_height), Image.LANCZOS, reducing_gap=reducing_gap)
+
+
+def extract_square(
+    image: Image.Image,
+    square_size: int,
+    layout: ImageLayout = ImageLayout.HWC,
+    mode: str = 'RGB',
+) -> np.ndarray:
+    """Pillow counterpart of vision.tensorflow.extract_square: resize and center-crop.
+
+    :param mode: pillow mode the image is converted to, ex. RGB or L
+    :returns: an uint8 array of (square_size, square_size, channels) in HWC layout
+        or (channels, square_size, square_size) in CHW layout
+    """
+    if image.mode != mode and image.format != 'JPEG':
+        # resampling of palette images is nearest-neighbor only, jpegs are converted
+        # after the resize so that they are still decoded at a reduced scale
+        image = image.convert(mode)
+    image = resize_smaller_side(image, square_size).convert(mode)
+
+    left = (image.width - square_size) // 2
+    top = (image.height - square_size) // 2
+    image = image.crop((left, top, left + square_size, top + square_size))
+
+    array = np.asarray(image, dtype=np.uint8)
+    if array.ndim == 2:
+        array = array[:, :, np.newaxis]
+    if layout is ImageLayout.CHW:
+        array = array.transpose(2, 0, 1)
+    return array
+
+
 def load_img(image_path: Union[str, Path]) -> Image.Image:
     # I believe pillow images are HWC
     image_path = Path(image_path)
@@ -39,11 +104,91 @@ def load_img(image_path: Union[str, Path]) -> Image.Image:
         raise ValueError(f'Unknown image type: {image_path.suffix}')
 
 
-def find_images(where: Path) -> Iterable[Path]:
-    for dirpath, _dirnames, filenames in os.walk(str(where)):
-        for filename in filenames:
-            file_path = Path(dirpath) / filename
-            if not file_path.suffix or file_path.suffix.lower() not in IMAGE_EXTENSIONS:
-                continue
+class ImageBatch(NamedTuple):
+    images: np.ndarray
+    # exceptions of images that failed to load by batch index, their rows are zeros
+    errors: Dict[int, Exception]
+
+    @property
+    def valid(self) -> np.ndarray:
+        valid = np.ones(len(self.images), dtype=bool)
+        valid[list(self.errors)] = False
+        return valid
+
+
+_LOADER_EXECUTOR_LOCK = threading.Lock()
 
-            yield file_path
+
+def _loader_executor() -> futures.ThreadPoolExecutor:
+    # the cache can call the factory twice when called concurrently for the first time
+    with _LOADER_EXECUTOR_LOCK:
+        return _create_loader_executor()
+
+
+@functools.lru_cache(maxsize=None)
+def _create_loader_executor() -> futures.ThreadPoolExecutor:
+    """The shared loader pool, created on first use"""
+    return futures.ThreadPoolExecutor(thread_name_prefix='load_images')
+
+
+def _load_into(
+    out: np.ndarray,
+    index: int,
+    path: Union[str, Path],
+    size: int,
+    layout: ImageLayout,
+    mode: str,
+):
+    with load_img(path) as image:
+        out[index] = extract_square(image, size, layout, mode)
+
+
+def load_images_batch(
+    paths: Sequence[Union[str, Path]],
+    size: int,
+    layout: ImageLayout = ImageLayout.HWC,
+    mode: str = 'RGB',
+    out: Optional[np.ndarray] = None,
+    executor: Optional[futures.Executor] = None,
+) -> ImageBatch:
+    """Load images as squares of size, see extract_square, into a single uint8 array.
+
+    Images are decoded and resized on a thread pool, pillow releases the GIL while
+    doing it. An image that fails to load leaves a zero row and doesn't fail the batch.
+
+    :param out: an array of (len(paths), ...) to load into, ex. a view of a bigger one
+    :param executor: a shared thread pool by default
+    """
+    channels = len(Image.new(mode, (1, 1)).getbands())
+    if layout is ImageLayout.HWC:
+        shape = (len(paths), size, size, channels)
+    else:
+        shape = (len(paths), channels, size, size)
+
+    if out is None:
+        out = np.zeros(shape, dtype=np.uint8)
+    elif out.shape != shape or out.dtype != np.uint8:
+        raise ValueError(f'Expected an uint8 array of {shape}, got {out.dtype} of {out.shape}')
+
+    executor = executor or _loader_executor()
+    pending = {
+        executor.submit(_load_into, out, index, path, size, layout, mode): index
+        for index, path in enumerate(paths)
+    }
+
+    errors: Dict[int, Exception] = {}
+    for future in futures.as_completed(pending):
+        exc = future.exception()
+        if exc is not None:
+            if not isinstance(exc, Exception):
+                # not a failed image, ex. KeyboardInterrupt or SystemExit
+                raise exc
+            index = pending[future]
+            out[index] = 0
+            errors[index] = exc
+    return ImageBatch(out, errors)
+
+
+def find_images(where: Path) -> Iterable[Path]:
+    for file_path in scan_files(where, extensions=IMAGE_EXTENSIONS):
+        yield Path(file_path)
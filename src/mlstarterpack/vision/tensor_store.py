@@ -0,0 +1,233 @@
+"""Image sets stored as a single memory-mapped array of fixed-size squares
+
+A store directory contains:
+- images.npy: an uint8 array of (N, S, S, C) squares in HWC layout or (N, C, S, S) in CHW
+- store.json: layout and pillow mode of the images
+- index.parquet: key and row columns, keys are image paths relative to the source directory
+
+Images are resized and center-cropped like vision.tensorflow.extract_square.
+The index is written last, a directory without it is an incomplete store.
+Rows of images that failed to convert are left out of the index.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+from pathlib import Path
+import time
+import traceback
+from typing import *
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from PIL import Image
+
+from mlstarterpack.data.datasets import RandomAccessDataset
+from .image_layout import ImageLayout
+from .images import extract_square, find_images
+
+
+ARRAY_FILENAME = 'images.npy'
+META_FILENAME = 'store.json'
+INDEX_FILENAME = 'index.parquet'
+PROGRESS_INTERVAL = 1.0
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(title='subcommands', dest='subcommand',
+                                       required=True)
+
+    write_parser = subparsers.add_parser(
+        'write',
+        help='Write images of a directory into a memory-mapped tensor store',
+    )
+    write_parser.add_argument('sourcedir', type=str)
+    write_parser.add_argument('targetdir', type=str, help='Store directory, must not exist')
+    write_parser.add_argument(
+        '--square-size', type=int, required=False, default=224,
+    )
+    write_parser.add_argument(
+        '--layout', type=str, required=False, default=ImageLayout.HWC.name,
+        choices=[layout.name for layout in ImageLayout],
+    )
+    write_parser.add_argument(
+        '--mode', type=str, required=False, default='RGB',
+        help='Pillow mode of the stored images, ex. RGB or L',
+    )
+    write_parser.add_argument(
+        '--chunksize', type=int, required=False, default=16,
+        help='Number of images sent to a worker at once',
+    )
+    write_parser.set_defaults(func=_write)
+
+    return parser.parse_args()
+
+
+def _array_shape(count: int, square_size: int, channels: int, layout: ImageLayout):
+    if layout is ImageLayout.HWC:
+        return count, square_size, square_size, channels
+    else:
+        return count, channels, square_size, square_size
+
+
+# store arrays opened by a worker process, by path
+_WORKER_ARRAYS: Dict[str, np.ndarray] = {}
+
+
+class WriteJob(NamedTuple):
+    source_path: Path
+    row: int
+    array_path: str
+    square_size: int
+    layout: ImageLayout
+    mode: str
+
+
+def _write_row(job: WriteJob) -> Optional[str]:
+    """Convert an image into its row of the store, directly from a worker.
+
+    :returns: the formatted exception if the conversion failed
+    """
+    try:
+        array = _WORKER_ARRAYS.get(job.array_path)
+        if array is None:
+            array = np.load(job.array_path, mmap_mode='r+')
+            _WORKER_ARRAYS[job.array_path] = array
+
+        with Image.open(job.source_path) as image:
+            array[job.row] = extract_square(image, job.square_size, job.layout, job.mode)
+        return None
+    except Exception:  # pylint: disable=broad-except
+        return f'Failed to convert {job.source_path}:\n{traceback.format_exc()}'
+
+
+def write_store(
+    sourcedir: Path,
+    targetdir: Path,
+    square_size: int,
+    layout: ImageLayout = ImageLayout.HWC,
+    mode: str = 'RGB',
+    chunksize: int = 16,
+):
+    sourcedir = Path(sourcedir)
+    targetdir = Path(targetdir)
+    if targetdir.exists():
+        raise RuntimeError('Target directory must not exist')
+
+    source_paths = sorted(find_images(sourcedir))
+    channels = len(Image.new(mode, (1, 1)).getbands())
+    print(f'{len(source_paths)} files to process')
+
+    os.makedirs(str(targetdir))
+    array_path = str(targetdir / ARRAY_FILENAME)
+    shape = _array_shape(len(source_paths), square_size, channels, layout)
+    # only created here, rows are filled in by the workers
+    array = np.lib.format.open_memmap(array_path, mode='w+', dtype=np.uint8, shape=shape)
+    del array
+    with open(str(targetdir / META_FILENAME), 'w', encoding='utf-8') as outfile:
+        json.dump({'layout': layout.name, 'mode': mode}, outfile, indent=2)
+
+    jobs = [
+        WriteJob(source_path, row, array_path, square_size, layout, mode)
+        for row, source_path in enumerate(source_paths)
+    ]
+    rows = []
+    start_time = time.monotonic()
+    last_progress_time = start_time
+    with ProcessPoolExecutor() as executor:
+        errors = executor.map(_write_row, jobs, chunksize=chunksize)
+        for done, (job, error) in enumerate(zip(jobs, errors), 1):
+            if error is None:
+                rows.append(job.row)
+            else:
+                print()
+                print(error)
+
+            if time.monotonic() - last_progress_time >= PROGRESS_INTERVAL:
+                last_progress_time = time.monotonic()
+                rate = done / (last_progress_time - start_time)
+                print(f'{done}/{len(jobs)} files, {rate:.1f} files/s', end='\r', flush=True)
+
+    index_df = pd.DataFrame({
+        'key': [str(source_paths[row].relative_to(sourcedir)) for row in rows],
+        'row': np.array(rows, dtype=np.int64),
+    })
+    tmp_path = targetdir / f'.{INDEX_FILENAME}.tmp'
+    pq.write_table(pa.Table.from_pandas(index_df, preserve_index=False), str(tmp_path))
+    os.replace(str(tmp_path), str(targetdir / INDEX_FILENAME))
+    print(f'Wrote {len(rows)} images, {len(jobs) - len(rows)} failed')
+
+
+class TensorStoreDataset(RandomAccessDataset):
+    """Images of a tensor store as read-only array views of its memory map.
+
+    Items are views, not copies, of the rows in the index order. Consecutive items
+    can be read as a single batch with rows(). The array is memory-mapped lazily
+    in each process using the dataset.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        with open(str(self.path / META_FILENAME), encoding='utf-8') as infile:
+            meta = json.load(infile)
+        self.layout = ImageLayout[meta['layout']]
+        self.mode = meta['mode']
+
+        self.index_df = pd.read_parquet(str(self.path / INDEX_FILENAME))
+        self.keys = self.index_df['key'].to_numpy()
+        self._rows = self.index_df['row'].to_numpy()
+        self._row_by_key: Optional[Dict[str, int]] = None
+        self._array: Optional[np.ndarray] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_array'] = None
+        return state
+
+    @property
+    def array(self) -> np.ndarray:
+        """All rows of the store, including the ones left out of the index"""
+        if self._array is None:
+            self._array = np.load(str(self.path / ARRAY_FILENAME), mmap_mode='r')
+        return self._array
+
+    @property
+    def source_sequence(self) -> Sequence[int]:
+        return self._rows
+
+    def process_source_item(self, item: int) -> np.ndarray:
+        return self.array[item]
+
+    def row(self, key: str) -> int:
+        if self._row_by_key is None:
+            self._row_by_key = dict(zip(self.keys, self._rows.tolist()))
+        return self._row_by_key[key]
+
+    def rows(self, start: int, stop: int) -> np.ndarray:
+        """Items start to stop, not store rows, as a batch: a single view unless images
+        that failed to convert left gaps between their rows"""
+        rows = self._rows[start:stop]
+        if len(rows) and rows[-1] - rows[0] == len(rows) - 1:
+            return self.array[rows[0]:rows[-1] + 1]
+        return self.array[rows]
+
+
+def _write(args):
+    write_store(
+        Path(args.sourcedir), Path(args.targetdir), args.square_size,
+        layout=ImageLayout[args.layout],
+        mode=args.mode,
+        chunksize=args.chunksize,
+    )
+
+
+def main():
+    args = parse_arguments()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+import os
+from pathlib import Path
+import sys
+
+from PIL import Image
+
+from mlstarterpack.vision import bmp
+
+
+def make_sources(path: Path) -> Path:
+    os.makedirs(str(path / 'sub'))
+    for name in ['a.jpg', 'b.jpg', 'sub/c.png']:
+        Image.effect_noise((80, 60), 50).convert('RGB').save(path / name)
+    return path
+
+
+def run_convert(monkeypatch, capsys, sourcedir: Path, targetdir: Path, *args: str) -> int:
+    """:returns: the number of files converted"""
+    monkeypatch.setattr(sys, 'argv', [
+        'bmp', 'convert', str(sourcedir), str(targetdir), '--target-smaller-size', '30', *args,
+    ])
+    bmp.main()
+    output = capsys.readouterr().out
+    return int(output.split(' files to process')[0].split()[-1])
+
+
+def target_sizes(targetdir: Path) -> dict:
+    sizes = {}
+    for path in sorted(targetdir.rglob('*.bmp')):
+        with Image.open(path) as image:
+            sizes[str(path.relative_to(targetdir))] = image.size
+    return sizes
+
+
+def test_only_changed_targets_are_converted_again(tmp_path, monkeypatch, capsys):
+    sourcedir = make_sources(tmp_path / 'source')
+    targetdir = tmp_path / 'target'
+
+    assert run_convert(monkeypatch, capsys, sourcedir, targetdir) == 3
+    assert target_sizes(targetdir) == {'a.bmp': (40, 30), 'b.bmp': (40, 30), 'sub/c.bmp': (40, 30)}
+    assert run_convert(monkeypatch, capsys, sourcedir, targetdir) == 0
+
+    target_path = targetdir / 'a.bmp'
+    target_path.write_bytes(target_path.read_bytes()[:100])
+    assert run_convert(monkeypatch, capsys, sourcedir, targetdir) == 1
+    assert target_sizes(targetdir)['a.bmp'] == (40, 30)
+
+    assert run_convert(monkeypatch, capsys, sourcedir, targetdir, '--reducing-gap', '0') == 3
+
+
+def test_targets_converted_before_manifests_are_verified(tmp_path, monkeypatch, capsys):
+    sourcedir = make_sources(tmp_path / 'source')
+    targetdir = tmp_path / 'target'
+    os.makedirs(str(targetdir / 'sub'))
+    Image.new('RGB', (40, 30)).save(targetdir / 'a.bmp')
+    Image.new('RGB', (80, 60)).save(targetdir / 'b.bmp')
+    Image.new('RGB', (40, 30)).save(targetdir / 'sub/c.bmp')
+    (targetdir / 'sub/c.bmp').write_bytes((targetdir / 'sub/c.bmp').read_bytes()[:100])
+
+    # the wrong size and the truncated targets
+    assert run_convert(monkeypatch, capsys, sourcedir, targetdir) == 2
+    assert target_sizes(targetdir) == {'a.bmp': (40, 30), 'b.bmp': (40, 30), 'sub/c.bmp': (40, 30)}
+    assert run_convert(monkeypatch, capsys, sourcedir, targetdir) == 0
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from mlstarterpack.data import (
+    cache_dataset, DataLoader, LoaderBackend, LoaderOptions, RandomAccessDataset,
+)
+from mlstarterpack.data.cache import MemoryCache
+
+
+ITEM_COUNT = 12
+
+
+class Arrays(RandomAccessDataset):
+    @property
+    def source_sequence(self):
+        return range(ITEM_COUNT)
+
+    def process_source_item(self, item):
+        return np.full(3, item)
+
+
+class Unavailable(Arrays):
+    def process_source_item(self, item):
+        raise AssertionError(f'Item {item} was not cached')
+
+
+def test_memory_cache_freezes_a_copy():
+    cache = MemoryCache(2 ** 20)
+    value = np.zeros(3)
+    cache.put(b'key', value)
+
+    assert value.flags.writeable
+    value[0] = 1
+    cached = cache.get(b'key')
+    assert not cached.flags.writeable
+    assert cached.tolist() == [0, 0, 0]
+
+
+def test_uncached_results_are_writable():
+    dataset = cache_dataset(Arrays(), 'v1')
+    first = dataset[1]
+    first[0] = 5
+
+    assert not dataset[1].flags.writeable
+    assert dataset[1].tolist() == [1, 1, 1]
+
+
+def test_disk_tier_persists_saved_items(tmp_path):
+    with cache_dataset(Arrays(), 'v1', disk_path=tmp_path, disk_bytes=2 ** 16) as dataset:
+        assert [int(item[0]) for item in dataset] == list(range(ITEM_COUNT))
+
+    reopened = cache_dataset(Unavailable(), 'v1', disk_path=tmp_path, disk_bytes=2 ** 16)
+    assert [int(item[0]) for item in reopened] == list(range(ITEM_COUNT))
+
+    changed = cache_dataset(Unavailable(), 'v2', disk_path=tmp_path, disk_bytes=2 ** 16)
+    with pytest.raises(AssertionError):
+        changed[0]  # pylint: disable=pointless-statement
+
+
+def test_worker_processes_fill_the_disk_tier(tmp_path):
+    dataset = cache_dataset(Arrays(), 'v1', disk_path=tmp_path, disk_bytes=2 ** 16)
+    options = LoaderOptions(batch_size=4, backend=LoaderBackend.process, max_workers=2)
+    with DataLoader(dataset, options) as loader:
+        assert sorted(int(x) for batch in loader for x in batch[:, 0]) == list(range(ITEM_COUNT))
+
+    # workers append to slabs of their own, saved when they exit
+    reopened = cache_dataset(Unavailable(), 'v1', disk_path=tmp_path, disk_bytes=2 ** 16)
+    assert [int(item[0]) for item in reopened] == list(range(ITEM_COUNT))
+
+    # one slab of disk_bytes per process
+    slab_sizes = [path.stat().st_size for path in tmp_path.glob('slab-*/slab.npy')]
+    assert 1 < len(slab_sizes) <= 3
+    assert all(2 ** 16 <= size < 2 ** 17 for size in slab_sizes)
+
+
+def test_disk_tier_requires_a_size(tmp_path):
+    with pytest.raises(ValueError):
+        cache_dataset(Arrays(), 'v1', disk_path=tmp_path)
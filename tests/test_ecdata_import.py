@@ -0,0 +1,221 @@
+import importlib
+import os
+from pathlib import Path
+import sys
+import threading
+
+import pandas as pd
+import pytest
+
+from mlstarterpack.ecdata import transfer
+from mlstarterpack.ecdata._tabular import append_table, load_dataframe, save_dataframe
+from mlstarterpack.ecdata.content_index import ContentHashIndex
+from mlstarterpack.ecdata.root import ECDataRoot
+from mlstarterpack.ecdata.transfer import FileTransferer, TransferMode
+
+
+# import is a keyword, the module can't be imported with an import statement
+import_module = importlib.import_module('mlstarterpack.ecdata.import')
+
+
+def make_drop(path: Path, contents: dict) -> Path:
+    """A data drop with objects of contents and a class_train dataset listing them"""
+    for name, data in contents.items():
+        object_path = path / 'source/images' / name
+        os.makedirs(str(object_path.parent), exist_ok=True)
+        object_path.write_bytes(data)
+
+    os.makedirs(str(path / 'datasets'))
+    keys = [f'source/images/{name}' for name in contents]
+    pd.DataFrame({0: keys}).to_csv(path / 'datasets/class_train.csv', header=False, index=False)
+    return path
+
+
+def run_import(monkeypatch, drop_dir: Path, output_dir: Path, *args: str, dedup: bool = True):
+    argv = ['import', str(drop_dir), '--output-data-root', str(output_dir), *args]
+    if not dedup:
+        argv.append('--no-dedup')
+    monkeypatch.setattr(sys, 'argv', argv)
+    import_module.main()
+
+
+def dataset_keys(output_dir: Path) -> list:
+    return list(load_dataframe(output_dir / 'datasets/class_train.csv')[0])
+
+
+def object_files(output_dir: Path) -> list:
+    return sorted(
+        str(path.relative_to(output_dir)) for path in (output_dir / 'source').rglob('*.jpg')
+    )
+
+
+def test_duplicates_within_drop_share_object_and_row(tmp_path, monkeypatch):
+    drop_dir = make_drop(tmp_path / 'drop', {'a.jpg': b'same', 'b.jpg': b'same', 'c.jpg': b'c'})
+    output_dir = tmp_path / 'root'
+
+    # the first placed copy waits until the duplicate is claimed,
+    # so its object doesn't exist yet when the duplicate is checked
+    claims = []
+    duplicate_claimed = threading.Event()
+    original_claim = ContentHashIndex.claim
+    original_replace = os.replace
+
+    def claim(self, digest, key):
+        claims.append(digest)
+        if claims.count(digest) == 2:
+            duplicate_claimed.set()
+        return original_claim(self, digest, key)
+
+    def replace(source, target):
+        if source.endswith('.part'):
+            assert duplicate_claimed.wait(5)
+        original_replace(source, target)
+
+    monkeypatch.setattr(ContentHashIndex, 'claim', claim)
+    monkeypatch.setattr(transfer.os, 'replace', replace)
+    run_import(monkeypatch, drop_dir, output_dir, '--transfer-jobs', '3')
+
+    keys = dataset_keys(output_dir)
+    assert len(keys) == 2
+    assert len(set(keys)) == 2
+    assert sorted(keys) == object_files(output_dir)
+
+
+def test_multi_row_metadata_is_kept(tmp_path, monkeypatch):
+    drop_dir = make_drop(tmp_path / 'drop', {'a.jpg': b'a', 'b.jpg': b'b'})
+    os.makedirs(str(drop_dir / 'source/metadata'))
+    pd.DataFrame({
+        0: ['source/images/a.jpg', 'source/images/a.jpg', 'source/images/b.jpg'],
+        1: ['box1', 'box2', 'box3'],
+    }).to_csv(drop_dir / 'source/metadata/boxes.csv', header=False, index=False)
+    output_dir = tmp_path / 'root'
+    run_import(monkeypatch, drop_dir, output_dir)
+
+    boxes_df = load_dataframe(output_dir / 'source/metadata/boxes.csv')
+    assert list(boxes_df[1]) == ['box1', 'box2', 'box3']
+    assert boxes_df[0][0] == boxes_df[0][1] != boxes_df[0][2]
+
+    # another drop with new boxes of a new image
+    second_drop_dir = tmp_path / 'second'
+    make_drop(second_drop_dir, {'c.jpg': b'c'})
+    os.makedirs(str(second_drop_dir / 'source/metadata'))
+    pd.DataFrame({0: ['source/images/c.jpg'] * 2, 1: ['box4', 'box5']}).to_csv(
+        second_drop_dir / 'source/metadata/boxes.csv', header=False, index=False,
+    )
+    run_import(monkeypatch, second_drop_dir, output_dir)
+
+    boxes_df = load_dataframe(output_dir / 'source/metadata/boxes.csv')
+    assert list(boxes_df[1]) == ['box1', 'box2', 'box3', 'box4', 'box5']
+
+
+def test_reimport_doesnt_duplicate_rows(tmp_path, monkeypatch):
+    drop_dir = make_drop(tmp_path / 'drop', {'a.jpg': b'a', 'b.jpg': b'b'})
+    output_dir = tmp_path / 'root'
+    run_import(monkeypatch, drop_dir, output_dir)
+    first_keys = dataset_keys(output_dir)
+
+    run_import(monkeypatch, drop_dir, output_dir)
+    assert dataset_keys(output_dir) == first_keys
+    assert object_files(output_dir) == sorted(first_keys)
+
+
+def test_no_dedup_copies_everything(tmp_path, monkeypatch):
+    drop_dir = make_drop(tmp_path / 'drop', {'a.jpg': b'same', 'b.jpg': b'same'})
+    output_dir = tmp_path / 'root'
+    run_import(monkeypatch, drop_dir, output_dir, dedup=False)
+
+    assert len(set(dataset_keys(output_dir))) == 2
+    assert len(object_files(output_dir)) == 2
+
+
+def test_append_table_skips_keys(tmp_path):
+    target_path = tmp_path / 'target.csv'
+    source_path = tmp_path / 'source.csv'
+    pd.DataFrame({0: ['a', 'b'], 1: [1, 2]}).to_csv(target_path, header=False, index=False)
+    pd.DataFrame({0: ['b', 'c', 'c', 'd'], 1: [3, 4, 5, 6]}).to_csv(
+        source_path, header=False, index=False,
+    )
+
+    append_table(source_path, target_path, key_map={'b': 'a', 'c': 'x'}, skip_keys={'b'})
+    result_df = load_dataframe(target_path)
+    assert list(result_df[0]) == ['a', 'b', 'x', 'x', 'd']
+    assert list(result_df[1]) == [1, 2, 4, 5, 6]
+
+
+@pytest.mark.parametrize('mode', [TransferMode.copy, TransferMode.hardlink])
+def test_failed_placement_releases_claim(tmp_path, monkeypatch, mode):
+    source_path = tmp_path / 'a.jpg'
+    source_path.write_bytes(b'content')
+    output_dir = tmp_path / 'root'
+    target_path = output_dir / 'source/images/new.jpg'
+    index = ContentHashIndex(output_dir)
+
+    def fail(*_args, **_kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(transfer.os, 'replace', fail)
+    monkeypatch.setattr(FileTransferer, '_place', fail)
+
+    with pytest.raises(OSError):
+        FileTransferer(mode).transfer_one(
+            source_path, target_path,
+            claim=lambda digest, path: index.claim(digest, 'source/images/new.jpg') == (
+                'source/images/new.jpg'
+            ),
+            release=lambda digest, path: index.release(digest, 'source/images/new.jpg'),
+        )
+
+    assert len(index) == 0
+    assert not target_path.exists()
+
+
+def test_import_source_data_maps_duplicates_to_existing_key(tmp_path):
+    output_dir = tmp_path / 'root'
+    first_drop = make_drop(tmp_path / 'first', {'a.jpg': b'same'})
+    second_drop = make_drop(tmp_path / 'second', {'b.jpg': b'same'})
+    index = ContentHashIndex(output_dir)
+
+    first_map, first_duplicates = import_module.import_source_data(
+        import_module.PathParameters(first_drop, output_dir), content_index=index,
+    )
+    second_map, second_duplicates = import_module.import_source_data(
+        import_module.PathParameters(second_drop, output_dir), content_index=index,
+    )
+
+    assert second_map['source/images/b.jpg'] == first_map['source/images/a.jpg']
+    assert not first_duplicates
+    assert second_duplicates == {'source/images/b.jpg'}
+    assert len(object_files(output_dir)) == 1
+
+
+def test_import_appends_to_the_preferred_format(tmp_path, monkeypatch):
+    drop_dir = make_drop(tmp_path / 'drop', {'a.jpg': b'a'})
+    os.makedirs(str(drop_dir / 'source/metadata'))
+    pd.DataFrame({0: ['source/images/a.jpg'], 1: ['cat']}).to_csv(
+        drop_dir / 'source/metadata/class.csv', header=False, index=False,
+    )
+    # as left by convert_tables --keep-originals
+    output_dir = tmp_path / 'root'
+    existing_df = pd.DataFrame({0: ['source/images/old.jpg'], 1: ['dog']})
+    os.makedirs(str(output_dir / 'source/metadata'))
+    existing_df.to_csv(output_dir / 'source/metadata/class.csv', header=False, index=False)
+    save_dataframe(existing_df, output_dir / 'source/metadata/class.parquet')
+
+    run_import(monkeypatch, drop_dir, output_dir)
+
+    root = ECDataRoot(output_dir)
+    assert list(root.annotation('class')['class']) == ['dog', 'cat']
+    assert list(load_dataframe(output_dir / 'source/metadata/class.csv')[1]) == ['dog']
+
+
+def test_claims_hold_until_released(tmp_path):
+    index = ContentHashIndex(tmp_path)
+    assert index.claim('digest', 'first') == 'first'
+    # the object of first isn't written yet
+    assert index.claim('digest', 'second') == 'first'
+
+    index.release('digest', 'first')
+    assert index.claim('digest', 'second') == 'second'
+    index.save()
+
+    # saved claims of objects deleted since are replaced
+    assert ContentHashIndex(tmp_path).claim('digest', 'third') == 'third'
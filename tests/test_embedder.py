@@ -0,0 +1,67 @@
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+from PIL import Image
+import pytest
+
+tf = pytest.importorskip('tensorflow')
+
+# pylint: disable=wrong-import-position
+from mlstarterpack.tools import embedder
+from mlstarterpack.tools.embedder import (
+    compute_embeddings, IMAGE_SIZE, Preprocessing, PREPROCESSING_METADATA_KEY,
+    table_preprocessing,
+)
+
+
+def mean_color_model():
+    """Embeds images as their mean preprocessed color, instead of downloading weights"""
+    return tf.keras.Sequential([
+        tf.keras.Input((IMAGE_SIZE, IMAGE_SIZE, 3)),
+        tf.keras.layers.GlobalAveragePooling2D(),
+    ])
+
+
+def make_images(path: Path) -> list:
+    path.mkdir()
+    Image.new('RGB', (300, 400), (255, 0, 0)).save(path / 'red.png')
+    (path / 'broken.jpg').write_bytes(b'not an image')
+    Image.new('RGB', (100, 100), (0, 0, 255)).save(path / 'blue.png')
+    return [path / 'red.png', path / 'broken.jpg', path / 'blue.png']
+
+
+@pytest.mark.parametrize('preprocessing', list(Preprocessing))
+def test_compute_embeddings(tmp_path, preprocessing):
+    paths = make_images(tmp_path / 'images')
+
+    embeddings, valid = compute_embeddings(mean_color_model(), paths, preprocessing)
+
+    assert embeddings.shape == (3, 3)
+    assert list(valid) == [True, False, True]
+    # resnet50 preprocessing converts to BGR, the red image fills the crop in both modes
+    assert embeddings[0].argmax() == 2
+
+
+def test_blue_image_is_padded_only_by_crop_or_pad(tmp_path):
+    paths = make_images(tmp_path / 'images')[2:]
+    model = mean_color_model()
+
+    padded, _ = compute_embeddings(model, paths, Preprocessing.crop_or_pad)
+    resized, _ = compute_embeddings(model, paths, Preprocessing.resize_crop)
+
+    assert padded[0][0] < resized[0][0]
+
+
+def test_preprocessing_argument_and_metadata():
+    parser = argparse.ArgumentParser()
+    embedder.add_preprocessing_argument(parser)
+    assert parser.parse_args([]).preprocessing is Preprocessing.crop_or_pad
+    args = parser.parse_args(['--preprocessing', 'resize_crop'])
+    assert args.preprocessing is Preprocessing.resize_crop
+
+    table = pa.table({'embeddings': [np.zeros(3)]})
+    assert table_preprocessing(table) is Preprocessing.crop_or_pad
+    table = table.replace_schema_metadata({PREPROCESSING_METADATA_KEY: b'resize_crop'})
+    assert table_preprocessing(table) is Preprocessing.resize_crop
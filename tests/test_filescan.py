@@ -0,0 +1,78 @@
+import os
+from pathlib import Path
+import re
+
+from mlstarterpack.filescan import ListingCache, scan_files
+
+
+OLD_MTIME_NS = 10 ** 18
+
+
+def make_tree(path: Path) -> Path:
+    for name in ['a.jpg', 'b.JPG', 'c.txt', '.hidden.jpg', 'sub/d.jpg', 'sub/deeper/e.jpg',
+                 'excluded/f.jpg', '.hidden_dir/g.jpg']:
+        os.makedirs(str((path / name).parent), exist_ok=True)
+        (path / name).write_bytes(b'')
+    os.symlink(str(path / 'sub'), str(path / 'linked'))
+    return path
+
+
+def scanned(where: Path, **kwargs) -> list:
+    return sorted(os.path.relpath(path, str(where)) for path in scan_files(where, **kwargs))
+
+
+def test_filters(tmp_path):
+    root = make_tree(tmp_path / 'tree')
+
+    assert scanned(
+        root, extensions=['.jpg'], skip_hidden=True, exclude_dirs=[root / 'excluded'],
+    ) == [
+        # symlinked directories aren't followed
+        'a.jpg', 'b.JPG', 'sub/d.jpg', 'sub/deeper/e.jpg',
+    ]
+    assert scanned(root, pattern=re.compile(r'^[a-c]\.')) == ['a.jpg', 'b.JPG', 'c.txt']
+    assert '.hidden_dir/g.jpg' in scanned(root)
+    assert scanned(tmp_path / 'missing') == []
+
+
+def age(path: Path):
+    os.utime(str(path), ns=(OLD_MTIME_NS, OLD_MTIME_NS))
+
+
+def test_cached_listings_are_reused_until_the_directory_changes(tmp_path):
+    root = make_tree(tmp_path / 'tree')
+    age(root / 'sub')
+    cache = ListingCache()
+    scanned(root, cache=cache)
+
+    # a change that doesn't update the mtime shows that the listing is reused
+    (root / 'sub/new.jpg').write_bytes(b'')
+    age(root / 'sub')
+    assert 'sub/new.jpg' not in scanned(root, cache=cache)
+    assert 'sub/new.jpg' in scanned(root)
+
+    os.utime(str(root / 'sub'), ns=(OLD_MTIME_NS + 1, OLD_MTIME_NS + 1))
+    assert 'sub/new.jpg' in scanned(root, cache=cache)
+
+
+def test_recently_modified_directories_arent_cached(tmp_path):
+    root = make_tree(tmp_path / 'tree')
+    cache = ListingCache()
+    scanned(root, cache=cache)
+
+    mtime_ns = (root / 'sub').stat().st_mtime_ns
+    (root / 'sub/new.jpg').write_bytes(b'')
+    os.utime(str(root / 'sub'), ns=(mtime_ns, mtime_ns))
+    assert 'sub/new.jpg' in scanned(root, cache=cache)
+
+
+def test_cache_persists(tmp_path):
+    root = make_tree(tmp_path / 'tree')
+    age(root / 'sub')
+    cache_path = tmp_path / 'cache/listings.pickle'
+    scanned(root, cache=ListingCache(cache_path))
+    assert cache_path.exists()
+
+    (root / 'sub/new.jpg').write_bytes(b'')
+    age(root / 'sub')
+    assert 'sub/new.jpg' not in scanned(root, cache=ListingCache(cache_path))
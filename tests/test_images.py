@@ -0,0 +1,102 @@
+# pylint: disable=redefined-outer-name
+from concurrent import futures
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+import pytest
+
+from mlstarterpack.vision.image_layout import ImageLayout
+from mlstarterpack.vision.images import extract_square, load_images_batch, resize_smaller_side
+
+
+def psnr(first: Image.Image, second: Image.Image) -> float:
+    difference = np.asarray(first, dtype=np.float64) - np.asarray(second, dtype=np.float64)
+    return 10 * np.log10(255 ** 2 / np.mean(difference ** 2))
+
+
+@pytest.fixture(scope='module')
+def jpeg_path(tmp_path_factory) -> Path:
+    path = tmp_path_factory.mktemp('images') / 'image.jpg'
+    gradient = Image.linear_gradient('L')
+    Image.merge('RGB', [
+        gradient.resize((800, 600)),
+        gradient.rotate(90).resize((800, 600)),
+        Image.radial_gradient('L').resize((800, 600)),
+    ]).save(path, quality=95)
+    return path
+
+
+@pytest.mark.parametrize('draft_oversampling', [None, 1.0, 2.0])
+@pytest.mark.parametrize('reducing_gap', [None, 3.0])
+def test_resized_size(jpeg_path, draft_oversampling, reducing_gap):
+    with Image.open(jpeg_path) as image:
+        resized = resize_smaller_side(image, 100, draft_oversampling, reducing_gap)
+        assert resized.size == (133, 100)
+
+
+def test_jpegs_are_decoded_at_a_reduced_scale(jpeg_path):
+    with Image.open(jpeg_path) as image:
+        resize_smaller_side(image, 100, draft_oversampling=2.0)
+        # 1/4 would be less than twice the target size
+        assert image.size == (400, 300)
+
+    with Image.open(jpeg_path) as image:
+        resize_smaller_side(image, 100, draft_oversampling=None)
+        assert image.size == (800, 600)
+
+
+def test_reduced_decode_is_close_to_full_decode(jpeg_path):
+    with Image.open(jpeg_path) as image:
+        full = resize_smaller_side(image, 100, draft_oversampling=None, reducing_gap=None)
+    with Image.open(jpeg_path) as image:
+        reduced = resize_smaller_side(image, 100)
+
+    assert psnr(reduced, full) > 35
+
+
+def test_images_at_the_target_size_are_returned_as_is(jpeg_path):
+    with Image.open(jpeg_path) as image:
+        assert resize_smaller_side(image, 600, draft_oversampling=None) is image
+
+
+def make_images(path: Path) -> list:
+    path.mkdir()
+    Image.new('RGB', (40, 20), (255, 0, 0)).save(path / 'red.png')
+    Image.new('L', (20, 40), 128).save(path / 'gray.png')
+    (path / 'broken.jpg').write_bytes(b'not an image')
+    return [path / 'red.png', path / 'broken.jpg', path / 'gray.png', path / 'missing.png']
+
+
+@pytest.mark.parametrize('layout', list(ImageLayout))
+def test_load_images_batch(tmp_path, layout):
+    paths = make_images(tmp_path / 'images')
+
+    batch = load_images_batch(paths, 16, layout)
+
+    shape = (4, 16, 16, 3) if layout is ImageLayout.HWC else (4, 3, 16, 16)
+    assert batch.images.shape == shape
+    assert sorted(batch.errors) == [1, 3]
+    assert isinstance(batch.errors[3], FileNotFoundError)
+    assert list(batch.valid) == [True, False, True, False]
+    assert not batch.images[[1, 3]].any()
+    with Image.open(paths[0]) as image:
+        np.testing.assert_array_equal(batch.images[0], extract_square(image, 16, layout))
+    assert (batch.images[2] == 128).all()
+
+
+def test_load_images_batch_into_an_array(tmp_path):
+    paths = make_images(tmp_path / 'images')
+    out = np.full((6, 16, 16, 1), 255, dtype=np.uint8)
+
+    with futures.ThreadPoolExecutor(2) as executor:
+        batch = load_images_batch(paths, 16, mode='L', out=out[1:5], executor=executor)
+
+    assert np.shares_memory(batch.images, out)
+    # failed rows are cleared, rows outside the batch aren't touched
+    assert not out[[2, 4]].any()
+    assert (out[[0, 5]] == 255).all()
+    assert (out[3] == 128).all()
+
+    with pytest.raises(ValueError):
+        load_images_batch(paths, 16, out=out[:4])
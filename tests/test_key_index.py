@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+import sys
+
+import pandas as pd
+import pytest
+
+from mlstarterpack.ecdata import remove_blacklisted, sample
+from mlstarterpack.ecdata.key_index import KeyIndex, KeyKind
+from mlstarterpack.ecdata.root import ECDataRoot
+
+
+def write_table(path: Path, rows: list):
+    os.makedirs(str(path.parent), exist_ok=True)
+    pd.DataFrame(rows).to_csv(path, header=False, index=False)
+
+
+def make_root(path: Path) -> Path:
+    for name in ['a.jpg', 'b.jpg', 'c.jpg']:
+        write_table(path / 'source/images' / name, [])
+    write_table(path / 'datasets/class_train.csv', [['source/images/a.jpg']])
+    write_table(path / 'datasets/class_test.csv', [['source/images/b.jpg']])
+    write_table(path / 'source/metadata/class.csv', [
+        ['source/images/a.jpg', 'cat'], ['source/images/b.jpg', 'dog'],
+    ])
+    write_table(path / 'source/tabular/rows.csv', [['row1', 1]])
+    return path
+
+
+def test_refresh_rereads_only_changed_tables(tmp_path):
+    root = make_root(tmp_path / 'root')
+    index = KeyIndex(root)
+    assert index.refresh() == 4
+    assert set(index.keys(KeyKind.dataset)) == {'source/images/a.jpg', 'source/images/b.jpg'}
+    assert set(index.keys(KeyKind.table)) == {'row1'}
+    assert len(index.keys(KeyKind.object)) == 3
+
+    assert KeyIndex(root).refresh() == 0
+
+    write_table(root / 'datasets/class_train.csv', [
+        ['source/images/a.jpg'], ['source/images/c.jpg'],
+    ])
+    os.unlink(str(root / 'datasets/class_test.csv'))
+    index = KeyIndex(root)
+    assert index.refresh() == 1
+    assert set(index.keys(KeyKind.dataset)) == {'source/images/a.jpg', 'source/images/c.jpg'}
+    assert set(index.lookup(['source/images/b.jpg']).kind) == {'metadata', 'object'}
+
+
+def test_rebuild_rereads_everything(tmp_path):
+    root = make_root(tmp_path / 'root')
+    index = KeyIndex(root)
+    index.refresh()
+    assert index.refresh(rebuild=True) == 4
+
+
+def test_sample_finds_objects_through_the_index(tmp_path, monkeypatch):
+    root = make_root(tmp_path / 'root')
+    KeyIndex(root).refresh()
+    os.unlink(str(root / 'source/images/a.jpg'))
+    ECDataRoot(root).key_index.refresh()
+
+    output_dir = tmp_path / 'output'
+    monkeypatch.setattr(sys, 'argv', [
+        'sample', '--fraction', '1', '--input-data-root', str(root),
+        '--output-data-root', str(output_dir),
+    ])
+    sample.main()
+
+    assert sorted(path.name for path in (output_dir / 'source/images').iterdir()) == ['b.jpg']
+    assert (output_dir / 'source/tabular/rows.csv').exists()
+
+
+def test_remove_blacklisted_requires_datasets_under_data_root(tmp_path, monkeypatch, capsys):
+    root = make_root(tmp_path / 'root')
+    other_root = make_root(tmp_path / 'other')
+    blacklist_path = tmp_path / 'blacklist.csv'
+    write_table(blacklist_path, [['source/images/a.jpg']])
+
+    monkeypatch.setattr(sys, 'argv', [
+        'remove_blacklisted', str(other_root / 'datasets'), str(blacklist_path),
+        '--data-root', str(root),
+    ])
+    with pytest.raises(SystemExit):
+        remove_blacklisted.main()
+    assert 'is not under --data-root' in capsys.readouterr().err
@@ -0,0 +1,111 @@
+# pylint: disable=redefined-outer-name
+import threading
+
+import numpy as np
+import pytest
+
+from mlstarterpack.data import (
+    DataLoader, IndexSampler, IterableDataset, LoaderBackend, LoaderOptions, PreloadOrder,
+    RandomAccessDataset,
+)
+from mlstarterpack.data.datasets import FILTERED
+
+
+ITEM_COUNT = 10
+
+
+class Squares(RandomAccessDataset):
+    @property
+    def source_sequence(self):
+        return range(ITEM_COUNT)
+
+    def process_source_item(self, item):
+        return {'x': np.full(2, item), 'y': item * item}
+
+
+class EvenSquares(IterableDataset):
+    def source_iterable(self):
+        return range(ITEM_COUNT)
+
+    def process_source_item(self, item):
+        return item * item if item % 2 == 0 else FILTERED
+
+
+def labels(batches) -> list:
+    return [int(y) for batch in batches for y in batch['y']]
+
+
+@pytest.mark.parametrize('backend', list(LoaderBackend))
+def test_batches_are_collated(backend):
+    options = LoaderOptions(batch_size=4, backend=backend, max_workers=2)
+    with DataLoader(Squares(), options) as loader:
+        batches = list(loader)
+
+    assert len(loader) == len(batches) == 3
+    assert [len(batch['y']) for batch in batches] == [4, 4, 2]
+    assert labels(batches) == [i * i for i in range(ITEM_COUNT)]
+    np.testing.assert_array_equal(batches[1]['x'], np.repeat(np.arange(4, 8)[:, None], 2, 1))
+
+
+def test_drop_last():
+    loader = DataLoader(Squares(), LoaderOptions(batch_size=4, drop_last=True))
+    with loader:
+        assert len(loader) == 2
+        assert labels(loader) == [i * i for i in range(8)]
+
+
+def test_samples_without_batching():
+    with DataLoader(Squares(), LoaderOptions(order=PreloadOrder.unordered)) as loader:
+        assert sorted(sample['y'] for sample in loader) == [i * i for i in range(ITEM_COUNT)]
+
+
+def test_output_buffers_are_reused():
+    options = LoaderOptions(batch_size=2, output_buffers=2)
+    with DataLoader(Squares(), options) as loader:
+        batches = [batch['y'] for batch in loader]
+
+    assert batches[0] is not batches[1]
+    assert np.shares_memory(batches[0], batches[2])
+
+
+def test_output_buffers_require_batches():
+    with pytest.raises(ValueError):
+        DataLoader(Squares(), LoaderOptions(output_buffers=2))
+
+
+def test_sampler_selects_indices():
+    sampler = IndexSampler(ITEM_COUNT, shuffle=False, world_size=2, rank=1)
+    with DataLoader(Squares(), LoaderOptions(batch_size=2), sampler=sampler) as loader:
+        assert len(loader) == 3
+        assert labels(loader) == [i * i for i in range(1, ITEM_COUNT, 2)]
+
+
+def test_iterable_dataset_skips_filtered():
+    with DataLoader(EvenSquares(), LoaderOptions(batch_size=3)) as loader:
+        batches = list(loader)
+        with pytest.raises(TypeError):
+            len(loader)
+
+    # batches of source items get smaller, the last one is filtered out entirely
+    assert [batch.tolist() for batch in batches] == [[0, 4], [16], [36, 64]]
+
+
+class Numbers(IterableDataset):
+    def source_iterable(self):
+        return range(ITEM_COUNT)
+
+
+def record_thread(item):
+    return item, threading.get_ident()
+
+
+def test_maps_before_stream_transforms_run_on_workers():
+    dataset = Numbers().map(record_thread).filter(lambda pair: pair[0] != 3).batch(4)
+    with DataLoader(dataset, LoaderOptions(max_workers=2)) as loader:
+        batches = list(loader)
+
+    # batches are collated after filtering, like when the dataset is iterated directly
+    items = [batch_items.tolist() for batch_items, _ in batches]
+    assert items == [batch_items.tolist() for batch_items, _ in dataset]
+    assert items == [[0, 1, 2, 4], [5, 6, 7, 8], [9]]
+    assert threading.get_ident() not in np.concatenate([threads for _, threads in batches])
@@ -0,0 +1,38 @@
+from mlstarterpack.data import WorkerPool
+from mlstarterpack.data import _workers
+from mlstarterpack.data._workers import registered_resolve_func
+
+
+class Offset:
+    def __init__(self, offset: int):
+        self.offset = offset
+
+    def process_source_item(self, item: int) -> int:
+        return item + self.offset
+
+
+def registered_tokens() -> list:
+    return sorted(_workers._DATASETS)  # pylint: disable=protected-access
+
+
+def test_registering_doesnt_restart_the_pool():
+    with WorkerPool(1) as pool:
+        first_token = pool.register_dataset(Offset(10))
+        assert pool.submit(registered_resolve_func(first_token), 1).result() == 11
+        executor = pool._executor  # pylint: disable=protected-access
+
+        second_token = pool.register_dataset(Offset(20))
+        assert pool.submit(registered_resolve_func(second_token), 1).result() == 21
+        assert pool._executor is executor  # pylint: disable=protected-access
+        assert pool.restart_count == 0
+
+
+def test_workers_forget_unregistered_datasets():
+    with WorkerPool(1) as pool:
+        first_token = pool.register_dataset(Offset(10))
+        pool.submit(registered_resolve_func(first_token), 1).result()
+        pool.unregister_dataset(first_token)
+
+        second_token = pool.register_dataset(Offset(20))
+        pool.submit(registered_resolve_func(second_token), 1).result()
+        assert pool.submit(registered_tokens).result() == [second_token]
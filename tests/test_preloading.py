@@ -0,0 +1,105 @@
+# pylint: disable=redefined-outer-name,protected-access
+from concurrent import futures
+import itertools
+import random
+import threading
+import time
+
+import pytest
+
+from mlstarterpack.data import PreloadingIterator, PreloadOrder
+from mlstarterpack.data.datasets import FILTERED
+from mlstarterpack.data.preloading import MAX_CHUNK_SIZE
+
+
+ITEM_COUNT = 40
+BUF_SIZE = 8
+WINDOW = 5
+
+
+def jittered(item: int) -> int:
+    # seeded by the item, so that slow items are the same in every run
+    time.sleep(random.Random(item).uniform(0, 0.002))
+    return item
+
+
+@pytest.fixture(scope='module')
+def executor():
+    with futures.ThreadPoolExecutor(4) as pool:
+        yield pool
+
+
+def preload(executor, order, chunk_size, buf_size=BUF_SIZE, resolve_func=jittered):
+    iterator = PreloadingIterator(
+        range(ITEM_COUNT), executor, buf_size, resolve_func,
+        order=order, reorder_window=WINDOW, chunk_size=chunk_size,
+    )
+    results = []
+    max_in_flight = iterator._in_flight_count
+    for result in iterator:
+        results.append(result)
+        max_in_flight = max(max_in_flight, iterator._in_flight_count)
+    return results, max_in_flight
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 5, 7, 16, None])
+@pytest.mark.parametrize('order', list(PreloadOrder))
+def test_order_and_capacity(executor, order, chunk_size):
+    results, max_in_flight = preload(executor, order, chunk_size)
+
+    assert sorted(results) == list(range(ITEM_COUNT))
+    assert max_in_flight <= BUF_SIZE
+    if order is PreloadOrder.ordered:
+        assert results == list(range(ITEM_COUNT))
+    elif order is PreloadOrder.windowed:
+        # every result is returned within the window of its position
+        assert [item // WINDOW for item in results] == [
+            position // WINDOW for position in range(ITEM_COUNT)
+        ]
+
+
+def test_adaptive_chunks_respect_buffer(executor):
+    iterator = PreloadingIterator(range(10_000), executor, BUF_SIZE, abs, chunk_size=None)
+    for _ in iterator:
+        assert iterator._in_flight_count <= BUF_SIZE
+    assert 1 <= iterator.chunk_size <= min(BUF_SIZE // 2, MAX_CHUNK_SIZE)
+
+
+def test_filtered_items_are_skipped(executor):
+    def keep_even(item):
+        return item if item % 2 == 0 else FILTERED
+
+    results, _ = preload(executor, PreloadOrder.ordered, 3, resolve_func=keep_even)
+    assert results == list(range(0, ITEM_COUNT, 2))
+
+
+def test_windowed_requires_window(executor):
+    with pytest.raises(ValueError):
+        PreloadingIterator(range(3), executor, 2, abs, order=PreloadOrder.windowed)
+
+
+def test_close_stops_iteration(executor):
+    iterator = PreloadingIterator(range(ITEM_COUNT), executor, BUF_SIZE, jittered)
+    assert next(iterator) == 0
+    iterator.close()
+    with pytest.raises(StopIteration):
+        next(iterator)
+
+
+def test_unordered_doesnt_wait_for_blocked_items(executor):
+    released = threading.Event()
+
+    def blocked_first(item):
+        if item == 0:
+            assert released.wait(5)
+        return item
+
+    iterator = PreloadingIterator(
+        range(ITEM_COUNT), executor, BUF_SIZE, blocked_first, order=PreloadOrder.unordered,
+    )
+    # the ordered mode would never return these while the first item is blocked
+    first_results = list(itertools.islice(iterator, ITEM_COUNT - 1))
+    released.set()
+
+    assert sorted(first_results) == list(range(1, ITEM_COUNT))
+    assert list(iterator) == [0]
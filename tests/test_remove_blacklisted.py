@@ -0,0 +1,69 @@
+import os
+from pathlib import Path
+import sys
+
+import pandas as pd
+
+from mlstarterpack.ecdata import remove_blacklisted
+from mlstarterpack.ecdata._tabular import load_dataframe, save_dataframe
+from mlstarterpack.ecdata.remove_blacklisted import filter_table
+
+
+BLACKLIST = pd.Index(['b', 'd'])
+
+
+def test_csv_rows_are_kept_unchanged(tmp_path):
+    path = tmp_path / 'class_train.csv'
+    path.write_text('a,007\nb,1.50\nc,\nd,x\ne,1.50\n')
+
+    assert filter_table(path, BLACKLIST, chunk_size=2) == 2
+    assert path.read_text() == 'a,007\nc,\ne,1.50\n'
+    assert not list(tmp_path.glob('.*'))
+
+
+def test_unaffected_table_isnt_rewritten(tmp_path):
+    path = tmp_path / 'class_train.csv'
+    path.write_text('a\nc\n')
+    os.utime(str(path), ns=(0, 0))
+
+    assert filter_table(path, BLACKLIST, chunk_size=2) == 0
+    assert path.stat().st_mtime_ns == 0
+
+
+def test_arrow_tables_are_filtered(tmp_path):
+    path = tmp_path / 'class_train.parquet'
+    save_dataframe(pd.DataFrame({0: ['a', 'b', 'c'], 1: [1, 2, 3]}), path)
+
+    assert filter_table(path, BLACKLIST, chunk_size=2) == 1
+    assert load_dataframe(path).values.tolist() == [['a', 1], ['c', 3]]
+
+
+def write_csv(path: Path, rows: list):
+    os.makedirs(str(path.parent), exist_ok=True)
+    pd.DataFrame(rows).to_csv(path, header=False, index=False)
+
+
+def test_data_root_filters_metadata_and_quarantines_objects(tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    for name in ['a.jpg', 'b.jpg']:
+        write_csv(root / 'source/images' / name, [])
+    write_csv(root / 'datasets/class_train.csv', [['source/images/a.jpg']])
+    write_csv(root / 'datasets/class_test.csv', [['source/images/b.jpg']])
+    write_csv(root / 'source/metadata/class.csv', [
+        ['source/images/a.jpg', 'cat'], ['source/images/b.jpg', 'dog'],
+    ])
+    blacklist_path = tmp_path / 'blacklist.csv'
+    write_csv(blacklist_path, [['source/images/b.jpg']])
+    os.utime(str(root / 'datasets/class_train.csv'), ns=(0, 0))
+
+    monkeypatch.setattr(sys, 'argv', [
+        'remove_blacklisted', str(root / 'datasets'), str(blacklist_path),
+        '--data-root', str(root), '--objects', 'quarantine',
+    ])
+    remove_blacklisted.main()
+
+    assert (root / 'datasets/class_test.csv').read_text() == ''
+    assert (root / 'datasets/class_train.csv').stat().st_mtime_ns == 0
+    assert list(load_dataframe(root / 'source/metadata/class.csv')[0]) == ['source/images/a.jpg']
+    assert not (root / 'source/images/b.jpg').exists()
+    assert (root / 'quarantine/source/images/b.jpg').exists()
@@ -0,0 +1,56 @@
+# pylint: disable=redefined-outer-name
+import os
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from mlstarterpack.ecdata import ECDataRoot
+
+
+def write_csv(path: Path, rows: list):
+    os.makedirs(str(path.parent), exist_ok=True)
+    pd.DataFrame(rows).to_csv(path, header=False, index=False)
+
+
+@pytest.fixture
+def root(tmp_path):
+    write_csv(tmp_path / 'datasets/class_train.csv', [['a'], ['b'], ['c']])
+    write_csv(tmp_path / 'datasets/class_test.csv', [['d']])
+    write_csv(tmp_path / 'source/metadata/class.csv', [['a', 'cat'], ['b', 'dog']])
+    write_csv(tmp_path / 'source/metadata/box.csv', [['a', 1, 2]])
+    return ECDataRoot(tmp_path)
+
+
+def test_names(root):
+    assert root.annotations() == ['box', 'class']
+    assert root.splits('class') == ['test', 'train']
+    assert list(root.annotation('box').columns) == ['key', 'box_1', 'box_2']
+
+    with pytest.raises(KeyError):
+        root.dataset('class', 'val')
+
+
+def test_tables_are_cached_until_the_file_changes(root):
+    first = root.annotation('class')
+    assert root.annotation('class') is first
+
+    path = root.path / 'source/metadata/class.csv'
+    stat = path.stat()
+    write_csv(path, [['a', 'cow'], ['b', 'dog']])
+    # same size, only the mtime tells the files apart
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert list(root.annotation('class')['class']) == ['cow', 'dog']
+
+    reloaded = root.annotation('class')
+    root.invalidate()
+    assert root.annotation('class') is not reloaded
+
+
+def test_join(root):
+    joined = root.join('class', 'train', ['class', 'box'])
+    assert list(joined.columns) == ['key', 'class', 'box_1', 'box_2']
+    assert list(joined['class'].fillna('-')) == ['cat', 'dog', '-']
+
+    inner = root.join('class', 'train', how='inner')
+    assert list(inner.key) == ['a', 'b']
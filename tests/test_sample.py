@@ -0,0 +1,105 @@
+import os
+from pathlib import Path
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from mlstarterpack.ecdata import sample
+from mlstarterpack.ecdata.sample import (
+    hash_downsample_chunks, hash_downsample_stratified, key_hashes,
+)
+
+
+KEYS = pd.Series([f'source/images/{i}.jpg' for i in range(1000)])
+
+
+def chunked(df: pd.DataFrame, chunk_size: int) -> list:
+    return [df.iloc[start:start + chunk_size] for start in range(0, len(df), chunk_size)]
+
+
+def test_key_hashes_are_stable_per_seed():
+    assert (key_hashes(KEYS, 0) == key_hashes(KEYS.copy(), 0)).all()
+    assert not (key_hashes(KEYS, 0) == key_hashes(KEYS, 1)).all()
+    assert key_hashes(KEYS, 0).dtype == np.uint64
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1000])
+def test_selection_doesnt_depend_on_chunking(chunk_size):
+    df = pd.DataFrame({0: KEYS})
+    expected_df = hash_downsample_chunks([df], 0.1, 10, seed=0)
+
+    result_df = hash_downsample_chunks(chunked(df, chunk_size), 0.1, 10, seed=0)
+
+    assert list(result_df[0]) == list(expected_df[0])
+    assert 50 < len(result_df) < 150
+
+
+def test_selection_is_consistent_between_datasets():
+    train_df = pd.DataFrame({0: KEYS[:600]})
+    test_df = pd.DataFrame({0: KEYS[400:]})
+
+    train_keys = set(hash_downsample_chunks([train_df], 0.2, 1, seed=3)[0])
+    test_keys = set(hash_downsample_chunks([test_df], 0.2, 1, seed=3)[0])
+
+    shared_keys = set(KEYS[400:600])
+    assert train_keys & shared_keys == test_keys & shared_keys
+
+
+def test_min_count_keeps_the_smallest_hashes():
+    df = pd.DataFrame({0: KEYS[:20]})
+
+    result_df = hash_downsample_chunks(chunked(df, 3), 0.0, 5, seed=0)
+
+    smallest = KEYS[:20][np.argsort(key_hashes(KEYS[:20], 0))[:5]]
+    assert sorted(result_df[0]) == sorted(smallest)
+    assert result_df.index.is_monotonic_increasing
+
+
+def test_stratified_keeps_the_fraction_of_each_stratum():
+    df = pd.DataFrame({0: KEYS})
+    strata = pd.Series(['rare'] * 50 + ['common'] * 950)
+
+    result_df = hash_downsample_stratified(df, strata, 0.1, 1, seed=0)
+
+    kept_strata = strata[result_df.index]
+    assert (kept_strata == 'rare').sum() == 5
+    assert (kept_strata == 'common').sum() == 95
+
+
+def run_sample(monkeypatch, input_dir: Path, output_dir: Path, *args: str):
+    monkeypatch.setattr(sys, 'argv', [
+        'sample', '--fraction', '0.3', '--min-per-dataset', '1',
+        '--input-data-root', str(input_dir), '--output-data-root', str(output_dir), *args,
+    ])
+    sample.main()
+
+
+def test_sampling_is_reproducible(tmp_path, monkeypatch):
+    input_dir = tmp_path / 'input'
+    os.makedirs(str(input_dir / 'datasets'))
+    os.makedirs(str(input_dir / 'source/metadata'))
+    pd.DataFrame({0: KEYS[:100]}).to_csv(
+        input_dir / 'datasets/class_train.csv', header=False, index=False,
+    )
+    # a key repeated by repeated imports
+    pd.DataFrame({0: list(KEYS[:100]) + [KEYS[0]], 1: ['a', 'b'] * 50 + ['a']}).to_csv(
+        input_dir / 'source/metadata/class.csv', header=False, index=False,
+    )
+
+    run_sample(monkeypatch, input_dir, tmp_path / 'first', '--stratify-by', 'class')
+    run_sample(monkeypatch, input_dir, tmp_path / 'second', '--stratify-by', 'class')
+
+    first = (tmp_path / 'first/datasets/class_train.csv').read_text()
+    assert first == (tmp_path / 'second/datasets/class_train.csv').read_text()
+    assert len(first.splitlines()) == 30
+
+
+def test_missing_strata_annotation_fails_before_writing(tmp_path, monkeypatch):
+    input_dir = tmp_path / 'input'
+    os.makedirs(str(input_dir / 'datasets'))
+
+    with pytest.raises(ValueError):
+        run_sample(monkeypatch, input_dir, tmp_path / 'output', '--stratify-by', 'class')
+    assert not (tmp_path / 'output').exists()
@@ -0,0 +1,62 @@
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from mlstarterpack.data import IndexSampler
+from mlstarterpack.data.samplers import IndexPermutation
+
+
+def epoch(size: int, world_size: int, **kwargs) -> list:
+    return [list(IndexSampler(size, rank=rank, world_size=world_size, **kwargs))
+            for rank in range(world_size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 1000])
+def test_permutation_is_bijective(size):
+    permutation = IndexPermutation(size, np.random.default_rng(size))
+    assert sorted(permutation(np.arange(size)).tolist()) == list(range(size))
+
+
+@pytest.mark.parametrize('block_size', [None, 4])
+@pytest.mark.parametrize('size,world_size', [(1, 4), (3, 8), (10, 3), (12, 4), (100, 7)])
+def test_ranks_cover_the_epoch(size, world_size, block_size):
+    shards = epoch(size, world_size, block_size=block_size)
+    sampler = IndexSampler(size, world_size=world_size)
+
+    assert [len(shard) for shard in shards] == [len(sampler)] * world_size
+    counts = Counter(index for shard in shards for index in shard)
+    assert set(counts) == set(range(size))
+    # padding repeats every index at most once more than the others
+    assert max(counts.values()) - min(counts.values()) <= 1
+
+
+@pytest.mark.parametrize('block_size', [None, 4])
+def test_drop_last_gives_disjoint_ranks(block_size):
+    shards = epoch(10, 3, block_size=block_size, drop_last=True)
+    indices = [index for shard in shards for index in shard]
+
+    assert [len(shard) for shard in shards] == [3, 3, 3]
+    assert len(set(indices)) == 9
+
+
+def test_epochs_are_seeded():
+    sampler = IndexSampler(100)
+    first = list(sampler)
+    assert list(sampler) == first
+    assert list(IndexSampler(100, seed=1)) != first
+
+    sampler.set_epoch(1)
+    assert list(sampler) != first
+    assert sorted(sampler) == list(range(100))
+
+
+def test_without_shuffle_indices_are_dealt_in_order():
+    assert epoch(5, 2, shuffle=False) == [[0, 2, 4], [1, 3, 0]]
+
+
+def test_blocks_stay_contiguous():
+    order = list(IndexSampler(20, block_size=5))
+    blocks = [sorted(order[start:start + 5]) for start in range(0, 20, 5)]
+
+    assert sorted(blocks) == [list(range(start, start + 5)) for start in range(0, 20, 5)]
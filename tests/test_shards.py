@@ -0,0 +1,92 @@
+import os
+from pathlib import Path
+import sys
+
+import pandas as pd
+import pytest
+
+from mlstarterpack.data import ShardedDataset, ShardWriter
+from mlstarterpack.ecdata import pack_shards
+
+
+RECORDS = [(f'key{i}', bytes([i]) * (i % 4) * 10, {'label': i % 3}) for i in range(20)]
+
+
+def write_shards(path: Path, shard_size: int = 50) -> Path:
+    with ShardWriter(path, shard_size=shard_size) as writer:
+        for key, data, metadata in RECORDS:
+            writer.add(key, data, metadata)
+    return path
+
+
+def test_records_round_trip(tmp_path):
+    dataset = ShardedDataset(write_shards(tmp_path / 'shards'))
+
+    assert dataset.shard_count > 1
+    assert len(list((tmp_path / 'shards').glob('shard-*.bin'))) == dataset.shard_count
+    for i, (key, data, metadata) in enumerate(RECORDS):
+        record = dataset.process_source_item(i)
+        assert (record.key, record.data, record.metadata) == (key, data, metadata)
+
+
+def test_ranks_read_disjoint_shards(tmp_path):
+    path = write_shards(tmp_path / 'shards')
+    ranks = [ShardedDataset(path, shuffle_shards=True, seed=0, rank=rank, world_size=2)
+             for rank in range(2)]
+
+    indices = [list(dataset.source_iterable()) for dataset in ranks]
+    assert not set(indices[0]) & set(indices[1])
+    assert sorted(indices[0] + indices[1]) == list(range(len(RECORDS)))
+    assert [len(dataset.sampler()) for dataset in ranks] == [len(part) for part in indices]
+
+    with pytest.raises(ValueError):
+        ShardedDataset(path, rank=2, world_size=2)
+
+
+def test_failed_writer_leaves_nothing(tmp_path):
+    with pytest.raises(RuntimeError):
+        with ShardWriter(tmp_path / 'shards', shard_size=50) as writer:
+            writer.add('key', b'data')
+            raise RuntimeError('failed')
+
+    assert not list(tmp_path.iterdir())
+
+
+def test_writer_refuses_existing_directory(tmp_path):
+    write_shards(tmp_path / 'shards')
+    with pytest.raises(FileExistsError):
+        ShardWriter(tmp_path / 'shards')
+
+
+def write_csv(path: Path, rows: list):
+    os.makedirs(str(path.parent), exist_ok=True)
+    pd.DataFrame(rows).to_csv(path, header=False, index=False)
+
+
+def test_pack_shards(tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    for key in ['a.jpg', 'b.jpg']:
+        os.makedirs(str(root / 'source/images'), exist_ok=True)
+        (root / 'source/images' / key).write_bytes(key.encode())
+    write_csv(root / 'datasets/class_train.csv', [
+        ['source/images/a.jpg'], ['source/images/b.jpg'], ['source/images/missing.jpg'],
+    ])
+    # a key repeated by repeated imports
+    write_csv(root / 'source/metadata/class.csv', [
+        ['source/images/a.jpg', 'cat'], ['source/images/b.jpg', 'dog'],
+        ['source/images/a.jpg', 'cow'],
+    ])
+
+    monkeypatch.setattr(sys, 'argv', [
+        'pack_shards', '--data-root', str(root), '--annotations', 'class',
+        '--output-dir', str(tmp_path / 'shards'),
+    ])
+    pack_shards.main()
+
+    dataset = ShardedDataset(tmp_path / 'shards')
+    records = [dataset.process_source_item(i) for i in dataset.source_sequence]
+    assert [(record.key, record.data, record.metadata['class']) for record in records] == [
+        ('source/images/a.jpg', b'a.jpg', 'cat'),
+        ('source/images/b.jpg', b'b.jpg', 'dog'),
+    ]
+    assert sorted(os.listdir(str(tmp_path))) == ['root', 'shards']
@@ -0,0 +1,79 @@
+# pylint: disable=redefined-outer-name,protected-access
+from concurrent import futures
+import gc
+import multiprocessing
+
+import numpy as np
+import pytest
+
+from mlstarterpack.data import shared_memory
+from mlstarterpack.data.shared_memory import SharedMemoryTransport
+
+
+pytestmark = pytest.mark.skipif(
+    not shared_memory.SHARED_MEMORY_AVAILABLE, reason='shared memory requires python 3.8',
+)
+
+SLOT_SIZE = 4096
+
+
+def make_item(item: int) -> dict:
+    return {'image': np.full((4, 4), item, dtype=np.uint8), 'label': item}
+
+
+def attached_transports() -> int:
+    return len(shared_memory._ATTACHED_BLOCKS)
+
+
+@pytest.fixture(scope='module')
+def executor():
+    context = multiprocessing.get_context('fork')
+    with futures.ProcessPoolExecutor(1, mp_context=context) as pool:
+        yield pool
+
+
+def resolve(transport, executor, items):
+    results, _ = transport.unpack(transport.submit(executor, make_item, items))
+    return results
+
+
+def test_results_are_views_of_slots(executor):
+    with SharedMemoryTransport(4, SLOT_SIZE) as transport:
+        results = resolve(transport, executor, [1, 2])
+
+        assert [result['label'] for result in results] == [1, 2]
+        for item in [1, 2]:
+            np.testing.assert_array_equal(results[item - 1]['image'], np.full((4, 4), item))
+            assert not results[item - 1]['image'].flags.owndata
+        assert len(transport._free_slots) == 2
+
+        del results
+        gc.collect()
+        assert len(transport._free_slots) == 4
+
+
+def test_items_without_free_slots_are_pickled(executor):
+    with SharedMemoryTransport(1, SLOT_SIZE) as transport:
+        results = resolve(transport, executor, [1, 2])
+
+        assert not results[0]['image'].flags.owndata
+        assert results[1]['image'].flags.owndata
+        np.testing.assert_array_equal(results[1]['image'], np.full((4, 4), 2))
+
+
+def test_oversized_items_are_pickled(executor):
+    with SharedMemoryTransport(2, 8) as transport:
+        results = resolve(transport, executor, [3])
+
+        assert results[0]['image'].flags.owndata
+        assert len(transport._free_slots) == 2
+
+
+def test_workers_detach_closed_transports(executor):
+    for item in range(3):
+        with SharedMemoryTransport(2, SLOT_SIZE) as transport:
+            result = resolve(transport, executor, [item])[0]
+            assert result['label'] == item
+            del result
+
+    assert executor.submit(attached_transports).result() == 1
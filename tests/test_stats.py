@@ -0,0 +1,85 @@
+from concurrent import futures
+import json
+import time
+
+import pytest
+
+from mlstarterpack.data import LatencyHistogram, PipelineStats, PreloadingIterator
+
+
+def slow_square(item: int) -> int:
+    time.sleep(0.001)
+    return item ** 2
+
+
+def test_histogram_quantiles():
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.5) == 0.0
+
+    for _ in range(90):
+        histogram.add(10e-6)
+    for _ in range(10):
+        histogram.add(0.1)
+
+    # quantiles are bucket interpolations, exact to a factor of two
+    assert 5e-6 <= histogram.quantile(0.5) <= 20e-6
+    assert 0.05 <= histogram.quantile(0.99) <= 0.1
+    assert histogram.quantile(1.0) == pytest.approx(0.1)
+
+    data = histogram.to_dict()
+    assert data['count'] == 100
+    assert data['mean'] == pytest.approx((90 * 10e-6 + 10 * 0.1) / 100)
+    assert sum(data['buckets'].values()) == 100
+
+
+def test_histogram_clamps_huge_latencies():
+    histogram = LatencyHistogram()
+    histogram.add(1e9)
+    assert histogram.counts[-1] == 1
+    assert histogram.quantile(0.5) <= 1e9
+
+
+def test_records():
+    stats = PipelineStats('test')
+    stats.record_source(0.5, 4)
+    stats.record_processed([0.01, 0.02])
+    stats.record_wait(0.1, in_flight=2, capacity=8)
+    stats.record_wait(0.1, in_flight=8, capacity=8)
+    stats.record_delivered(4)
+
+    snapshot = stats.snapshot()
+    assert snapshot['items'] == 4
+    assert snapshot['source'] == {'seconds': 0.5, 'items': 4}
+    assert snapshot['process']['count'] == 2
+    assert snapshot['wait']['count'] == 2
+    assert snapshot['occupancy'] == {'mean': 0.625, 'max': 1.0}
+    assert json.loads(stats.to_json())['name'] == 'test'
+    assert stats.summary().startswith('test: 4 items')
+
+    stats.reset()
+    assert stats.snapshot()['items'] == 0
+    assert stats.snapshot()['elapsed'] == 0.0
+
+
+def test_log_interval(capsys):
+    stats = PipelineStats('logged', log_interval=0.0)
+    stats.record_delivered(1)
+    assert capsys.readouterr().out.startswith('logged: 1 items')
+
+    stats = PipelineStats('quiet', log_interval=3600.0)
+    stats.record_delivered(1)
+    assert capsys.readouterr().out == ''
+
+
+def test_preloading_iterator_collects_stats():
+    stats = PipelineStats()
+    with futures.ThreadPoolExecutor(2) as executor:
+        results = list(PreloadingIterator(range(20), executor, 4, slow_square, stats=stats))
+
+    assert results == [item ** 2 for item in range(20)]
+    snapshot = stats.snapshot()
+    assert snapshot['items'] == 20
+    assert snapshot['source']['items'] == 20
+    assert snapshot['process']['count'] == 20
+    assert snapshot['process']['p50'] >= 0.0005
+    assert 0.0 < snapshot['occupancy']['max'] <= 1.0
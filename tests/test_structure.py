@@ -0,0 +1,66 @@
+from typing import *
+
+import numpy as np
+import pytest
+
+from mlstarterpack.data._structure import allocate_batch, collate, unbatch
+from mlstarterpack.data.transforms import map_batches_stream
+
+
+class Sample(NamedTuple):
+    image: np.ndarray
+    label: np.int64
+
+
+def assert_items_equal(actual: Any, expected: Any):
+    assert type(actual) is type(expected)
+    if isinstance(expected, (tuple, list)):
+        assert len(actual) == len(expected)
+        for actual_element, expected_element in zip(actual, expected):
+            assert_items_equal(actual_element, expected_element)
+    elif isinstance(expected, dict):
+        assert list(actual) == list(expected)
+        for key, element in expected.items():
+            assert_items_equal(actual[key], element)
+    elif isinstance(expected, np.ndarray):
+        np.testing.assert_array_equal(actual, expected)
+    else:
+        assert actual == expected
+
+
+def image(i: int) -> np.ndarray:
+    return np.full((2, 3), i, dtype=np.uint8)
+
+
+ITEMS = {
+    'tuple': [(image(i), f'key{i}') for i in range(3)],
+    'namedtuple': [Sample(image(i), np.int64(i)) for i in range(3)],
+    'list': [[image(i), np.float32(i), f'key{i}'] for i in range(3)],
+    'dict': [{'image': image(i), 'nested': [np.int64(i), (np.int64(-i),)]} for i in range(3)],
+}
+
+
+@pytest.mark.parametrize('kind', list(ITEMS))
+def test_unbatch_inverts_collate(kind):
+    items = ITEMS[kind]
+    assert_items_equal(unbatch(collate(items)), items)
+
+
+@pytest.mark.parametrize('kind', ['namedtuple', 'dict'])
+def test_collate_into_allocated_batch(kind):
+    items = ITEMS[kind]
+    out = allocate_batch(items[0], 4)
+
+    assert_items_equal(unbatch(collate(items, out)), items)
+
+
+def test_map_batches_of_list_items():
+    items = [[np.int64(i), np.int64(i + 1)] for i in range(5)]
+
+    def add(batch_value):
+        first, second = batch_value
+        return [first + second, second]
+
+    mapped = list(map_batches_stream(items, 0, add, 2))
+
+    assert_items_equal(mapped, [[np.int64(2 * i + 1), np.int64(i + 1)] for i in range(5)])
@@ -0,0 +1,111 @@
+import os
+from pathlib import Path
+import sys
+
+import pandas as pd
+import pytest
+
+from mlstarterpack.ecdata import convert_tables
+from mlstarterpack.ecdata._tabular import (
+    append_table, find_existing_table, load_dataframe, save_dataframe,
+)
+from mlstarterpack.ecdata.root import ECDataRoot
+
+
+def write_csv(path: Path, rows: list) -> Path:
+    pd.DataFrame(rows).to_csv(path, header=False, index=False)
+    return path
+
+
+def test_append_csv_writes_to_the_end(tmp_path):
+    target_path = tmp_path / 'target.csv'
+    # a missing trailing newline must not merge the last row with the first appended one
+    target_path.write_text('a,1\nb,2')
+    inode = target_path.stat().st_ino
+    source_path = write_csv(tmp_path / 'source.csv', [['c', 3], ['d', 4]])
+
+    append_table(source_path, target_path)
+
+    assert target_path.read_text() == 'a,1\nb,2\nc,3\nd,4\n'
+    assert target_path.stat().st_ino == inode
+
+
+def test_append_remaps_keys(tmp_path):
+    target_path = write_csv(tmp_path / 'target.csv', [['a', 1]])
+    source_path = write_csv(tmp_path / 'source.csv', [['old', 2], ['other', 3]])
+
+    append_table(source_path, target_path, key_map={'old': 'new'})
+
+    assert load_dataframe(target_path).values.tolist() == [['a', 1], ['new', 2], ['other', 3]]
+
+
+def test_append_with_other_columns_rewrites(tmp_path):
+    target_path = write_csv(tmp_path / 'target.csv', [['a', 1]])
+    source_path = write_csv(tmp_path / 'source.csv', [['b', 2, 'x']])
+
+    append_table(source_path, target_path)
+
+    result_df = load_dataframe(target_path)
+    assert result_df.shape == (2, 3)
+    assert list(result_df[0]) == ['a', 'b']
+    assert not list(tmp_path.glob('.*.tmp*'))
+
+
+def test_append_creates_missing_target(tmp_path):
+    target_path = tmp_path / 'target.csv'
+    source_path = write_csv(tmp_path / 'source.csv', [['a', 1]])
+
+    append_table(source_path, target_path)
+
+    assert os.path.exists(target_path)
+    assert load_dataframe(target_path).values.tolist() == [['a', 1]]
+
+
+@pytest.mark.parametrize('extension', ['.parquet', '.feather', '.arrow'])
+def test_arrow_formats_round_trip(tmp_path, extension):
+    df = pd.DataFrame({0: ['a', 'b'], 1: [1, 2], 2: ['x', 3]})
+    path = tmp_path / f'table{extension}'
+
+    save_dataframe(df, path)
+    result_df = load_dataframe(path)
+
+    assert list(result_df.columns) == [0, 1, 2]
+    # columns of mixed types are stored as strings
+    assert result_df.values.tolist() == [['a', 1, 'x'], ['b', 2, '3']]
+    assert load_dataframe(path, columns=[1]).values.tolist() == [[1], [2]]
+
+
+def test_existing_table_is_the_preferred_format(tmp_path):
+    path = tmp_path / 'class.csv'
+    assert find_existing_table(path) == path
+
+    write_csv(path, [['a', 1]])
+    assert find_existing_table(path) == path
+
+    save_dataframe(pd.DataFrame({0: ['a'], 1: [1]}), tmp_path / 'class.feather')
+    assert find_existing_table(path) == tmp_path / 'class.feather'
+
+    save_dataframe(pd.DataFrame({0: ['a'], 1: [1]}), tmp_path / 'class.parquet')
+    assert find_existing_table(path) == tmp_path / 'class.parquet'
+    assert find_existing_table(tmp_path / 'class.feather') == tmp_path / 'class.parquet'
+
+
+@pytest.mark.parametrize('keep_originals', [False, True])
+def test_convert_tables(tmp_path, monkeypatch, keep_originals):
+    root = tmp_path / 'root'
+    os.makedirs(str(root / 'datasets'))
+    os.makedirs(str(root / 'source/metadata'))
+    write_csv(root / 'datasets/class_train.csv', [['source/images/a.jpg']])
+    write_csv(root / 'source/metadata/class.csv', [['source/images/a.jpg', 'cat']])
+
+    argv = ['convert_tables', '--data-root', str(root), '--format', 'parquet']
+    if keep_originals:
+        argv.append('--keep-originals')
+    monkeypatch.setattr(sys, 'argv', argv)
+    convert_tables.main()
+
+    assert (root / 'datasets/class_train.csv').exists() == keep_originals
+    data_root = ECDataRoot(root)
+    assert data_root.metadata_paths()['class'] == root / 'source/metadata/class.parquet'
+    assert data_root.annotation('class').values.tolist() == [['source/images/a.jpg', 'cat']]
+    assert list(data_root.dataset('class', 'train').key) == ['source/images/a.jpg']
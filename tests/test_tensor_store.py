@@ -0,0 +1,54 @@
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+import pytest
+
+from mlstarterpack.vision.image_layout import ImageLayout
+from mlstarterpack.vision.images import extract_square
+from mlstarterpack.vision.tensor_store import TensorStoreDataset, write_store
+
+
+SQUARE_SIZE = 16
+
+
+def make_sources(path: Path) -> Path:
+    path.mkdir()
+    for name in ['a.jpg', 'c.png', 'd.jpg']:
+        Image.effect_noise((40, 30), 50).convert('RGB').save(path / name)
+    # sorted between the others, it leaves a gap in the store rows
+    (path / 'b.jpg').write_bytes(b'not an image')
+    return path
+
+
+def expected_square(path: Path, layout: ImageLayout) -> np.ndarray:
+    with Image.open(path) as image:
+        return extract_square(image, SQUARE_SIZE, layout)
+
+
+@pytest.mark.parametrize('layout', list(ImageLayout))
+def test_store_round_trip(tmp_path, layout):
+    sourcedir = make_sources(tmp_path / 'source')
+    write_store(sourcedir, tmp_path / 'store', SQUARE_SIZE, layout=layout)
+
+    dataset = TensorStoreDataset(tmp_path / 'store')
+    assert dataset.layout is layout
+    assert list(dataset.keys) == ['a.jpg', 'c.png', 'd.jpg']
+    assert dataset.row('c.png') == 2
+    for i, key in enumerate(dataset.keys):
+        np.testing.assert_array_equal(dataset[i], expected_square(sourcedir / key, layout))
+
+    with pytest.raises(RuntimeError):
+        write_store(sourcedir, tmp_path / 'store', SQUARE_SIZE)
+
+
+def test_rows_are_indexed_by_item(tmp_path):
+    write_store(make_sources(tmp_path / 'source'), tmp_path / 'store', SQUARE_SIZE)
+    dataset = TensorStoreDataset(tmp_path / 'store')
+
+    np.testing.assert_array_equal(dataset.rows(0, 3), np.stack([dataset[i] for i in range(3)]))
+
+    consecutive = dataset.rows(1, 3)
+    np.testing.assert_array_equal(consecutive, np.stack([dataset[1], dataset[2]]))
+    assert np.shares_memory(consecutive, dataset.array)
+    assert dataset.rows(3, 4).shape == (0, SQUARE_SIZE, SQUARE_SIZE, 3)
@@ -0,0 +1,92 @@
+import errno
+import os
+from pathlib import Path
+
+import pytest
+
+from mlstarterpack.ecdata import transfer
+from mlstarterpack.ecdata.transfer import FileTransferer, TransferMode
+
+
+def make_sources(path: Path, count: int = 5) -> list:
+    os.makedirs(str(path))
+    sources = []
+    for i in range(count):
+        source_path = path / f'{i}.jpg'
+        source_path.write_bytes(bytes([i]) * (i + 1))
+        sources.append(source_path)
+    return sources
+
+
+def transfer_all(tmp_path: Path, mode: TransferMode):
+    sources = make_sources(tmp_path / 'source')
+    jobs = [(path, tmp_path / 'target/nested' / path.name) for path in sources]
+    stats = FileTransferer(mode, max_workers=2).transfer(jobs)
+    return jobs, stats
+
+
+@pytest.mark.parametrize('mode', list(TransferMode))
+def test_transfer_places_every_file(tmp_path, mode):
+    jobs, stats = transfer_all(tmp_path, mode)
+
+    for source_path, target_path in jobs:
+        assert target_path.read_bytes() == source_path.read_bytes()
+    assert stats.files == len(jobs)
+    assert stats.bytes == sum(source_path.stat().st_size for source_path, _ in jobs)
+
+
+def test_hardlink_shares_the_inode(tmp_path):
+    jobs, stats = transfer_all(tmp_path, TransferMode.hardlink)
+
+    assert stats.fallbacks == 0
+    for source_path, target_path in jobs:
+        assert os.path.samefile(str(source_path), str(target_path))
+
+
+def test_symlink_points_to_absolute_source(tmp_path):
+    jobs, _ = transfer_all(tmp_path, TransferMode.symlink)
+
+    for source_path, target_path in jobs:
+        assert target_path.is_symlink()
+        assert os.readlink(str(target_path)) == os.path.abspath(str(source_path))
+
+
+def test_link_falls_back_to_copy(tmp_path, monkeypatch):
+    def cross_device(*_args):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+    monkeypatch.setattr(transfer.os, 'link', cross_device)
+
+    jobs, stats = transfer_all(tmp_path, TransferMode.hardlink)
+
+    assert stats.fallbacks == len(jobs)
+    for source_path, target_path in jobs:
+        assert not os.path.samefile(str(source_path), str(target_path))
+        assert target_path.read_bytes() == source_path.read_bytes()
+
+
+def test_other_link_errors_are_raised(tmp_path, monkeypatch):
+    def no_space(*_args):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+    monkeypatch.setattr(transfer.os, 'link', no_space)
+
+    with pytest.raises(OSError):
+        transfer_all(tmp_path, TransferMode.hardlink)
+
+
+def test_claim_skips_duplicates(tmp_path):
+    sources = make_sources(tmp_path / 'source', 2)
+    duplicate_path = tmp_path / 'source/duplicate.jpg'
+    duplicate_path.write_bytes(sources[1].read_bytes())
+    claimed = {}
+
+    def claim(digest, target_path):
+        return claimed.setdefault(digest, target_path) == target_path
+
+    transferer = FileTransferer(TransferMode.copy, max_workers=1)
+    stats = transferer.transfer(
+        [(path, tmp_path / 'target' / path.name) for path in sources + [duplicate_path]],
+        claim,
+    )
+
+    assert stats.duplicates == 1
+    assert sorted(path.name for path in (tmp_path / 'target').iterdir()) == ['0.jpg', '1.jpg']
@@ -0,0 +1,87 @@
+# pylint: disable=redefined-outer-name
+import json
+import os
+from pathlib import Path
+import sys
+
+from PIL import Image
+import pytest
+
+from mlstarterpack.ecdata import check
+from mlstarterpack.ecdata.verify import verify_objects, VerifyLevel
+
+
+@pytest.fixture(scope='module')
+def jpeg_bytes(tmp_path_factory):
+    path = tmp_path_factory.mktemp('images') / 'image.jpg'
+    Image.effect_noise((64, 64), 50).convert('RGB').save(path)
+    return path.read_bytes()
+
+
+def make_images(root: Path, jpeg_bytes: bytes):
+    os.makedirs(str(root / 'source/images'))
+    (root / 'source/images/good.jpg').write_bytes(jpeg_bytes)
+    # the header is intact, only decoding finds the problem
+    (root / 'source/images/truncated.jpg').write_bytes(jpeg_bytes[:len(jpeg_bytes) // 2])
+    (root / 'source/images/garbage.jpg').write_bytes(b'not an image')
+    return ['source/images/good.jpg', 'source/images/truncated.jpg',
+            'source/images/garbage.jpg', 'source/images/missing.jpg']
+
+
+def failed_keys(report) -> list:
+    return sorted(os.path.basename(failure.key) for failure in report.failures)
+
+
+def test_levels(tmp_path, jpeg_bytes):
+    keys = make_images(tmp_path, jpeg_bytes)
+
+    header_report = verify_objects(tmp_path, keys, VerifyLevel.header, max_workers=2)
+    assert failed_keys(header_report) == ['garbage.jpg', 'missing.jpg']
+    assert header_report.files == 4
+
+    # results of a lower level don't count for a higher one
+    decode_report = verify_objects(tmp_path, keys, VerifyLevel.decode, max_workers=2)
+    assert decode_report.cached == 0
+    assert failed_keys(decode_report) == ['garbage.jpg', 'missing.jpg', 'truncated.jpg']
+
+
+def test_results_are_cached_until_the_file_changes(tmp_path, jpeg_bytes):
+    keys = make_images(tmp_path, jpeg_bytes)
+    verify_objects(tmp_path, keys, VerifyLevel.decode, max_workers=2)
+
+    report = verify_objects(tmp_path, keys, VerifyLevel.header, max_workers=2)
+    assert report.cached == 3
+    assert failed_keys(report) == ['garbage.jpg', 'missing.jpg', 'truncated.jpg']
+
+    (tmp_path / 'source/images/truncated.jpg').write_bytes(jpeg_bytes)
+    report = verify_objects(tmp_path, keys, VerifyLevel.decode, max_workers=2)
+    assert report.cached == 2
+    assert report.verified == 2
+    assert failed_keys(report) == ['garbage.jpg', 'missing.jpg']
+
+
+def run_check(monkeypatch, *args: str):
+    monkeypatch.setattr(sys, 'argv', ['check', *args])
+    check.main()
+
+
+def test_check_writes_a_report(tmp_path, monkeypatch, jpeg_bytes):
+    keys = make_images(tmp_path, jpeg_bytes)
+    os.makedirs(str(tmp_path / 'datasets'))
+    (tmp_path / 'datasets/class_train.csv').write_text('\n'.join(keys[:3]) + '\n')
+    report_path = tmp_path / 'report.json'
+
+    run_check(
+        monkeypatch, '--data-root', str(tmp_path), '--verify', 'decode',
+        '--verify-report', str(report_path),
+    )
+
+    report = json.loads(report_path.read_text())
+    assert report['level'] == 'decode'
+    assert len(report['failures']) == 2
+
+
+def test_unknown_verify_level_is_a_usage_error(monkeypatch, capsys):
+    with pytest.raises(SystemExit):
+        run_check(monkeypatch, '--verify', 'bogus')
+    assert 'invalid choice' in capsys.readouterr().err
@@ -0,0 +1,48 @@
+import pytest
+
+from mlstarterpack.data import WorkerPool
+from mlstarterpack.data._workers import (
+    new_dataset_token, registered_getitem_func, registered_resolve_func,
+)
+
+
+# number of datasets unpickled by the current process
+UNPICKLED_COUNT = [0]
+
+
+class Squares:
+    def __init__(self):
+        self.power = 2
+
+    def __setstate__(self, state):
+        UNPICKLED_COUNT[0] += 1
+        self.__dict__.update(state)
+
+    def __getitem__(self, index: int) -> int:
+        return index ** self.power
+
+    def process_source_item(self, item: int) -> int:
+        return item ** self.power
+
+
+def unpickled_count() -> int:
+    return UNPICKLED_COUNT[0]
+
+
+def test_datasets_are_unpickled_once_per_worker():
+    with WorkerPool(1) as pool:
+        token = pool.register_dataset(Squares())
+        resolve = registered_resolve_func(token)
+        getitem = registered_getitem_func(token)
+
+        assert [pool.submit(resolve, i).result() for i in range(10)] == [
+            i ** 2 for i in range(10)
+        ]
+        assert pool.submit(getitem, 3).result() == 9
+        assert pool.submit(unpickled_count).result() == 1
+
+
+def test_unknown_datasets_fail():
+    with WorkerPool(1) as pool:
+        with pytest.raises(RuntimeError):
+            pool.submit(registered_resolve_func(new_dataset_token()), 1).result()